@@ -1,6 +1,7 @@
+import asyncio
 import httpx
 import os
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
 from .utils.auth_utils import AuthClient
 from .utils.file_utils import FileUtils
 
@@ -38,7 +39,7 @@ class GridDFSClient:
             filename = os.path.basename(local_file_path)
 
             # Solicitar upload al NameNode
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
                 return False
@@ -67,7 +68,10 @@ class GridDFSClient:
 
                 # Dividir archivo en bloques
                 print("Dividiendo archivo en bloques...")
-                blocks = await FileUtils.split_file_into_blocks_async(local_file_path)
+                # Usar el tamaño de bloque del NameNode para que coincida con la distribución
+                blocks = await FileUtils.split_file_into_blocks_async(
+                    local_file_path, upload_info.get("block_size")
+                )
                 print(f"Archivo dividido en {len(blocks)} bloques")
 
                 # Subir bloques a DataNodes
@@ -93,7 +97,7 @@ class GridDFSClient:
                             "datanode_url": datanode_url,
                             "checksum": checksum
                         },
-                        headers=auth_headers
+                        headers=await self.auth_client.get_auth_headers()
                     )
 
                     if response.status_code != 200:
@@ -110,31 +114,17 @@ class GridDFSClient:
     async def get_file(self, remote_file_path: str, local_file_path: str) -> bool:
         """Descarga un archivo del sistema GridDFS"""
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
                 return False
 
             # Buscar el archivo en el NameNode
             async with httpx.AsyncClient() as client:
-                # Primero listar archivos para encontrar el ID
-                response = await client.get(
-                    f"{self.namenode_url}/files/list",
-                    headers=auth_headers
+                # Resolver la ruta del archivo para obtener su ID
+                file_id = await self._resolve_file_id(
+                    client, remote_file_path, auth_headers
                 )
-
-                if response.status_code != 200:
-                    print(f"Error listando archivos: {response.text}")
-                    return False
-
-                files = response.json()
-                file_id = None
-                
-                for file in files:
-                    if file["filepath"] == remote_file_path:
-                        file_id = file["id"]
-                        break
-
                 if file_id is None:
                     print(f"Error: Archivo {remote_file_path} no encontrado")
                     return False
@@ -172,51 +162,66 @@ class GridDFSClient:
 
     async def list_files(self, directory: str = "/") -> List[Dict]:
         """Lista archivos en un directorio"""
+        entries = []
+        async for page in self.iter_directory(directory):
+            entries.extend(page)
+        return entries
+
+    async def iter_directory(
+        self, directory: str = "/", page_size: int = 1000
+    ) -> AsyncIterator[List[Dict]]:
+        """Recorre un directorio página por página (paginación por cursor)"""
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
-                return []
+                return
 
             async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.namenode_url}/files/list",
-                    params={"directory": directory},
-                    headers=auth_headers
-                )
+                cursor = None
+                while True:
+                    params = {"directory": directory, "limit": page_size}
+                    if cursor:
+                        params["cursor"] = cursor
+
+                    response = await client.get(
+                        f"{self.namenode_url}/files/list",
+                        params=params,
+                        headers=await self.auth_client.get_auth_headers()
+                    )
 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    print(f"Error listando archivos: {response.text}")
-                    return []
+                    if response.status_code != 200:
+                        print(f"Error listando archivos: {response.text}")
+                        return
+
+                    listing = response.json()
+                    if listing["entries"]:
+                        yield listing["entries"]
+
+                    cursor = listing.get("next_cursor")
+                    if not cursor:
+                        return
 
         except Exception as e:
             print(f"Error listando archivos: {e}")
-            return []
 
     async def delete_file(self, remote_file_path: str) -> bool:
         """Elimina un archivo del sistema GridDFS"""
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
                 return False
 
-            # Buscar el archivo en el NameNode
-            files = await self.list_files()
-            file_id = None
-            
-            for file in files:
-                if file["filepath"] == remote_file_path:
-                    file_id = file["id"]
-                    break
-
-            if file_id is None:
-                print(f"Error: Archivo {remote_file_path} no encontrado")
-                return False
-
             async with httpx.AsyncClient() as client:
+                # Resolver la ruta del archivo para obtener su ID
+                file_id = await self._resolve_file_id(
+                    client, remote_file_path, auth_headers
+                )
+                if file_id is None:
+                    print(f"Error: Archivo {remote_file_path} no encontrado")
+                    return False
+
                 response = await client.delete(
                     f"{self.namenode_url}/files/{file_id}",
                     headers=auth_headers
@@ -236,7 +241,7 @@ class GridDFSClient:
     async def create_directory(self, dirpath: str) -> bool:
         """Crea un directorio"""
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
                 return False
@@ -259,10 +264,36 @@ class GridDFSClient:
             print(f"Error creando directorio: {e}")
             return False
 
+    async def rename(self, src: str, dst: str) -> bool:
+        """Renombra o mueve un archivo o directorio"""
+        try:
+            auth_headers = await self.auth_client.get_auth_headers()
+            if not auth_headers:
+                print("Error: No autenticado. Use 'login' primero.")
+                return False
+
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{self.namenode_url}/files/rename",
+                    params={"src": src, "dst": dst},
+                    headers=auth_headers
+                )
+
+                if response.status_code == 200:
+                    print(f"{src} renombrado a {dst} exitosamente")
+                    return True
+                else:
+                    print(f"Error renombrando: {response.text}")
+                    return False
+
+        except Exception as e:
+            print(f"Error renombrando: {e}")
+            return False
+
     async def remove_directory(self, dirpath: str) -> bool:
         """Elimina un directorio"""
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
                 return False
@@ -274,13 +305,51 @@ class GridDFSClient:
                     headers=auth_headers
                 )
 
-                if response.status_code == 200:
+                if response.status_code not in (200, 202):
+                    print(f"Error eliminando directorio: {response.text}")
+                    return False
+
+                # El borrado se ejecuta en segundo plano: consultar su progreso
+                job = await self._wait_for_job(client, response.json())
+                if job["status"] == "completed":
                     print(f"Directorio {dirpath} eliminado exitosamente")
                     return True
                 else:
-                    print(f"Error eliminando directorio: {response.text}")
+                    print(f"Error eliminando directorio: {job.get('error')}")
                     return False
 
         except Exception as e:
             print(f"Error eliminando directorio: {e}")
             return False
+
+    async def _wait_for_job(
+        self, client: httpx.AsyncClient, job: Dict
+    ) -> Dict:
+        """Espera a que termine un trabajo del NameNode mostrando su progreso"""
+        while job["status"] in ("pending", "running"):
+            await asyncio.sleep(1.0)
+            response = await client.get(
+                f"{self.namenode_url}/files/jobs/{job['job_id']}",
+                headers=await self.auth_client.get_auth_headers()
+            )
+            if response.status_code != 200:
+                return {"status": "failed", "error": response.text}
+
+            job = response.json()
+            if job["total"]:
+                print(f"Progreso: {job['processed']}/{job['total']} archivos eliminados")
+
+        return job
+
+    async def _resolve_file_id(
+        self, client: httpx.AsyncClient, remote_file_path: str, auth_headers: Dict
+    ) -> Optional[int]:
+        """Obtiene el ID de un archivo a partir de su ruta"""
+        response = await client.get(
+            f"{self.namenode_url}/files/stat",
+            params={"path": remote_file_path},
+            headers=auth_headers
+        )
+        if response.status_code != 200:
+            return None
+        return response.json()["id"]
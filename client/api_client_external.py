@@ -1,15 +1,24 @@
+import asyncio
 import os
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 
 import httpx
 from utils.auth_utils import AuthClient
+from utils.block_map import MEDIA_TYPE as BLOCK_MAP_MEDIA_TYPE, BlockMap
 from utils.file_utils import FileUtils
+from utils.placement import PlacementPlan
+from utils.tracing import TraceRecorder, inject, span, start_trace
+
+# Bloques registrados por petición en /files/register-blocks
+REGISTER_BATCH_SIZE = 1000
 
 
 class GridDFSClientExternal:
-    def __init__(self, namenode_url: str = "http://52.87.223.92:8000"):
+    def __init__(self, namenode_url: str = "http://52.87.223.92:8000", trace_dir: Optional[str] = None):
         self.namenode_url = namenode_url
         self.auth_client = AuthClient(namenode_url)
+        # Si se define, put y get guardan ahí la traza de la transferencia
+        self.trace_dir = trace_dir
 
     async def register(self, username: str, email: str, password: str) -> bool:
         """Registra un nuevo usuario"""
@@ -29,6 +38,13 @@ class GridDFSClientExternal:
 
     async def put_file(self, local_file_path: str, remote_file_path: str) -> bool:
         """Sube un archivo al sistema GridDFS"""
+        with start_trace("put", enabled=bool(self.trace_dir), path=remote_file_path) as root:
+            success = await self._put_file(local_file_path, remote_file_path)
+            root.set(success=success)
+        await self._export_trace(root)
+        return success
+
+    async def _put_file(self, local_file_path: str, remote_file_path: str) -> bool:
         try:
             # Verificar que el archivo existe
             if not os.path.exists(local_file_path):
@@ -40,21 +56,24 @@ class GridDFSClientExternal:
             filename = os.path.basename(local_file_path)
 
             # Solicitar upload al NameNode
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
                 return False
 
             async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.namenode_url}/files/upload",
-                    json={
-                        "filename": filename,
-                        "filepath": remote_file_path,
-                        "size": file_size,
-                    },
-                    headers=auth_headers,
-                )
+                with span("plan", size=file_size):
+                    response = await client.post(
+                        f"{self.namenode_url}/files/upload",
+                        json={
+                            "filename": filename,
+                            "filepath": remote_file_path,
+                            "size": file_size,
+                            "plan": "compact",
+                            "commit": True,
+                        },
+                        headers=inject(auth_headers, self.namenode_url),
+                    )
 
                 if response.status_code != 200:
                     print(f"Error al solicitar upload: {response.text}")
@@ -62,61 +81,75 @@ class GridDFSClientExternal:
 
                 upload_info = response.json()
                 file_id = upload_info["file_id"]
-                block_distribution = upload_info["block_distribution"]
+                # Plan compacto, expandido bloque a bloque al usarlo (los
+                # NameNodes anteriores solo envían la lista completa)
+                if upload_info.get("placement"):
+                    block_distribution = PlacementPlan(upload_info["placement"])
+                else:
+                    block_distribution = upload_info["block_distribution"]
 
                 print(f"Archivo registrado con ID: {file_id}")
                 print(f"Distribución de bloques: {len(block_distribution)} bloques")
 
                 # Dividir archivo en bloques
                 print("Dividiendo archivo en bloques...")
-                blocks = await FileUtils.split_file_into_blocks_async(local_file_path)
+                # Usar el tamaño de bloque del NameNode para que coincida con la distribución
+                with span("hash", size=file_size):
+                    blocks = await FileUtils.split_file_into_blocks_async(
+                        local_file_path, upload_info.get("block_size")
+                    )
                 print(f"Archivo dividido en {len(blocks)} bloques")
 
                 # Convertir URLs internas a externas para el cliente
-                external_block_distribution = []
-                for block_info in block_distribution:
-                    external_block_info = block_info.copy()
-                    # Convertir datanode1:8000 a localhost:8001, etc.
-                    if "datanode1" in block_info["datanode_url"]:
-                        external_block_info["datanode_url"] = "http://35.175.174.41:8000"
-                    elif "datanode2" in block_info["datanode_url"]:
-                        external_block_info["datanode_url"] = "http://98.84.187.189:8000"
-                    elif "datanode3" in block_info["datanode_url"]:
-                        external_block_info["datanode_url"] = "http://34.228.6.193:8000"
-                    external_block_distribution.append(external_block_info)
-
-                # Registrar bloques en el NameNode primero para obtener los IDs
+                if isinstance(block_distribution, PlacementPlan):
+                    # Basta traducir la tabla de DataNodes del plan
+                    external_block_distribution = PlacementPlan(upload_info["placement"])
+                    external_block_distribution.datanodes = [
+                        self._external_datanode_url(url)
+                        for url in external_block_distribution.datanodes
+                    ]
+                else:
+                    external_block_distribution = []
+                    for block_info in block_distribution:
+                        external_block_info = block_info.copy()
+                        external_block_info["datanode_url"] = self._external_datanode_url(
+                            block_info["datanode_url"]
+                        )
+                        external_block_distribution.append(external_block_info)
+
+                # Registrar bloques en el NameNode primero para obtener los IDs,
+                # en lotes de REGISTER_BATCH_SIZE bloques por petición
                 print("Registrando bloques en el NameNode...")
                 block_ids = []
-                for i, (block_index, data, checksum) in enumerate(blocks):
-                    datanode_url = block_distribution[i][
-                        "datanode_url"
-                    ]  # Usar URL interna para el NameNode
-
-                    block_data = {
-                        "block_index": block_index,
-                        "block_size": len(data),
-                        "datanode_url": datanode_url,
-                        "checksum": checksum,
-                    }
-
-                    print(f"Enviando datos del bloque: {block_data}")
-
-                    response = await client.post(
-                        f"{self.namenode_url}/files/register-block/{file_id}",
-                        json=block_data,
-                        headers=auth_headers,
-                    )
+                for first in range(0, len(blocks), REGISTER_BATCH_SIZE):
+                    batch = [
+                        {
+                            "block_index": block_index,
+                            "block_size": len(data),
+                            # Usar URL interna para el NameNode
+                            "datanode_url": block_distribution[i]["datanode_url"],
+                            "checksum": checksum,
+                        }
+                        for i, (block_index, data, checksum) in enumerate(
+                            blocks[first:first + REGISTER_BATCH_SIZE], start=first
+                        )
+                    ]
+
+                    with span("register", first_block=first, blocks=len(batch)):
+                        response = await client.post(
+                            f"{self.namenode_url}/files/register-blocks/{file_id}",
+                            json={"blocks": batch},
+                            headers=inject(await self.auth_client.get_auth_headers()),
+                        )
 
                     if response.status_code != 200:
-                        print(f"Error registrando bloque {block_index}")
+                        print(f"Error registrando los bloques {first}-{first + len(batch) - 1}")
                         print(f"Status: {response.status_code}")
                         print(f"Response: {response.text}")
+                        await self._abandon_upload(client, file_id)
                         return False
 
-                    # Obtener el ID del bloque del response
-                    block_response = response.json()
-                    block_ids.append(block_response["block_id"])
+                    block_ids.extend(response.json()["block_ids"])
 
                 # Subir bloques a DataNodes con los IDs correctos
                 print("Subiendo bloques a DataNodes...")
@@ -126,6 +159,17 @@ class GridDFSClientExternal:
 
                 if not success:
                     print("Error subiendo bloques")
+                    await self._abandon_upload(client, file_id)
+                    return False
+
+                # Confirmar el upload: sin esto el NameNode lo trata como abandonado
+                response = await client.post(
+                    f"{self.namenode_url}/files/{file_id}/commit",
+                    headers=inject(await self.auth_client.get_auth_headers()),
+                )
+                if response.status_code != 200:
+                    print(f"Error confirmando el upload: {response.text}")
+                    await self._abandon_upload(client, file_id)
                     return False
 
                 print(f"Archivo {filename} subido exitosamente")
@@ -135,47 +179,48 @@ class GridDFSClientExternal:
             print(f"Error subiendo archivo: {e}")
             return False
 
+    async def _abandon_upload(self, client: httpx.AsyncClient, file_id: int):
+        """Elimina los metadatos de un upload fallido (el GC del NameNode lo haría más tarde)"""
+        try:
+            await client.delete(
+                f"{self.namenode_url}/files/{file_id}",
+                headers=await self.auth_client.get_auth_headers(),
+            )
+        except httpx.HTTPError as e:
+            print(f"No se pudo eliminar el upload fallido: {e}")
+
     async def get_file(self, remote_file_path: str, local_file_path: str) -> bool:
         """Descarga un archivo del sistema GridDFS"""
+        with start_trace("get", enabled=bool(self.trace_dir), path=remote_file_path) as root:
+            success = await self._get_file(remote_file_path, local_file_path)
+            root.set(success=success)
+        await self._export_trace(root)
+        return success
+
+    async def _get_file(self, remote_file_path: str, local_file_path: str) -> bool:
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
                 return False
 
             # Buscar el archivo en el NameNode
             async with httpx.AsyncClient() as client:
-                # Primero listar archivos para encontrar el ID
-                response = await client.get(
-                    f"{self.namenode_url}/files/list", headers=auth_headers
+                # Resolver la ruta del archivo para obtener su ID
+                file_id = await self._resolve_file_id(
+                    client, remote_file_path, auth_headers
                 )
-
-                if response.status_code != 200:
-                    print(f"Error listando archivos: {response.text}")
-                    return False
-
-                files = response.json()
-                file_id = None
-
-                for file in files:
-                    if file["filepath"] == remote_file_path:
-                        file_id = file["id"]
-                        break
-
                 if file_id is None:
                     print(f"Error: Archivo {remote_file_path} no encontrado")
                     return False
 
                 # Obtener información detallada del archivo
-                response = await client.get(
-                    f"{self.namenode_url}/files/{file_id}", headers=auth_headers
+                file_info = await self._get_block_map(
+                    client, f"/files/{file_id}", None, auth_headers
                 )
-
-                if response.status_code != 200:
-                    print(f"Error obteniendo información del archivo: {response.text}")
+                if file_info is None:
                     return False
 
-                file_info = response.json()
                 print(f"Descargando archivo: {file_info['file']['filename']}")
                 print(
                     f"Tamaño: {FileUtils.format_file_size(file_info['file']['size'])}"
@@ -183,14 +228,7 @@ class GridDFSClientExternal:
                 print(f"Bloques: {len(file_info['blocks'])}")
 
                 # Convertir URLs internas a externas para descarga
-                external_file_info = file_info.copy()
-                for block in external_file_info["blocks"]:
-                    if "datanode1" in block["datanode_url"]:
-                        block["datanode_url"] = "http://35.175.174.41:8000"
-                    elif "datanode2" in block["datanode_url"]:
-                        block["datanode_url"] = "http://98.84.187.189:8000"
-                    elif "datanode3" in block["datanode_url"]:
-                        block["datanode_url"] = "http://34.228.6.193:8000"
+                external_file_info = self._to_external(file_info)
 
                 # Descargar bloques y reconstruir archivo
                 success = await FileUtils.download_blocks_from_datanodes(
@@ -208,53 +246,175 @@ class GridDFSClientExternal:
             print(f"Error descargando archivo: {e}")
             return False
 
-    async def list_files(self, directory: str = "/") -> List[Dict]:
-        """Lista archivos en un directorio"""
+    async def get_file_range(
+        self,
+        remote_file_path: str,
+        local_file_path: str,
+        offset: int,
+        length: Optional[int] = None,
+    ) -> bool:
+        """Descarga solo los bytes [offset, offset + length) de un archivo"""
+        with start_trace(
+            "get_range", enabled=bool(self.trace_dir), path=remote_file_path, offset=offset
+        ) as root:
+            success = await self._get_file_range(
+                remote_file_path, local_file_path, offset, length
+            )
+            root.set(success=success)
+        await self._export_trace(root)
+        return success
+
+    async def _get_file_range(
+        self,
+        remote_file_path: str,
+        local_file_path: str,
+        offset: int,
+        length: Optional[int],
+    ) -> bool:
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
-                return []
+                return False
 
             async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.namenode_url}/files/list",
-                    params={"directory": directory},
-                    headers=auth_headers,
+                file_id = await self._resolve_file_id(
+                    client, remote_file_path, auth_headers
                 )
+                if file_id is None:
+                    print(f"Error: Archivo {remote_file_path} no encontrado")
+                    return False
 
-                if response.status_code == 200:
-                    return response.json()
+                # Solo los bloques que cubren el rango
+                params = {"offset": offset}
+                if length is not None:
+                    params["length"] = length
+                file_info = await self._get_block_map(
+                    client, f"/files/{file_id}/blocks", params, auth_headers
+                )
+                if file_info is None:
+                    return False
+
+                print(f"Bloques en el rango: {len(file_info['blocks'])}")
+                external_file_info = self._to_external(file_info)
+                success = await FileUtils.download_byte_range(
+                    external_file_info, offset, length, local_file_path
+                )
+
+                if success:
+                    print(f"Rango descargado exitosamente: {local_file_path}")
+                    return True
                 else:
-                    print(f"Error listando archivos: {response.text}")
-                    return []
+                    print("Error descargando el rango")
+                    return False
 
         except Exception as e:
-            print(f"Error listando archivos: {e}")
-            return []
+            print(f"Error descargando el rango: {e}")
+            return False
 
-    async def delete_file(self, remote_file_path: str) -> bool:
-        """Elimina un archivo del sistema GridDFS"""
+    async def _get_block_map(
+        self,
+        client: httpx.AsyncClient,
+        path: str,
+        params: Optional[Dict],
+        auth_headers: Dict,
+    ) -> Optional[Dict]:
+        """Pide un mapa de bloques (compacto si el NameNode lo soporta, JSON si no)"""
+        with span("plan", path=path):
+            response = await client.get(
+                f"{self.namenode_url}{path}",
+                params=params,
+                headers=inject(
+                    {
+                        **auth_headers,
+                        "Accept": f"{BLOCK_MAP_MEDIA_TYPE}, application/json;q=0.9",
+                    },
+                    self.namenode_url,
+                ),
+            )
+
+        if response.status_code != 200:
+            print(f"Error obteniendo información del archivo: {response.text}")
+            return None
+
+        if response.headers.get("content-type", "").startswith(BLOCK_MAP_MEDIA_TYPE):
+            block_map = BlockMap(response.content)
+            return {"file": block_map.file, "blocks": block_map}
+        return response.json()
+
+    def _to_external(self, file_info: Dict) -> Dict:
+        """Convierte las URLs internas de los DataNodes a las externas"""
+        blocks = file_info["blocks"]
+        if isinstance(blocks, BlockMap):
+            # Basta traducir la tabla de DataNodes del mapa
+            blocks.datanodes = [self._external_datanode_url(url) for url in blocks.datanodes]
+        else:
+            for block in blocks:
+                block["datanode_url"] = self._external_datanode_url(block["datanode_url"])
+        return file_info
+
+    async def list_files(self, directory: str = "/") -> List[Dict]:
+        """Lista archivos en un directorio"""
+        entries = []
+        async for page in self.iter_directory(directory):
+            entries.extend(page)
+        return entries
+
+    async def iter_directory(
+        self, directory: str = "/", page_size: int = 1000
+    ) -> AsyncIterator[List[Dict]]:
+        """Recorre un directorio página por página (paginación por cursor)"""
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
-                return False
+                return
 
-            # Buscar el archivo en el NameNode
-            files = await self.list_files()
-            file_id = None
+            async with httpx.AsyncClient() as client:
+                cursor = None
+                while True:
+                    params = {"directory": directory, "limit": page_size}
+                    if cursor:
+                        params["cursor"] = cursor
+
+                    response = await client.get(
+                        f"{self.namenode_url}/files/list",
+                        params=params,
+                        headers=await self.auth_client.get_auth_headers(),
+                    )
+
+                    if response.status_code != 200:
+                        print(f"Error listando archivos: {response.text}")
+                        return
+
+                    listing = response.json()
+                    if listing["entries"]:
+                        yield listing["entries"]
 
-            for file in files:
-                if file["filepath"] == remote_file_path:
-                    file_id = file["id"]
-                    break
+                    cursor = listing.get("next_cursor")
+                    if not cursor:
+                        return
 
-            if file_id is None:
-                print(f"Error: Archivo {remote_file_path} no encontrado")
+        except Exception as e:
+            print(f"Error listando archivos: {e}")
+
+    async def delete_file(self, remote_file_path: str) -> bool:
+        """Elimina un archivo del sistema GridDFS"""
+        try:
+            auth_headers = await self.auth_client.get_auth_headers()
+            if not auth_headers:
+                print("Error: No autenticado. Use 'login' primero.")
                 return False
 
             async with httpx.AsyncClient() as client:
+                # Resolver la ruta del archivo para obtener su ID
+                file_id = await self._resolve_file_id(
+                    client, remote_file_path, auth_headers
+                )
+                if file_id is None:
+                    print(f"Error: Archivo {remote_file_path} no encontrado")
+                    return False
+
                 response = await client.delete(
                     f"{self.namenode_url}/files/{file_id}", headers=auth_headers
                 )
@@ -270,10 +430,70 @@ class GridDFSClientExternal:
             print(f"Error eliminando archivo: {e}")
             return False
 
+    async def cache_file(self, remote_file_path: str, pin: bool = False, unpin: bool = False) -> bool:
+        """Precarga (o fija, o libera) en la caché de los DataNodes los bloques de un archivo"""
+        try:
+            auth_headers = await self.auth_client.get_auth_headers()
+            if not auth_headers:
+                print("Error: No autenticado. Use 'login' primero.")
+                return False
+
+            async with httpx.AsyncClient(timeout=300.0) as client:
+                file_id = await self._resolve_file_id(
+                    client, remote_file_path, auth_headers
+                )
+                if file_id is None:
+                    print(f"Error: Archivo {remote_file_path} no encontrado")
+                    return False
+
+                file_info = await self._get_block_map(
+                    client, f"/files/{file_id}", None, auth_headers
+                )
+                if file_info is None:
+                    return False
+
+                # Un pedido por DataNode con todos sus bloques del archivo
+                blocks_by_datanode: Dict[str, List[str]] = {}
+                for block in self._to_external(file_info)["blocks"]:
+                    blocks_by_datanode.setdefault(block["datanode_url"], []).append(block["block_id"])
+
+                # La administración de la caché exige el DEBUG_TOKEN de los DataNodes
+                debug_headers = {"X-Debug-Token": os.getenv("GRIDDFS_DEBUG_TOKEN", "")}
+                success = True
+                for datanode_url, block_ids in blocks_by_datanode.items():
+                    if unpin:
+                        response = await client.post(
+                            f"{datanode_url}/blocks/cache/unpin", json={"block_ids": block_ids},
+                            headers=debug_headers,
+                        )
+                    else:
+                        response = await client.post(
+                            f"{datanode_url}/blocks/cache/warm",
+                            json={"block_ids": block_ids, "pin": pin},
+                            headers=debug_headers,
+                        )
+                    if response.status_code != 200:
+                        print(f"Error en la caché de {datanode_url}: {response.text}")
+                        success = False
+                    elif unpin:
+                        print(f"{datanode_url}: {response.json()['unpinned']} bloques liberados")
+                    else:
+                        result = response.json()
+                        print(
+                            f"{datanode_url}: {len(result['cached'])} bloques en caché, "
+                            f"{len(result['skipped'])} no caben, {len(result['missing'])} no encontrados"
+                        )
+                        success = success and not result["skipped"] and not result["missing"]
+                return success
+
+        except Exception as e:
+            print(f"Error actualizando la caché: {e}")
+            return False
+
     async def create_directory(self, dirpath: str) -> bool:
         """Crea un directorio"""
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
                 return False
@@ -296,10 +516,36 @@ class GridDFSClientExternal:
             print(f"Error creando directorio: {e}")
             return False
 
+    async def rename(self, src: str, dst: str) -> bool:
+        """Renombra o mueve un archivo o directorio"""
+        try:
+            auth_headers = await self.auth_client.get_auth_headers()
+            if not auth_headers:
+                print("Error: No autenticado. Use 'login' primero.")
+                return False
+
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{self.namenode_url}/files/rename",
+                    params={"src": src, "dst": dst},
+                    headers=auth_headers,
+                )
+
+                if response.status_code == 200:
+                    print(f"{src} renombrado a {dst} exitosamente")
+                    return True
+                else:
+                    print(f"Error renombrando: {response.text}")
+                    return False
+
+        except Exception as e:
+            print(f"Error renombrando: {e}")
+            return False
+
     async def remove_directory(self, dirpath: str) -> bool:
         """Elimina un directorio"""
         try:
-            auth_headers = self.auth_client.get_auth_headers()
+            auth_headers = await self.auth_client.get_auth_headers()
             if not auth_headers:
                 print("Error: No autenticado. Use 'login' primero.")
                 return False
@@ -311,13 +557,71 @@ class GridDFSClientExternal:
                     headers=auth_headers,
                 )
 
-                if response.status_code == 200:
+                if response.status_code not in (200, 202):
+                    print(f"Error eliminando directorio: {response.text}")
+                    return False
+
+                # El borrado se ejecuta en segundo plano: consultar su progreso
+                job = await self._wait_for_job(client, response.json())
+                if job["status"] == "completed":
                     print(f"Directorio {dirpath} eliminado exitosamente")
                     return True
                 else:
-                    print(f"Error eliminando directorio: {response.text}")
+                    print(f"Error eliminando directorio: {job.get('error')}")
                     return False
 
         except Exception as e:
             print(f"Error eliminando directorio: {e}")
             return False
+
+    async def _wait_for_job(
+        self, client: httpx.AsyncClient, job: Dict
+    ) -> Dict:
+        """Espera a que termine un trabajo del NameNode mostrando su progreso"""
+        while job["status"] in ("pending", "running"):
+            await asyncio.sleep(1.0)
+            response = await client.get(
+                f"{self.namenode_url}/files/jobs/{job['job_id']}",
+                headers=await self.auth_client.get_auth_headers(),
+            )
+            if response.status_code != 200:
+                return {"status": "failed", "error": response.text}
+
+            job = response.json()
+            if job["total"]:
+                print(f"Progreso: {job['processed']}/{job['total']} archivos eliminados")
+
+        return job
+
+    @staticmethod
+    def _external_datanode_url(datanode_url: str) -> str:
+        """Traduce la URL interna de un DataNode a la URL accesible desde el cliente"""
+        if "datanode1" in datanode_url:
+            return "http://35.175.174.41:8000"
+        elif "datanode2" in datanode_url:
+            return "http://98.84.187.189:8000"
+        elif "datanode3" in datanode_url:
+            return "http://34.228.6.193:8000"
+        return datanode_url
+
+    async def _resolve_file_id(
+        self, client: httpx.AsyncClient, remote_file_path: str, auth_headers: Dict
+    ) -> Optional[int]:
+        """Obtiene el ID de un archivo a partir de su ruta"""
+        with span("resolve", path=remote_file_path):
+            response = await client.get(
+                f"{self.namenode_url}/files/stat",
+                params={"path": remote_file_path},
+                headers=inject(auth_headers, self.namenode_url),
+            )
+        if response.status_code != 200:
+            return None
+        return response.json()["id"]
+
+    async def _export_trace(self, root):
+        """Guarda la traza de una transferencia junto con los tramos de los servicios"""
+        if root.trace_id is None:
+            return
+        path = await TraceRecorder.export(root.trace_id, self.trace_dir)
+        if path:
+            print(f"Traza {root.trace_id} guardada en {path}")
@@ -4,6 +4,7 @@ import os
 
 import click
 from api_client_external import GridDFSClientExternal
+from rich import box
 from rich import print as rprint
 from rich.console import Console
 from rich.table import Table
@@ -14,11 +15,16 @@ console = Console()
 
 @click.group()
 @click.option("--namenode", default="http://52.87.223.92:8000", help="URL del NameNode")
+@click.option(
+    "--trace-dir",
+    default=lambda: os.getenv("GRIDDFS_TRACE_DIR"),
+    help="Directorio donde put/get guardan la traza de la transferencia",
+)
 @click.pass_context
-def cli(ctx, namenode):
+def cli(ctx, namenode, trace_dir):
     """GridDFS - Sistema de archivos distribuido por bloques"""
     ctx.ensure_object(dict)
-    ctx.obj["client"] = GridDFSClientExternal(namenode)
+    ctx.obj["client"] = GridDFSClientExternal(namenode, trace_dir)
 
 
 @cli.command()
@@ -111,13 +117,20 @@ def put(ctx, local_file, remote_file):
 @cli.command()
 @click.argument("remote_file")
 @click.argument("local_file")
+@click.option("--offset", type=int, default=None, help="Descargar desde este byte")
+@click.option("--length", type=int, default=None, help="Cantidad de bytes a descargar")
 @click.pass_context
-def get(ctx, remote_file, local_file):
-    """Descarga un archivo del sistema GridDFS"""
+def get(ctx, remote_file, local_file, offset, length):
+    """Descarga un archivo (o un rango de bytes) del sistema GridDFS"""
 
     async def _get():
         client = ctx.obj["client"]
-        success = await client.get_file(remote_file, local_file)
+        if offset is None and length is None:
+            success = await client.get_file(remote_file, local_file)
+        else:
+            success = await client.get_file_range(
+                remote_file, local_file, offset or 0, length
+            )
         if success:
             rprint(
                 f"[green]Archivo {remote_file} descargado exitosamente como {local_file}[/green]"
@@ -130,38 +143,57 @@ def get(ctx, remote_file, local_file):
 
 @cli.command()
 @click.option("--directory", "-d", default="/", help="Directorio a listar")
+@click.option("--page-size", default=100, help="Entradas por página")
 @click.pass_context
-def ls(ctx, directory):
+def ls(ctx, directory, page_size):
     """Lista archivos en un directorio"""
 
     async def _ls():
         client = ctx.obj["client"]
-        files = await client.list_files(directory)
-
-        if not files:
-            rprint(f"[yellow]No hay archivos en {directory}[/yellow]")
-            return
-
-        table = Table(title=f"Archivos en {directory}")
-        table.add_column("ID", style="cyan")
-        table.add_column("Nombre", style="green")
-        table.add_column("Ruta", style="blue")
-        table.add_column("Tamaño", style="yellow")
-        table.add_column("Bloques", style="magenta")
-        table.add_column("Creado", style="white")
-
-        for file in files:
-            size_str = FileUtils.format_file_size(file["size"])
-            table.add_row(
-                str(file["id"]),
-                file["filename"],
-                file["filepath"],
-                size_str,
-                str(file["num_blocks"]),
-                file["created_at"],
+        total = 0
+
+        # Mostrar cada página en cuanto llega del NameNode
+        async for page in client.iter_directory(directory, page_size):
+            table = Table(
+                title=f"Archivos en {directory}" if total == 0 else None,
+                show_header=total == 0,
+                box=box.SIMPLE,
             )
+            table.add_column("Tipo", style="white", min_width=4)
+            table.add_column("ID", style="cyan", min_width=6)
+            table.add_column("Nombre", style="green", min_width=20)
+            table.add_column("Ruta", style="blue", min_width=30)
+            table.add_column("Tamaño", style="yellow", min_width=8)
+            table.add_column("Bloques", style="magenta", min_width=7)
+            table.add_column("Creado", style="white", min_width=19)
+
+            for entry in page:
+                if entry["type"] == "directory":
+                    table.add_row(
+                        "dir",
+                        str(entry["id"]),
+                        entry["name"] + "/",
+                        entry["path"],
+                        "-",
+                        "-",
+                        entry["created_at"] or "",
+                    )
+                else:
+                    table.add_row(
+                        "file",
+                        str(entry["id"]),
+                        entry["name"],
+                        entry["path"],
+                        FileUtils.format_file_size(entry["size"]),
+                        str(entry["num_blocks"]),
+                        entry["created_at"] or "",
+                    )
 
-        console.print(table)
+            console.print(table)
+            total += len(page)
+
+        if total == 0:
+            rprint(f"[yellow]No hay archivos en {directory}[/yellow]")
 
     asyncio.run(_ls())
 
@@ -183,6 +215,25 @@ def rm(ctx, remote_file):
     asyncio.run(_rm())
 
 
+@cli.command()
+@click.argument("remote_file")
+@click.option("--pin", is_flag=True, help="Fijar los bloques en la caché")
+@click.option("--unpin", is_flag=True, help="Liberar los bloques fijados")
+@click.pass_context
+def cache(ctx, remote_file, pin, unpin):
+    """Precarga un archivo muy leído en la caché de los DataNodes"""
+
+    async def _cache():
+        client = ctx.obj["client"]
+        success = await client.cache_file(remote_file, pin=pin, unpin=unpin)
+        if success:
+            rprint(f"[green]Caché actualizada para {remote_file}[/green]")
+        else:
+            rprint("[red]Error actualizando la caché[/red]")
+
+    asyncio.run(_cache())
+
+
 @cli.command()
 @click.argument("dirpath")
 @click.pass_context
@@ -200,6 +251,24 @@ def mkdir(ctx, dirpath):
     asyncio.run(_mkdir())
 
 
+@cli.command()
+@click.argument("src")
+@click.argument("dst")
+@click.pass_context
+def mv(ctx, src, dst):
+    """Renombra o mueve un archivo o directorio"""
+
+    async def _mv():
+        client = ctx.obj["client"]
+        success = await client.rename(src, dst)
+        if success:
+            rprint(f"[green]{src} movido a {dst} exitosamente[/green]")
+        else:
+            rprint("[red]Error moviendo archivo o directorio[/red]")
+
+    asyncio.run(_mv())
+
+
 @cli.command()
 @click.argument("dirpath")
 @click.pass_context
@@ -37,6 +37,7 @@ if [ $# -eq 0 ]; then
     echo "   ls [-d dir]                     - Listar archivos"
     echo "   rm <file>                       - Eliminar archivo"
     echo "   mkdir <dir>                     - Crear directorio"
+    echo "   mv <src> <dst>                  - Renombrar o mover"
     echo "   rmdir <dir>                     - Eliminar directorio"
     echo "   status                          - Estado del sistema"
     echo ""
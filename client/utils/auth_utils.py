@@ -1,20 +1,33 @@
 import httpx
 import json
 import os
+import time
 from typing import Optional
 
 class AuthClient:
+    # Segundos antes de la expiración en que se renueva el token de acceso
+    REFRESH_MARGIN = 60
+
     def __init__(self, namenode_url: str = "http://52.87.223.92:8000"):
         self.namenode_url = namenode_url
         self.token = None
+        self.refresh_token = None
+        self.expires_at = None
         self.token_file = os.path.expanduser("~/.griddfs_token")
 
-    def save_token(self, token: str):
+    def save_token(self, token: str, refresh_token: Optional[str] = None, expires_in: Optional[int] = None):
         """Guarda el token en un archivo local"""
         try:
+            expires_at = time.time() + expires_in if expires_in else None
             with open(self.token_file, 'w') as f:
-                json.dump({"token": token}, f)
+                json.dump({
+                    "token": token,
+                    "refresh_token": refresh_token,
+                    "expires_at": expires_at
+                }, f)
             self.token = token
+            self.refresh_token = refresh_token
+            self.expires_at = expires_at
         except Exception as e:
             print(f"Error saving token: {e}")
 
@@ -25,6 +38,8 @@ class AuthClient:
                 with open(self.token_file, 'r') as f:
                     data = json.load(f)
                     self.token = data.get("token")
+                    self.refresh_token = data.get("refresh_token")
+                    self.expires_at = data.get("expires_at")
                     return self.token
         except Exception as e:
             print(f"Error loading token: {e}")
@@ -36,6 +51,8 @@ class AuthClient:
             if os.path.exists(self.token_file):
                 os.remove(self.token_file)
             self.token = None
+            self.refresh_token = None
+            self.expires_at = None
         except Exception as e:
             print(f"Error clearing token: {e}")
 
@@ -79,7 +96,7 @@ class AuthClient:
                     data = response.json()
                     token = data.get("access_token")
                     if token:
-                        self.save_token(token)
+                        self.save_token(token, data.get("refresh_token"), data.get("expires_in"))
                         print("Inicio de sesión exitoso")
                         return True
                     else:
@@ -92,19 +109,43 @@ class AuthClient:
             print(f"Error de conexión: {e}")
             return False
 
+    async def refresh(self) -> bool:
+        """Renueva el token de acceso con el refresh token (sin enviar la contraseña)"""
+        if not self.refresh_token:
+            return False
+
+        try:
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                response = await client.post(
+                    f"{self.namenode_url}/auth/refresh",
+                    json={"refresh_token": self.refresh_token}
+                )
+        except Exception as e:
+            print(f"Error de conexión: {e}")
+            return False
+
+        if response.status_code != 200:
+            return False
+
+        data = response.json()
+        self.save_token(
+            data["access_token"],
+            data.get("refresh_token", self.refresh_token),
+            data.get("expires_in")
+        )
+        return True
+
     async def get_current_user(self) -> Optional[dict]:
         """Obtiene información del usuario actual"""
-        if not self.token:
-            self.load_token()
-        
-        if not self.token:
+        headers = await self.get_auth_headers()
+        if not headers:
             return None
         
         try:
             async with httpx.AsyncClient(timeout=30.0) as client:
                 response = await client.get(
                     f"{self.namenode_url}/auth/me",
-                    headers={"Authorization": f"Bearer {self.token}"}
+                    headers=headers
                 )
                 
                 if response.status_code == 200:
@@ -117,10 +158,14 @@ class AuthClient:
             print(f"Error de conexión: {e}")
             return None
 
-    def get_auth_headers(self) -> dict:
-        """Obtiene los headers de autenticación"""
+    async def get_auth_headers(self) -> dict:
+        """Obtiene los headers de autenticación, renovando el token si está por expirar"""
         if not self.token:
             self.load_token()
+
+        if (self.token and self.expires_at
+                and time.time() >= self.expires_at - self.REFRESH_MARGIN):
+            await self.refresh()
         
         if self.token:
             return {"Authorization": f"Bearer {self.token}"}
@@ -0,0 +1,46 @@
+import struct
+from typing import Iterator, List, NamedTuple, Tuple
+
+# Formato de los lotes de bloques del DataNode (ver datanode/app/api/block_frames.py):
+#     u16 largo del id, u8 estado, u64 tamaño, 32 bytes checksum SHA-256, id, datos
+MEDIA_TYPE = "application/vnd.griddfs.blocks"
+FRAME_HEADER = struct.Struct("<HBQ32s")
+
+OK = 0
+NOT_FOUND = 1
+ERROR = 2
+
+
+class BlockFrame(NamedTuple):
+    block_id: str
+    status: int
+    checksum: str
+    data: bytes
+
+
+def encode_blocks(blocks: List[Tuple[str, bytes, str]]) -> bytes:
+    """Cuerpo de una subida múltiple a partir de (block_id, datos, checksum)"""
+    parts = []
+    for block_id, data, checksum in blocks:
+        raw_id = block_id.encode()
+        parts.append(FRAME_HEADER.pack(len(raw_id), OK, len(data), bytes.fromhex(checksum)))
+        parts.append(raw_id)
+        parts.append(data)
+    return b"".join(parts)
+
+
+def decode_blocks(content: bytes) -> Iterator[BlockFrame]:
+    """Bloques de la respuesta de una descarga múltiple"""
+    view = memoryview(content)
+    offset = 0
+    while offset < len(view):
+        if offset + FRAME_HEADER.size > len(view):
+            raise ValueError("Lote truncado")
+        id_length, status, size, checksum = FRAME_HEADER.unpack_from(view, offset)
+        offset += FRAME_HEADER.size
+        block_id = bytes(view[offset:offset + id_length]).decode()
+        offset += id_length
+        if offset + size > len(view):
+            raise ValueError("Lote truncado")
+        yield BlockFrame(block_id, status, checksum.hex(), bytes(view[offset:offset + size]))
+        offset += size
@@ -0,0 +1,90 @@
+import json
+import struct
+import uuid
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Tuple
+
+MEDIA_TYPE = "application/vnd.griddfs.blockmap"
+MAGIC = b"GBM1"
+
+
+class BlockMap:
+    """Mapa de bloques en el formato binario compacto del NameNode.
+
+    Se decodifica de forma perezosa: al cargarlo solo se leen el encabezado
+    y las rachas; cada bloque se arma como dict (las mismas claves que el
+    JSON de `/files/{id}`) recién cuando se accede a él, así que recorrer
+    un archivo de millones de bloques no mantiene millones de dicts en
+    memoria. La tabla `datanodes` se puede reescribir (por ejemplo, para
+    traducir URLs internas a externas) y afecta a todos los bloques.
+    """
+
+    def __init__(self, content: bytes):
+        view = memoryview(content)
+        if bytes(view[:4]) != MAGIC:
+            raise ValueError("Formato de mapa de bloques no reconocido")
+
+        (header_length,) = struct.unpack_from("<I", view, 4)
+        offset = 8 + header_length
+        header = json.loads(bytes(view[8:offset]))
+        self.file: Dict = header["file"]
+        self.datanodes: List[str] = header["datanodes"]
+        self._count: int = header["blocks"]
+
+        self._index_runs, self._index_starts, offset = self._read_runs(view, offset, "<II")
+        self._size_runs, self._size_starts, offset = self._read_runs(view, offset, "<QI")
+        self._placement_runs, self._placement_starts, offset = self._read_runs(view, offset, "<HHI")
+
+        self._block_ids = view[offset:offset + 16 * self._count]
+        offset += 16 * self._count
+        self._checksums = view[offset:offset + 32 * self._count]
+        if len(self._checksums) != 32 * self._count:
+            raise ValueError("Mapa de bloques truncado")
+
+    @staticmethod
+    def _read_runs(view: memoryview, offset: int, fmt: str) -> Tuple[List[Tuple], List[int], int]:
+        """Lee una sección de rachas; retorna (rachas, posición inicial de cada una, offset)"""
+        record = struct.Struct(fmt)
+        (count,) = struct.unpack_from("<I", view, offset)
+        offset += 4
+        runs = []
+        starts = []
+        position = 0
+        for _ in range(count):
+            run = record.unpack_from(view, offset)
+            offset += record.size
+            runs.append(run)
+            starts.append(position)
+            position += run[-1]
+        return runs, starts, offset
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Dict]:
+        for position in range(self._count):
+            yield self[position]
+
+    def __getitem__(self, position: int) -> Dict:
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError("Bloque fuera de rango")
+
+        run = bisect_right(self._index_starts, position) - 1
+        block_index = self._index_runs[run][0] + position - self._index_starts[run]
+
+        run = bisect_right(self._size_starts, position) - 1
+        size = self._size_runs[run][0]
+
+        run = bisect_right(self._placement_starts, position) - 1
+        node, stride, _ = self._placement_runs[run]
+        node = (node + stride * (position - self._placement_starts[run])) % len(self.datanodes)
+
+        return {
+            "block_id": str(uuid.UUID(bytes=bytes(self._block_ids[16 * position:16 * position + 16]))),
+            "block_index": block_index,
+            "size": size,
+            "datanode_url": self.datanodes[node],
+            "checksum": self._checksums[32 * position:32 * position + 32].hex(),
+        }
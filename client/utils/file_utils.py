@@ -1,14 +1,21 @@
 import asyncio
 import hashlib
 import os
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import aiofiles
 import httpx
 
+from .block_frames import MEDIA_TYPE as BLOCK_FRAMES_MEDIA_TYPE, OK, decode_blocks, encode_blocks
+from .tracing import inject, span
+
 
 class FileUtils:
     BLOCK_SIZE = 67108864  # 64MB
+    # Los bloques chicos de un mismo DataNode viajan juntos, en lotes de
+    # hasta BATCH_MAX_BYTES o BATCH_MAX_BLOCKS, en una sola petición
+    BATCH_MAX_BYTES = 8 * 1024 * 1024
+    BATCH_MAX_BLOCKS = 1000
 
     @staticmethod
     def calculate_checksum(data: bytes) -> str:
@@ -16,14 +23,17 @@ class FileUtils:
         return hashlib.sha256(data).hexdigest()
 
     @staticmethod
-    def split_file_into_blocks(file_path: str) -> List[Tuple[int, bytes, str]]:
+    def split_file_into_blocks(
+        file_path: str, block_size: Optional[int] = None
+    ) -> List[Tuple[int, bytes, str]]:
         """Divide un archivo en bloques"""
+        block_size = block_size or FileUtils.BLOCK_SIZE
         blocks = []
         block_index = 0
 
         with open(file_path, "rb") as f:
             while True:
-                data = f.read(FileUtils.BLOCK_SIZE)
+                data = f.read(block_size)
                 if not data:
                     break
 
@@ -35,15 +45,16 @@ class FileUtils:
 
     @staticmethod
     async def split_file_into_blocks_async(
-        file_path: str,
+        file_path: str, block_size: Optional[int] = None
     ) -> List[Tuple[int, bytes, str]]:
         """Divide un archivo en bloques de forma asíncrona"""
+        block_size = block_size or FileUtils.BLOCK_SIZE
         blocks = []
         block_index = 0
 
         async with aiofiles.open(file_path, "rb") as f:
             while True:
-                data = await f.read(FileUtils.BLOCK_SIZE)
+                data = await f.read(block_size)
                 if not data:
                     break
 
@@ -63,6 +74,9 @@ class FileUtils:
         """Sube bloques a los DataNodes correspondientes"""
         try:
             async with httpx.AsyncClient() as client:
+                # Lote en armado por DataNode: (block_index, block_id, datos, checksum)
+                batches: Dict[str, List[Tuple[int, str, bytes, str]]] = {}
+                batch_bytes: Dict[str, int] = {}
                 for i, (block_index, data, checksum) in enumerate(blocks):
                     if i >= len(block_distribution):
                         print(
@@ -71,45 +85,100 @@ class FileUtils:
                         return False
 
                     datanode_url = block_distribution[i]["datanode_url"]
+                    batch = batches.setdefault(datanode_url, [])
+                    batch.append((block_index, block_ids[i], data, checksum))
+                    batch_bytes[datanode_url] = batch_bytes.get(datanode_url, 0) + len(data)
+                    if (
+                        batch_bytes[datanode_url] >= FileUtils.BATCH_MAX_BYTES
+                        or len(batch) >= FileUtils.BATCH_MAX_BLOCKS
+                    ):
+                        if not await FileUtils._upload_batch(client, datanode_url, batch):
+                            return False
+                        batches[datanode_url] = []
+                        batch_bytes[datanode_url] = 0
 
-                    # Crear archivo temporal para el bloque
-                    import tempfile
-
-                    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                        temp_file.write(data)
-                        temp_file_path = temp_file.name
-
-                    try:
-                        # Subir bloque al DataNode
-                        with open(temp_file_path, "rb") as f:
-                            files = {"file": f}
-                            data_form = {"block_id": block_ids[i], "checksum": checksum}
-
-                            response = await client.post(
-                                f"{datanode_url}/blocks/upload",
-                                files=files,
-                                data=data_form,
-                            )
-
-                            if response.status_code != 200:
-                                print(
-                                    f"Error subiendo bloque {block_index} a {datanode_url}"
-                                )
-                                return False
-
-                            print(
-                                f"Bloque {block_index} subido exitosamente a {datanode_url}"
-                            )
-
-                    finally:
-                        # Limpiar archivo temporal
-                        os.unlink(temp_file_path)
+                for datanode_url, batch in batches.items():
+                    if batch and not await FileUtils._upload_batch(client, datanode_url, batch):
+                        return False
 
                 return True
         except Exception as e:
             print(f"Error subiendo bloques: {e}")
             return False
 
+    @staticmethod
+    async def _upload_batch(
+        client: httpx.AsyncClient, datanode_url: str, batch: List[Tuple[int, str, bytes, str]]
+    ) -> bool:
+        """Sube un lote de bloques a un DataNode (un bloque solo va con PUT)"""
+        if len(batch) == 1:
+            block_index, block_id, data, checksum = batch[0]
+            with span(
+                "upload", block_index=block_index, datanode=datanode_url, size=len(data)
+            ):
+                response = await FileUtils.upload_block(
+                    client, datanode_url, block_id, data, checksum
+                )
+
+            if response.status_code != 200:
+                print(f"Error subiendo bloque {block_index} a {datanode_url}")
+                return False
+
+            print(f"Bloque {block_index} subido exitosamente a {datanode_url}")
+            return True
+
+        body = encode_blocks([(block_id, data, checksum) for _, block_id, data, checksum in batch])
+        with span("upload", blocks=len(batch), datanode=datanode_url, size=len(body)):
+            response = await client.post(
+                f"{datanode_url}/blocks/batch/upload",
+                content=body,
+                headers=inject({"Content-Type": BLOCK_FRAMES_MEDIA_TYPE}, peer_url=datanode_url),
+            )
+
+        if response.status_code in (404, 405):
+            # DataNode sin operaciones por lote: un bloque por petición
+            for item in batch:
+                if not await FileUtils._upload_batch(client, datanode_url, [item]):
+                    return False
+            return True
+        if response.status_code != 200:
+            print(f"Error subiendo {len(batch)} bloques a {datanode_url}: {response.text}")
+            return False
+
+        for (block_index, _, _, _), result in zip(batch, response.json()["results"]):
+            if result["status"] != "ok":
+                print(f"Error subiendo bloque {block_index} a {datanode_url}: {result['status']}")
+                return False
+        print(f"{len(batch)} bloques subidos exitosamente a {datanode_url}")
+        return True
+
+    @staticmethod
+    async def upload_block(
+        client: httpx.AsyncClient, datanode_url: str, block_id: str, data: bytes, checksum: str
+    ) -> httpx.Response:
+        """Sube un bloque como cuerpo binario con `PUT /blocks/{id}`.
+
+        Si el DataNode no tiene el endpoint (versiones anteriores responden
+        405), se sube con el formulario multipart de `POST /blocks/upload`.
+        """
+        response = await client.put(
+            f"{datanode_url}/blocks/{block_id}",
+            content=data,
+            headers=inject(
+                {"Content-Type": "application/octet-stream", "X-Block-Checksum": checksum},
+                peer_url=datanode_url,
+            ),
+        )
+        if response.status_code != 405:
+            return response
+
+        return await client.post(
+            f"{datanode_url}/blocks/upload",
+            files={"file": data},
+            data={"block_id": block_id, "checksum": checksum},
+            headers=inject(peer_url=datanode_url),
+        )
+
     @staticmethod
     async def download_blocks_from_datanodes(file_info: Dict, output_path: str) -> bool:
         """Descarga bloques de los DataNodes y reconstruye el archivo"""
@@ -126,26 +195,140 @@ class FileUtils:
 
             async with httpx.AsyncClient() as client:
                 with open(output_path, "wb") as output_file:
+                    # Ventanas de bloques consecutivos: se piden agrupados por
+                    # DataNode y se escriben en orden
+                    window = []
+                    window_bytes = 0
                     for block_info in blocks:
+                        window.append(block_info)
+                        window_bytes += block_info["size"]
+                        if (
+                            window_bytes >= FileUtils.BATCH_MAX_BYTES
+                            or len(window) >= FileUtils.BATCH_MAX_BLOCKS
+                        ):
+                            if not await FileUtils._download_window(client, window, output_file):
+                                return False
+                            window = []
+                            window_bytes = 0
+                    if window and not await FileUtils._download_window(client, window, output_file):
+                        return False
+
+                print(f"Archivo reconstruido exitosamente: {output_path}")
+                return True
+        except Exception as e:
+            print(f"Error descargando bloques: {e}")
+            return False
+
+    @staticmethod
+    async def _download_window(client: httpx.AsyncClient, window: List[Dict], output_file) -> bool:
+        """Descarga una ventana de bloques (un lote por DataNode) y la escribe en orden"""
+        by_datanode: Dict[str, List[str]] = {}
+        for block_info in window:
+            by_datanode.setdefault(block_info["datanode_url"], []).append(block_info["block_id"])
+
+        results = await asyncio.gather(*(
+            FileUtils._download_batch(client, datanode_url, block_ids)
+            for datanode_url, block_ids in by_datanode.items()
+        ))
+        contents: Dict[str, bytes] = {}
+        for result in results:
+            if result is None:
+                return False
+            contents.update(result)
+
+        for block_info in window:
+            # Escribir bloque al archivo de salida
+            output_file.write(contents[block_info["block_id"]])
+            print(f"Bloque {block_info['block_id']} descargado exitosamente")
+        return True
+
+    @staticmethod
+    async def _download_batch(
+        client: httpx.AsyncClient, datanode_url: str, block_ids: List[str]
+    ) -> Optional[Dict[str, bytes]]:
+        """Contenido de varios bloques de un DataNode; None si alguno falla"""
+        if len(block_ids) > 1:
+            with span("download", blocks=len(block_ids), datanode=datanode_url):
+                response = await client.post(
+                    f"{datanode_url}/blocks/batch/download",
+                    json={"block_ids": block_ids},
+                    headers=inject(peer_url=datanode_url),
+                )
+            if response.status_code == 200:
+                contents = {}
+                for frame in decode_blocks(response.content):
+                    if frame.status != OK:
+                        print(f"Error descargando bloque {frame.block_id} de {datanode_url}")
+                        return None
+                    contents[frame.block_id] = frame.data
+                return contents
+            if response.status_code not in (404, 405):
+                print(f"Error descargando {len(block_ids)} bloques de {datanode_url}")
+                return None
+            # DataNode sin operaciones por lote: un bloque por petición
+
+        contents = {}
+        for block_id in block_ids:
+            with span("download", block_id=block_id, datanode=datanode_url):
+                response = await client.get(
+                    f"{datanode_url}/blocks/download/{block_id}",
+                    headers=inject(peer_url=datanode_url),
+                )
+
+            if response.status_code != 200:
+                print(f"Error descargando bloque {block_id} de {datanode_url}")
+                return None
+            contents[block_id] = response.content
+        return contents
+
+    @staticmethod
+    async def download_byte_range(
+        file_info: Dict, offset: int, length: Optional[int], output_path: str
+    ) -> bool:
+        """Descarga los bloques de un rango y escribe solo los bytes pedidos"""
+        try:
+            block_size = file_info["file"]["block_size"]
+            end = file_info["file"]["size"]
+            if length is not None:
+                end = min(end, offset + length)
+
+            output_dir = os.path.dirname(output_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+
+            async with httpx.AsyncClient() as client:
+                with open(output_path, "wb") as output_file:
+                    for block_info in file_info["blocks"]:
                         datanode_url = block_info["datanode_url"]
                         block_id = block_info["block_id"]
 
-                        # Descargar bloque
-                        response = await client.get(
-                            f"{datanode_url}/blocks/download/{block_id}"
-                        )
+                        # Pedir al DataNode solo la parte del bloque dentro del rango
+                        block_start = block_info["block_index"] * block_size
+                        first = max(offset - block_start, 0)
+                        last = min(end - block_start, block_info["size"])
+                        if last <= first:
+                            continue
+
+                        with span("download", block_id=block_id, datanode=datanode_url):
+                            response = await client.get(
+                                f"{datanode_url}/blocks/download/{block_id}",
+                                headers=inject(
+                                    {"Range": f"bytes={first}-{last - 1}"},
+                                    peer_url=datanode_url,
+                                ),
+                            )
 
-                        if response.status_code != 200:
+                        if response.status_code == 206:
+                            output_file.write(response.content)
+                        elif response.status_code == 200:
+                            # El DataNode ignoró el rango: recortar el bloque completo
+                            output_file.write(response.content[first:last])
+                        else:
                             print(
                                 f"Error descargando bloque {block_id} de {datanode_url}"
                             )
                             return False
 
-                        # Escribir bloque al archivo de salida
-                        output_file.write(response.content)
-                        print(f"Bloque {block_id} descargado exitosamente")
-
-                print(f"Archivo reconstruido exitosamente: {output_path}")
                 return True
         except Exception as e:
             print(f"Error descargando bloques: {e}")
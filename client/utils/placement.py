@@ -0,0 +1,38 @@
+from typing import Dict, Iterator, List
+
+
+class PlacementPlan:
+    """Plan de ubicación compacto que retorna el NameNode en `/files/upload`.
+
+    Se expande de forma perezosa: el bloque i se calcula al pedirlo, con
+    `datanodes[(start + stride * i) % len(datanodes)]`, así que un archivo
+    de millones de bloques no genera millones de dicts. La tabla
+    `datanodes` se puede reescribir (por ejemplo, para traducir URLs
+    internas a externas) y afecta a todos los bloques.
+    """
+
+    def __init__(self, plan: Dict):
+        self.datanodes: List[str] = list(plan["datanodes"])
+        self.start: int = plan["start"]
+        self.stride: int = plan["stride"]
+        self.num_blocks: int = plan["num_blocks"]
+        self.block_size: int = plan["block_size"]
+        self.last_block_size: int = plan["last_block_size"]
+
+    def __len__(self) -> int:
+        return self.num_blocks
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self.num_blocks):
+            yield self[i]
+
+    def __getitem__(self, i: int) -> Dict:
+        if i < 0:
+            i += self.num_blocks
+        if not 0 <= i < self.num_blocks:
+            raise IndexError("Bloque fuera del plan")
+        return {
+            "block_index": i,
+            "datanode_url": self.datanodes[(self.start + self.stride * i) % len(self.datanodes)],
+            "block_size": self.last_block_size if i == self.num_blocks - 1 else self.block_size,
+        }
@@ -0,0 +1,163 @@
+import json
+import os
+import secrets
+import time
+import zlib
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+SERVICE_NAME = "client"
+# Proceso del visor de trazas (los servicios usan el mismo esquema)
+TRACE_PID = zlib.crc32(SERVICE_NAME.encode()) & 0xFFFF
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """Tramo de una traza del cliente; se usa como context manager.
+
+    Se registra como evento "X" del formato Trace Event de Chrome, el mismo
+    que exportan el NameNode y los DataNodes, de modo que los eventos de
+    todos los componentes se combinan en un único archivo.
+    """
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, args: Dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.args = args
+        self.start = 0.0
+        self._token = None
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.time() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        TraceRecorder.record(self, duration)
+        return False
+
+
+class _NoopSpan:
+    """Tramo vacío cuando no hay una traza activa"""
+
+    trace_id = None
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def start_trace(name: str, enabled: bool = True, **args):
+    """Abre el tramo raíz de una traza nueva (o un tramo vacío si no se traza)"""
+    if not enabled:
+        return NOOP_SPAN
+    return Span(secrets.token_hex(16), None, name, args)
+
+
+def span(name: str, **args):
+    """Abre un tramo hijo del actual; no hace nada fuera de una traza"""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace_id, parent.span_id, name, args)
+
+
+def inject(headers: Optional[Dict] = None, peer_url: Optional[str] = None) -> Dict:
+    """Agrega `traceparent` a las cabeceras de una petición.
+
+    `peer_url` registra el servicio destino, cuyos tramos se descargan
+    al exportar la traza.
+    """
+    headers = dict(headers or {})
+    current = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = f"00-{current.trace_id}-{current.span_id}-01"
+        if peer_url:
+            TraceRecorder.peers.setdefault(current.trace_id, set()).add(peer_url.rstrip("/"))
+    return headers
+
+
+class TraceRecorder:
+    """Eventos de las trazas del cliente y exportación a archivo"""
+
+    events: Dict[str, List[Dict]] = {}
+    peers: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def record(span: Span, duration: float):
+        events = TraceRecorder.events.setdefault(span.trace_id, [
+            {"name": "process_name", "ph": "M", "pid": TRACE_PID, "args": {"name": SERVICE_NAME}}
+        ])
+        events.append({
+            "name": span.name,
+            "cat": SERVICE_NAME,
+            "ph": "X",
+            "ts": round(span.start * 1_000_000),
+            "dur": round(duration * 1_000_000),
+            "pid": TRACE_PID,
+            "tid": 1,
+            "args": dict(span.args, trace_id=span.trace_id, span_id=span.span_id,
+                         parent_id=span.parent_id),
+        })
+
+    @staticmethod
+    async def export(trace_id: str, trace_dir: str) -> Optional[str]:
+        """Combina los tramos propios con los de cada servicio y los guarda.
+
+        El archivo (`trace-<id>.json`, formato Trace Event) se abre en
+        https://ui.perfetto.dev o en chrome://tracing.
+        """
+        events = TraceRecorder.events.pop(trace_id, [])
+        peers = TraceRecorder.peers.pop(trace_id, set())
+        if not events:
+            return None
+
+        # Los servicios solo exponen /debug con su DEBUG_TOKEN
+        headers = {"X-Debug-Token": os.getenv("GRIDDFS_DEBUG_TOKEN", "")}
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            for peer_url in sorted(peers):
+                try:
+                    response = await client.get(
+                        f"{peer_url}/debug/traces/{trace_id}", headers=headers
+                    )
+                except httpx.HTTPError as e:
+                    print(f"Traza: no se pudieron obtener los tramos de {peer_url}: {e}")
+                    continue
+                if response.status_code == 200:
+                    events.extend(response.json()["traceEvents"])
+
+        # Varias URLs pueden apuntar al mismo servicio: cada tramo una sola vez
+        seen = set()
+        unique_events = []
+        for event in events:
+            key = event["args"].get("span_id") or (event["name"], event["pid"])
+            if key not in seen:
+                seen.add(key)
+                unique_events.append(event)
+        events = unique_events
+
+        os.makedirs(trace_dir, exist_ok=True)
+        path = os.path.join(trace_dir, f"trace-{trace_id}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
@@ -0,0 +1,3 @@
+"""
+Código compartido por el NameNode y los DataNodes
+"""
@@ -0,0 +1,16 @@
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+# Secreto que habilita los endpoints /debug; sin definir quedan deshabilitados
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+
+
+async def verify_debug_token(x_debug_token: Optional[str] = Header(None)):
+    """Exige el secreto DEBUG_TOKEN en la cabecera X-Debug-Token"""
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not hmac.compare_digest((x_debug_token or "").encode(), DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid debug token")
@@ -0,0 +1,253 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from .debug_auth import verify_debug_token
+
+# Perfilado bajo demanda (cabecera) o por muestreo; desactivado por defecto
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile").lower().encode()
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))  # porcentaje de peticiones
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")  # cprofile | sample
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))  # segundos
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 50))
+# Las peticiones que superan el umbral se registran siempre, perfiladas o no
+SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", 1.0))  # segundos
+SLOW_REQUEST_HISTORY = int(os.getenv("SLOW_REQUEST_HISTORY", 100))
+
+PROFILE_MODES = ("cprofile", "sample")
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(verify_debug_token)])
+
+
+class StackSampler:
+    """Perfilador estadístico: muestrea la pila del hilo del event loop.
+
+    Un hilo aparte lee la pila cada `interval` segundos y acumula las pilas
+    en formato "folded" (una línea `f1;f2;f3 muestras`), el que consumen
+    flamegraph.pl y speedscope. El costo sobre la petición es casi nulo.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Perfiles guardados en disco, acotados a los más recientes"""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+        self.profiles: "OrderedDict[str, Dict]" = OrderedDict()
+        self.slow_requests: deque = deque(maxlen=SLOW_REQUEST_HISTORY)
+
+    def save(self, entry: Dict, profiler) -> Dict:
+        os.makedirs(self.directory, exist_ok=True)
+        if entry["mode"] == "cprofile":
+            filename = f"{entry['id']}.prof"
+            profiler.dump_stats(os.path.join(self.directory, filename))
+        else:
+            filename = f"{entry['id']}.folded"
+            with open(os.path.join(self.directory, filename), "w", encoding="utf-8") as f:
+                f.write(profiler.folded())
+        entry["filename"] = filename
+        self.profiles[entry["id"]] = entry
+
+        while len(self.profiles) > self.max_files:
+            _, oldest = self.profiles.popitem(last=False)
+            try:
+                os.remove(os.path.join(self.directory, oldest["filename"]))
+            except FileNotFoundError:
+                pass
+        return entry
+
+    def path(self, profile_id: str) -> Optional[str]:
+        entry = self.profiles.get(profile_id)
+        if entry is None:
+            return None
+        return os.path.join(self.directory, entry["filename"])
+
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI que perfila peticiones y registra las lentas.
+
+    Una petición se perfila si trae la cabecera `X-Profile` (su valor elige
+    el modo: `cprofile` o `sample`) o si cae en el porcentaje de muestreo.
+    cProfile y el muestreador observan el hilo del event loop completo, así
+    que solo se perfila una petición a la vez: si hay otra en curso, la
+    nueva se atiende sin perfil. El id del perfil vuelve en `X-Profile-Id`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(router.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        mode = self._requested_mode(scope)
+        profiler = None
+        if mode is not None and not self._active:
+            self._active = True
+            profiler = self._start_profiler(mode)
+        profile_id = uuid.uuid4().hex if profiler is not None else None
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if profile_id is not None:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-profile-id", profile_id.encode())
+                    ]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                await self._stop_profiler(profiler)
+                self._active = False
+            self._record(scope, profile_id, mode, profiler, elapsed, status_code)
+
+    @staticmethod
+    def _requested_mode(scope) -> Optional[str]:
+        if not PROFILING_ENABLED:
+            return None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                value = value.decode().strip().lower()
+                return value if value in PROFILE_MODES else PROFILE_MODE
+        if PROFILE_SAMPLE_RATE and random.random() * 100 < PROFILE_SAMPLE_RATE:
+            return PROFILE_MODE
+        return None
+
+    @staticmethod
+    def _start_profiler(mode: str):
+        if mode == "sample":
+            profiler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    @staticmethod
+    async def _stop_profiler(profiler):
+        if isinstance(profiler, StackSampler):
+            # Esperar al hilo del muestreador sin bloquear el event loop
+            await asyncio.to_thread(profiler.stop)
+        else:
+            profiler.disable()
+
+    @staticmethod
+    def _record(scope, profile_id, mode, profiler, elapsed: float, status_code: int):
+        slow = elapsed >= SLOW_REQUEST_THRESHOLD
+        entry = {
+            "id": profile_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode(),
+            "status": status_code,
+            "duration": round(elapsed, 6),
+            "slow": slow,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+        if profiler is not None:
+            try:
+                profile_store.save(dict(entry, mode=mode), profiler)
+            except OSError as e:
+                print(f"Perfilado: no se pudo guardar el perfil {profile_id}: {e}")
+        if slow:
+            profile_store.slow_requests.append(entry)
+            print(
+                f"Petición lenta: {entry['method']} {entry['path']} "
+                f"{elapsed:.3f}s (estado {status_code}"
+                + (f", perfil {profile_id})" if profile_id else ")")
+            )
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """Lista los perfiles guardados, del más reciente al más antiguo"""
+    return {"profiles": list(reversed(profile_store.profiles.values()))}
+
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, format: str = "raw", sort: str = "cumulative", limit: int = 50):
+    """Descarga un perfil.
+
+    `format=raw` retorna el archivo tal cual (`.prof` para pstats/snakeviz,
+    `.folded` para flamegraphs); `format=text` resume un perfil de cProfile
+    ordenado por `sort`.
+    """
+    path = profile_store.path(profile_id)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+
+    if format == "text" and path.endswith(".prof"):
+        output = io.StringIO()
+        try:
+            pstats.Stats(path, stream=output).sort_stats(sort).print_stats(limit)
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Orden no válido: {sort}")
+        return PlainTextResponse(output.getvalue())
+    return FileResponse(path, filename=os.path.basename(path), media_type="application/octet-stream")
+
+
+@router.get("/slow-requests")
+async def list_slow_requests():
+    """Peticiones recientes que superaron SLOW_REQUEST_THRESHOLD"""
+    return {
+        "threshold": SLOW_REQUEST_THRESHOLD,
+        "requests": list(reversed(profile_store.slow_requests)),
+    }
@@ -0,0 +1,257 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+import secrets
+import time
+import zlib
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from .debug_auth import verify_debug_token
+
+# Trazas distribuidas: el contexto viaja en la cabecera W3C `traceparent`
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0))  # % de peticiones sin contexto
+TRACE_DIR = os.getenv("TRACE_DIR", "")  # si se define, cada traza se exporta a un archivo
+TRACE_MAX_TRACES = int(os.getenv("TRACE_MAX_TRACES", 200))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 10000))  # por traza
+# Por defecto "namenode" en el NameNode y el NODE_ID en cada DataNode
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", os.getenv("NODE_ID", "namenode"))
+
+TRACEPARENT_HEADER = b"traceparent"
+# Proceso del visor de trazas: estable por servicio (en Docker todos son el PID 1)
+TRACE_PID = zlib.crc32(SERVICE_NAME.encode()) & 0xFFFF
+
+router = APIRouter(prefix="/debug", tags=["debug"], dependencies=[Depends(verify_debug_token)])
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_lanes = itertools.count(1)
+
+
+class Span:
+    """Tramo de una traza; se usa como context manager.
+
+    Al cerrarse se registra como evento "X" (duración completa) del formato
+    Trace Event de Chrome, que cargan Perfetto y chrome://tracing. Cada
+    petición usa su propio carril (tid) para que las concurrentes no se
+    solapen en el visor.
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "args", "lane", "start", "_token")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, lane: int, args: Dict):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.args = args
+        self.lane = lane
+        self.start = 0.0
+        self._token = None
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.time() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        trace_collector.record(self, duration)
+        return False
+
+
+class _NoopSpan:
+    """Tramo vacío para el código que corre fuera de una traza"""
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **args):
+    """Abre un tramo hijo del actual; no hace nada si la petición no se traza"""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace_id, parent.span_id, name, parent.lane, args)
+
+
+def current_traceparent() -> Optional[str]:
+    """Cabecera `traceparent` para propagar la traza actual a otro servicio"""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return f"00-{current.trace_id}-{current.span_id}-01"
+
+
+def parse_traceparent(value: str):
+    """Retorna (trace_id, span_id, muestreada) o None si la cabecera no es válida"""
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = int(parts[3], 16) & 1 == 1
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class TraceCollector:
+    """Eventos de las trazas recientes, en memoria y opcionalmente en disco"""
+
+    def __init__(self, max_traces: int, max_spans: int, directory: str):
+        self.max_traces = max_traces
+        self.max_spans = max_spans
+        self.directory = directory
+        self.traces: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._unflushed: Dict[str, List[Dict]] = {}
+
+    def record(self, span: Span, duration: float):
+        events = self.traces.get(span.trace_id)
+        if events is None:
+            events = self.traces[span.trace_id] = [self._process_name_event()]
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+        if len(events) >= self.max_spans:
+            return
+
+        event = {
+            "name": span.name,
+            "cat": SERVICE_NAME,
+            "ph": "X",
+            "ts": round(span.start * 1_000_000),
+            "dur": round(duration * 1_000_000),
+            "pid": TRACE_PID,
+            "tid": span.lane,
+            "args": dict(span.args, trace_id=span.trace_id, span_id=span.span_id,
+                         parent_id=span.parent_id),
+        }
+        events.append(event)
+        if self.directory:
+            self._unflushed.setdefault(span.trace_id, []).append(event)
+
+    def get(self, trace_id: str) -> Optional[List[Dict]]:
+        return self.traces.get(trace_id)
+
+    async def flush(self, trace_id: str):
+        """Agrega al archivo de la traza los eventos aún no exportados"""
+        events = self._unflushed.pop(trace_id, None)
+        if events:
+            await asyncio.to_thread(self._append_file, trace_id, events)
+
+    def _append_file(self, trace_id: str, events: List[Dict]):
+        # Formato "JSON Array" de Trace Event: el "]" final es opcional, así que
+        # el archivo crece agregando eventos y se puede abrir en cualquier momento
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{SERVICE_NAME}-{trace_id}.json")
+        new_file = not os.path.exists(path)
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                if new_file:
+                    f.write("[\n" + json.dumps(self._process_name_event()) + ",\n")
+                f.writelines(json.dumps(event) + ",\n" for event in events)
+        except OSError as e:
+            print(f"Trazas: no se pudo exportar la traza {trace_id}: {e}")
+
+    @staticmethod
+    def _process_name_event() -> Dict:
+        return {"name": "process_name", "ph": "M", "pid": TRACE_PID, "args": {"name": SERVICE_NAME}}
+
+
+trace_collector = TraceCollector(TRACE_MAX_TRACES, TRACE_MAX_SPANS, TRACE_DIR)
+
+
+class TracingMiddleware:
+    """Middleware ASGI que abre un tramo por petición trazada.
+
+    Se traza una petición que llega con `traceparent` muestreado (la abrió
+    un cliente o servicio trazado) o, sin contexto, con probabilidad
+    TRACE_SAMPLE_RATE. La respuesta devuelve el id en `X-Trace-Id`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED or scope["path"].startswith(router.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        root = self._start_span(scope)
+        if root is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set(status=message["status"])
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-trace-id", root.trace_id.encode())
+                ]
+            await send(message)
+
+        try:
+            with root:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            await trace_collector.flush(root.trace_id)
+
+    @staticmethod
+    def _start_span(scope) -> Optional[Span]:
+        context = None
+        for name, value in scope["headers"]:
+            if name == TRACEPARENT_HEADER:
+                context = parse_traceparent(value.decode("latin-1"))
+                break
+
+        if context is not None:
+            trace_id, parent_id, sampled = context
+            if not sampled:
+                return None
+        elif TRACE_SAMPLE_RATE and random.random() * 100 < TRACE_SAMPLE_RATE:
+            trace_id, parent_id = secrets.token_hex(16), None
+        else:
+            return None
+
+        return Span(
+            trace_id,
+            parent_id,
+            f"{scope['method']} {scope['path']}",
+            next(_lanes),
+            {"service": SERVICE_NAME},
+        )
+
+
+@router.get("/traces")
+async def list_traces():
+    """Ids de las trazas recientes, de la más reciente a la más antigua"""
+    return {"traces": list(reversed(trace_collector.traces.keys()))}
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """Eventos de una traza en formato Trace Event (Perfetto, chrome://tracing)"""
+    events = trace_collector.get(trace_id)
+    if events is None:
+        raise HTTPException(status_code=404, detail="Traza no encontrada")
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,160 @@
+import os
+import struct
+from functools import partial
+from typing import AsyncIterator, List, NamedTuple, Optional
+
+import anyio
+
+from ..metrics import BLOCK_OPERATIONS, BYTES_READ
+from ..storage.block_storage import open_block_file
+from .block_response import READ_CHUNK_SIZE
+
+# Formato de los lotes de bloques (subida y descarga múltiple). Cada bloque
+# es un encabezado, el id en UTF-8 y `size` bytes de datos:
+#
+#     u16 largo del id, u8 estado, u64 tamaño, 32 bytes checksum SHA-256
+#
+# En la subida el estado es siempre OK; en la descarga, un bloque que no se
+# pudo leer va con su estado y sin datos.
+MEDIA_TYPE = "application/vnd.griddfs.blocks"
+FRAME_HEADER = struct.Struct("<HBQ32s")
+
+OK = 0
+NOT_FOUND = 1
+ERROR = 2
+
+
+class Frame(NamedTuple):
+    block_id: str
+    status: int
+    size: int
+    checksum: str
+
+
+def encode_header(block_id: str, status: int, size: int, checksum: Optional[str]) -> bytes:
+    raw_id = block_id.encode()
+    raw_checksum = bytes.fromhex(checksum) if checksum else bytes(32)
+    return FRAME_HEADER.pack(len(raw_id), status, size, raw_checksum) + raw_id
+
+
+class FrameReader:
+    """Lee bloques de un cuerpo en formato de lote a medida que llega.
+
+    Lanza EOFError si el cuerpo termina a mitad de un bloque.
+    """
+
+    def __init__(self, stream: AsyncIterator[bytes]):
+        self.stream = stream.__aiter__()
+        self.buffer = bytearray()
+        self.remaining = 0  # Bytes de datos del bloque actual sin leer
+
+    async def _fill(self, size: int) -> bool:
+        while len(self.buffer) < size:
+            try:
+                self.buffer += await self.stream.__anext__()
+            except StopAsyncIteration:
+                return False
+        return True
+
+    async def _take(self, size: int) -> bytes:
+        if not await self._fill(size):
+            raise EOFError("Lote truncado")
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    async def next_frame(self) -> Optional[Frame]:
+        """Encabezado del siguiente bloque; None al final del cuerpo"""
+        await self.discard()
+        if not self.buffer and not await self._fill(1):
+            return None
+        id_length, status, size, checksum = FRAME_HEADER.unpack(await self._take(FRAME_HEADER.size))
+        # Un id que no es UTF-8 queda con caracteres de reemplazo: el llamador lo rechaza al validarlo
+        block_id = (await self._take(id_length)).decode(errors="replace")
+        self.remaining = size
+        return Frame(block_id, status, size, checksum.hex())
+
+    async def read(self) -> bytes:
+        """Datos completos del bloque actual"""
+        data = await self._take(self.remaining)
+        self.remaining = 0
+        return data
+
+    async def chunks(self, size: int) -> AsyncIterator[bytes]:
+        """Datos del bloque actual en fragmentos de hasta `size` bytes"""
+        while self.remaining:
+            await self._fill(1)
+            if not self.buffer:
+                raise EOFError("Lote truncado")
+            length = min(size, self.remaining, len(self.buffer))
+            if length == len(self.buffer):
+                chunk = bytes(self.buffer)
+                self.buffer.clear()
+            else:
+                chunk = bytes(self.buffer[:length])
+                del self.buffer[:length]
+            self.remaining -= length
+            yield chunk
+
+    async def discard(self):
+        """Descarta lo que quede del bloque actual (p. ej. tras un error al guardarlo)"""
+        async for _ in self.chunks(READ_CHUNK_SIZE):
+            pass
+
+
+async def stream_blocks(block_storage, block_ids: List[str]) -> AsyncIterator[bytes]:
+    """Cuerpo de una descarga múltiple: los bloques en el orden pedido.
+
+    Los bloques en caché salen de memoria; los chicos se leen completos y
+    se agrupan en fragmentos de READ_CHUNK_SIZE, así que muchos bloques
+    de pocos KB no cuestan un envío cada uno; los grandes se envían por
+    fragmentos leídos con `os.pread`.
+    """
+    buffer = bytearray()
+    for block_id in block_ids:
+        location = block_storage.get_block_location(block_id)
+        if location is None:
+            buffer += encode_header(block_id, NOT_FOUND, 0, None)
+            continue
+
+        data = await block_storage.read_cached(location, block_id)
+        if data is None and location.size <= READ_CHUNK_SIZE:
+            data = await block_storage.storage.retrieve_block(block_id)
+            if data is None:
+                buffer += encode_header(block_id, ERROR, 0, None)
+                continue
+        if data is not None:
+            buffer += encode_header(block_id, OK, len(data), location.checksum)
+            buffer += data
+            if len(buffer) >= READ_CHUNK_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+            continue
+
+        try:
+            fd, location = await open_block_file(location, partial(block_storage.get_block_location, block_id))
+        except FileNotFoundError:
+            # Eliminado después de consultar los metadatos
+            BLOCK_OPERATIONS.labels("retrieve", "not_found").inc()
+            buffer += encode_header(block_id, NOT_FOUND, 0, None)
+            continue
+        try:
+            buffer += encode_header(block_id, OK, location.size, location.checksum)
+            yield bytes(buffer)
+            buffer.clear()
+            position, end = location.offset, location.offset + location.size
+            while position < end:
+                chunk = await anyio.to_thread.run_sync(
+                    os.pread, fd, min(READ_CHUNK_SIZE, end - position), position
+                )
+                if not chunk:
+                    # El encabezado ya salió: no queda más que cortar la respuesta
+                    raise RuntimeError("Bloque truncado durante la lectura")
+                position += len(chunk)
+                yield chunk
+            BYTES_READ.inc(location.size)
+            BLOCK_OPERATIONS.labels("retrieve", "ok").inc()
+        finally:
+            os.close(fd)
+    if buffer:
+        yield bytes(buffer)
@@ -0,0 +1,205 @@
+import os
+from typing import Callable, Mapping, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+
+from ..metrics import BLOCK_OPERATIONS, BYTES_READ, CHUNK_CHECKSUM_ERRORS
+from ..storage.block_storage import BlockLocation, open_block_file
+from ..storage.chunk_checksums import ChunkChecksums, read_chunk_checksums
+
+# Tamaño de los fragmentos leídos del disco cuando el servidor no ofrece zero-copy
+READ_CHUNK_SIZE = int(os.getenv("READ_CHUNK_SIZE", 256 * 1024))
+# Verificar los CRC de fragmento de las lecturas por rango (206)
+VERIFY_RANGE_READS = os.getenv("VERIFY_RANGE_READS", "true").lower() == "true"
+
+# Extensión ASGI con la que el servidor envía el archivo con sendfile
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class BlockFileResponse(Response):
+    """Respuesta que sirve un bloque directamente desde su archivo.
+
+    El bloque son `size` bytes del archivo a partir de `offset`: un archivo
+    propio o un tramo de un segmento compartido. No carga el bloque en
+    memoria: si el servidor ASGI ofrece la extensión
+    `http.response.zerocopysend`, el kernel copia el archivo al socket con
+    `sendfile`; si no, se envía por fragmentos de READ_CHUNK_SIZE leídos con
+    `os.pread` en un hilo, así que cada lector ocupa un solo fragmento.
+
+    Con `data` (el bloque ya en la caché) se sirve desde memoria, con la
+    misma semántica. `relocate` vuelve a resolver la ubicación si el
+    archivo desapareció antes de abrirlo (segmento compactado).
+
+    El ETag es el checksum SHA-256 del bloque (los bloques son inmutables),
+    con soporte de `If-None-Match` (304), `Range` de un solo rango (206 o
+    416) e `If-Range`. Con varios rangos se sirve el bloque completo, como
+    permite el RFC 9110.
+
+    Un rango leído del disco se verifica con los checksums de fragmento del
+    bloque: se leen solo los fragmentos que toca y, si alguno no coincide,
+    se corta la respuesta en lugar de enviar datos corruptos. El bloque
+    completo no se verifica aquí; el cliente compara su SHA-256.
+    """
+
+    media_type = "application/octet-stream"
+
+    def __init__(self, location: BlockLocation, request_headers: Mapping[str, str],
+                 method: str = "GET", headers: Optional[Mapping[str, str]] = None,
+                 data: Optional[bytes] = None,
+                 relocate: Optional[Callable[[], Optional[BlockLocation]]] = None):
+        self.location = location
+        self.relocate = relocate
+        self.data = data
+        self.etag = f'"{location.checksum}"'
+        self.request_headers = request_headers
+        self.send_header_only = method.upper() == "HEAD"
+        self.background = None
+        self.status_code = 200
+        self.init_headers(dict(headers or {}, **{"accept-ranges": "bytes", "etag": self.etag}))
+
+    def _not_modified(self) -> bool:
+        if_none_match = self.request_headers.get("if-none-match")
+        if not if_none_match:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags
+
+    def _requested_range(self, size: int) -> Optional[Tuple[int, int]]:
+        """Rango (inicio, fin exclusivo) pedido; None si se sirve el bloque completo.
+
+        Lanza ValueError si el rango no es satisfacible.
+        """
+        range_header = self.request_headers.get("range")
+        if not range_header:
+            return None
+        if_range = self.request_headers.get("if-range")
+        if if_range is not None and if_range.strip() != self.etag:
+            return None
+
+        unit, _, ranges = range_header.partition("=")
+        if unit.strip().lower() != "bytes" or "," in ranges:
+            return None
+        first, _, last = ranges.strip().partition("-")
+        try:
+            if first:
+                start = int(first)
+                end = int(last) + 1 if last else size
+            else:
+                # Sufijo: los últimos N bytes
+                start = max(size - int(last), 0)
+                end = size
+        except ValueError:
+            return None
+        if start < 0 or start >= size or end <= start:
+            raise ValueError("Rango no satisfacible")
+        return start, min(end, size)
+
+    async def __call__(self, scope, receive, send):
+        fd = None
+        if self.data is None:
+            try:
+                fd, self.location = await open_block_file(self.location, self.relocate)
+            except FileNotFoundError:
+                # El bloque se eliminó después de consultar los metadatos
+                BLOCK_OPERATIONS.labels("retrieve", "not_found").inc()
+                await Response(status_code=404)(scope, receive, send)
+                return
+
+        try:
+            size = self.location.size
+            start, end = 0, size
+            if self._not_modified():
+                self.status_code = 304
+                start = end = 0
+            else:
+                try:
+                    requested = self._requested_range(size)
+                except ValueError:
+                    self.status_code = 416
+                    self.headers["content-range"] = f"bytes */{size}"
+                    start = end = 0
+                else:
+                    if requested is not None:
+                        start, end = requested
+                        self.status_code = 206
+                        self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            if self.status_code != 304:
+                self.headers["content-length"] = str(end - start)
+                self.headers["content-type"] = self.media_type
+
+            checksums = None
+            if self.status_code == 206 and fd is not None and VERIFY_RANGE_READS and not self.send_header_only:
+                checksums = await anyio.to_thread.run_sync(read_chunk_checksums, fd, self.location.offset, size)
+
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            if self.send_header_only or start == end:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif self.data is not None:
+                body = self.data if end - start == len(self.data) else self.data[start:end]
+                await send({"type": "http.response.body", "body": body, "more_body": False})
+            elif checksums is not None:
+                await self._send_verified(fd, checksums, start, end, send)
+            elif ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": fd,
+                    "offset": self.location.offset + start,
+                    "count": end - start,
+                    "more_body": False,
+                })
+            else:
+                await self._send_chunks(fd, self.location.offset + start, self.location.offset + end, send)
+            if fd is not None and not self.send_header_only:
+                BYTES_READ.inc(end - start)
+            BLOCK_OPERATIONS.labels("retrieve", "ok").inc()
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    async def _send_verified(self, fd: int, checksums: ChunkChecksums, start: int, end: int, send):
+        """Envía [start, end) leyendo fragmentos completos y verificando su CRC"""
+        chunk_size = checksums.chunk_size
+        chunks = checksums.chunk_span(start, end)
+        # Lecturas de varios fragmentos completos, de hasta READ_CHUNK_SIZE
+        per_read = max(READ_CHUNK_SIZE // chunk_size, 1)
+        for first in range(chunks.start, chunks.stop, per_read):
+            chunk_start = first * chunk_size
+            chunk_end = min(min(first + per_read, chunks.stop) * chunk_size, self.location.size)
+            data = await anyio.to_thread.run_sync(
+                os.pread, fd, chunk_end - chunk_start, self.location.offset + chunk_start
+            )
+            if len(data) < chunk_end - chunk_start:
+                raise RuntimeError("Bloque truncado durante la lectura")
+            corrupt = checksums.find_corrupt(data, first)
+            if corrupt:
+                CHUNK_CHECKSUM_ERRORS.labels("read").inc(len(corrupt))
+                print(f"Fragmentos corruptos {corrupt} en {self.location.path} (offset {self.location.offset})")
+                raise RuntimeError("Checksum de fragmento inválido durante la lectura")
+            body = data[max(start - chunk_start, 0):min(end, chunk_end) - chunk_start]
+            await send({
+                "type": "http.response.body",
+                "body": body,
+                "more_body": chunk_end < end,
+            })
+
+    @staticmethod
+    async def _send_chunks(fd: int, start: int, end: int, send):
+        position = start
+        while position < end:
+            chunk = await anyio.to_thread.run_sync(
+                os.pread, fd, min(READ_CHUNK_SIZE, end - position), position
+            )
+            if not chunk:
+                # El archivo es más corto de lo anunciado: no se puede completar
+                raise RuntimeError("Bloque truncado durante la lectura")
+            position += len(chunk)
+            await send({
+                "type": "http.response.body",
+                "body": chunk,
+                "more_body": position < end,
+            })
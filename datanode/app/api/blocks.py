@@ -1,17 +1,42 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, UploadFile, File, Form
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-import io
-import hashlib
-from ..storage.block_storage import BlockStorage
+from typing import AsyncIterator, List, Optional
+import asyncio
+from functools import partial
+from common.debug_auth import verify_debug_token
+from ..metrics import BYTES_READ, CHUNK_CHECKSUM_ERRORS
+from ..services.block_scrubber import BlockScrubber
+from ..storage.block_cache import CachedBlockStorage
+from ..storage.block_ids import is_valid_block_id
+from ..storage.block_storage import WRITE_CHUNK_SIZE, BlockStorage
+from ..storage.chunk_checksums import ChunkHasher
+from ..storage.segment_storage import SegmentBlockStorage
+from . import block_frames
+from .block_response import BlockFileResponse
 import os
 
 router = APIRouter(prefix="/blocks", tags=["blocks"])
 
-# Inicializar el almacenamiento de bloques
+# Inicializar el almacenamiento de bloques: un archivo por bloque (files) o
+# segmentos de log para bloques pequeños (segments)
 storage_path = os.getenv("STORAGE_PATH", "/app/storage/blocks")
-block_storage = BlockStorage(storage_path)
+STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "files")
+if STORAGE_ENGINE == "segments":
+    backend_storage = SegmentBlockStorage(storage_path)
+else:
+    backend_storage = BlockStorage(storage_path)
+# Caché de bloques calientes delante de las lecturas
+block_storage = CachedBlockStorage(backend_storage)
+
+# Paginación de /blocks/list
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", 1000))
+LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", 10000))
+
+# Operaciones por lote: bloques por petición y bytes de bloques chicos que
+# se guardan en paralelo dentro de una subida múltiple
+BATCH_MAX_BLOCKS = int(os.getenv("BATCH_MAX_BLOCKS", 10000))
+BATCH_INFLIGHT_BYTES = int(os.getenv("BATCH_INFLIGHT_BYTES", 64 * 1024 * 1024))
 
 # Modelos Pydantic
 class BlockInfo(BaseModel):
@@ -20,12 +45,111 @@ class BlockInfo(BaseModel):
     checksum: str
     created_at: str
 
+class BlockListing(BaseModel):
+    blocks: List[BlockInfo]
+    next_cursor: Optional[str] = None
+
+class ChunkChecksumInfo(BaseModel):
+    block_id: str
+    chunk_size: int
+    checksums: List[int]
+
 class StorageInfo(BaseModel):
     total_size: int
     block_count: int
     storage_path: str
 
+class CacheInfo(BaseModel):
+    capacity: int
+    max_block_size: int
+    size: int
+    blocks: int
+    pinned_blocks: int
+    pinned_size: int
+    max_pinned_size: int
+
+class CacheWarmRequest(BaseModel):
+    block_ids: List[str]
+    pin: bool = False
+
+class CacheWarmResult(BaseModel):
+    cached: List[str]
+    missing: List[str]
+    skipped: List[str]
+
+class CacheUnpinRequest(BaseModel):
+    block_ids: List[str]
+
+class BatchRequest(BaseModel):
+    block_ids: List[str]
+
+class BatchBlockResult(BaseModel):
+    block_id: str
+    status: str
+    size: Optional[int] = None
+
+class BatchResults(BaseModel):
+    results: List[BatchBlockResult]
+
+class BatchBlockInfo(BaseModel):
+    block_id: str
+    status: str
+    size: Optional[int] = None
+    checksum: Optional[str] = None
+    created_at: Optional[str] = None
+
+class BatchInfoResults(BaseModel):
+    results: List[BatchBlockInfo]
+
+async def _coalesce(stream: AsyncIterator[bytes], size: int) -> AsyncIterator[bytes]:
+    """Agrupa los fragmentos del cuerpo (de pocos KB) en fragmentos de `size` bytes"""
+    buffer = bytearray()
+    async for chunk in stream:
+        buffer += chunk
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+def _check_block_ids(*block_ids: str):
+    """Rechaza con 400 los ids que no cumplen el formato (ver block_ids)"""
+    for block_id in block_ids:
+        if not is_valid_block_id(block_id):
+            raise HTTPException(status_code=400, detail=f"Invalid block id: {block_id!r}")
+
 # Endpoints
+@router.put("/{block_id}")
+async def put_block(
+    block_id: str,
+    request: Request,
+    x_block_checksum: str = Header(...)
+):
+    """Sube un bloque enviado como cuerpo `application/octet-stream`.
+
+    El checksum va en la cabecera `X-Block-Checksum`. El cuerpo se escribe
+    a medida que llega, sin el parseo multipart ni el archivo temporal
+    intermedio de `POST /blocks/upload`.
+    """
+    _check_block_ids(block_id)
+    try:
+        size = await block_storage.store_block_stream(
+            block_id, _coalesce(request.stream(), WRITE_CHUNK_SIZE), x_block_checksum
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error uploading block: {str(e)}")
+
+    if size is None:
+        raise HTTPException(status_code=400, detail="Failed to store block: checksum mismatch")
+    return {
+        "message": "Block uploaded successfully",
+        "block_id": block_id,
+        "size": size
+    }
+
 @router.post("/upload")
 async def upload_block(
     block_id: str = Form(...),
@@ -33,50 +157,166 @@ async def upload_block(
     file: UploadFile = File(...)
 ):
     """Sube un bloque al DataNode"""
+    _check_block_ids(block_id)
     try:
-        # Leer el contenido del archivo
-        data = await file.read()
-        
-        # Almacenar el bloque
-        success = await block_storage.store_block(block_id, data, checksum)
-        
-        if success:
-            return {
-                "message": "Block uploaded successfully",
-                "block_id": block_id,
-                "size": len(data)
-            }
-        else:
-            raise HTTPException(status_code=400, detail="Failed to store block")
-    
+        # Copiar el contenido por fragmentos, sin cargar el bloque en memoria
+        async def chunks():
+            while chunk := await file.read(WRITE_CHUNK_SIZE):
+                yield chunk
+
+        size = await block_storage.store_block_stream(block_id, chunks(), checksum)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading block: {str(e)}")
 
-@router.get("/download/{block_id}")
-async def download_block(block_id: str):
-    """Descarga un bloque del DataNode"""
+    if size is None:
+        raise HTTPException(status_code=400, detail="Failed to store block: checksum mismatch")
+    return {
+        "message": "Block uploaded successfully",
+        "block_id": block_id,
+        "size": size
+    }
+
+def _check_batch_size(count: int):
+    if count > BATCH_MAX_BLOCKS:
+        raise HTTPException(status_code=413, detail=f"Too many blocks in batch (max {BATCH_MAX_BLOCKS})")
+
+async def _store_result(block_id: str, store) -> BatchBlockResult:
     try:
-        # Recuperar el bloque
-        data = await block_storage.retrieve_block(block_id)
-        
-        if data is None:
-            raise HTTPException(status_code=404, detail="Block not found")
-        
-        # Crear respuesta de streaming
-        return StreamingResponse(
-            io.BytesIO(data),
-            media_type="application/octet-stream",
-            headers={"Content-Disposition": f"attachment; filename={block_id}.block"}
-        )
-    
+        size = await store
+    except Exception as e:
+        print(f"Error guardando el bloque {block_id} del lote: {e}")
+        return BatchBlockResult(block_id=block_id, status="error")
+    if size is None:
+        return BatchBlockResult(block_id=block_id, status="checksum_mismatch")
+    return BatchBlockResult(block_id=block_id, status="ok", size=size)
+
+@router.post("/batch/upload", response_model=BatchResults)
+async def batch_upload(request: Request):
+    """Sube varios bloques en un solo cuerpo `application/vnd.griddfs.blocks`.
+
+    Los bloques chicos se guardan en paralelo (hasta BATCH_INFLIGHT_BYTES en
+    vuelo), así que comparten los fsync del almacenamiento; los que superan
+    WRITE_CHUNK_SIZE se escriben a medida que llegan. Retorna el estado de
+    cada bloque, en el orden recibido; un bloque con id inválido se
+    descarta con estado `invalid_id`.
+    """
+    reader = block_frames.FrameReader(request.stream())
+    results: List[Optional[BatchBlockResult]] = []
+    pending = []
+    inflight = 0
+
+    async def drain():
+        nonlocal pending, inflight
+        for position, task in pending:
+            results[position] = await task
+        pending, inflight = [], 0
+
+    try:
+        while (frame := await reader.next_frame()) is not None:
+            _check_batch_size(len(results) + 1)
+            if not is_valid_block_id(frame.block_id):
+                # Sus datos se saltan al leer el siguiente encabezado
+                results.append(BatchBlockResult(block_id=frame.block_id, status="invalid_id"))
+                continue
+            results.append(None)
+            if frame.size <= WRITE_CHUNK_SIZE:
+                data = await reader.read()
+                store = block_storage.store_block_stream(frame.block_id, _single_chunk(data), frame.checksum)
+                pending.append((len(results) - 1, asyncio.create_task(_store_result(frame.block_id, store))))
+                inflight += frame.size
+                if inflight >= BATCH_INFLIGHT_BYTES:
+                    await drain()
+            else:
+                await drain()
+                results[-1] = await _store_result(
+                    frame.block_id,
+                    block_storage.store_block_stream(
+                        frame.block_id, reader.chunks(WRITE_CHUNK_SIZE), frame.checksum
+                    ),
+                )
+    except EOFError:
+        await drain()
+        raise HTTPException(status_code=400, detail="Truncated batch body")
     except HTTPException:
+        await drain()
         raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error downloading block: {str(e)}")
+    await drain()
+    return BatchResults(results=results)
+
+@router.post("/batch/download")
+async def batch_download(request: BatchRequest):
+    """Descarga varios bloques en una sola respuesta `application/vnd.griddfs.blocks`.
+
+    Cada bloque lleva su estado: los que no existen van sin datos.
+    """
+    _check_batch_size(len(request.block_ids))
+    _check_block_ids(*request.block_ids)
+    return StreamingResponse(
+        block_frames.stream_blocks(block_storage, request.block_ids),
+        media_type=block_frames.MEDIA_TYPE,
+    )
+
+@router.post("/batch/delete", response_model=BatchResults)
+async def batch_delete(request: BatchRequest):
+    """Elimina varios bloques; los borrados comparten los fsync del índice"""
+    _check_batch_size(len(request.block_ids))
+    _check_block_ids(*request.block_ids)
+    seen = set()
+
+    async def delete(block_id: str) -> BatchBlockResult:
+        # Un id repetido en el lote cuenta como ya eliminado
+        if block_id in seen or await block_storage.get_block_info(block_id) is None:
+            return BatchBlockResult(block_id=block_id, status="not_found")
+        seen.add(block_id)
+        try:
+            deleted = await block_storage.delete_block(block_id)
+        except Exception as e:
+            print(f"Error eliminando el bloque {block_id} del lote: {e}")
+            deleted = False
+        return BatchBlockResult(block_id=block_id, status="deleted" if deleted else "error")
+
+    results = await asyncio.gather(*(delete(block_id) for block_id in request.block_ids))
+    return BatchResults(results=results)
+
+@router.post("/batch/info", response_model=BatchInfoResults)
+async def batch_info(request: BatchRequest):
+    """Obtiene la información de varios bloques"""
+    _check_batch_size(len(request.block_ids))
+    _check_block_ids(*request.block_ids)
+    results = []
+    for block_id in request.block_ids:
+        info = await block_storage.get_block_info(block_id)
+        if info is None:
+            results.append(BatchBlockInfo(block_id=block_id, status="not_found"))
+        else:
+            results.append(BatchBlockInfo(status="ok", **info))
+    return BatchInfoResults(results=results)
+
+@router.api_route("/download/{block_id}", methods=["GET", "HEAD"])
+async def download_block(block_id: str, request: Request):
+    """Descarga un bloque (o un rango con `Range`) desde la caché o desde su archivo"""
+    _check_block_ids(block_id)
+    location = block_storage.get_block_location(block_id)
+    if location is None:
+        raise HTTPException(status_code=404, detail="Block not found")
+
+    data = None
+    if request.method == "GET":
+        data = await block_storage.read_cached(location, block_id)
+
+    return BlockFileResponse(
+        location,
+        request.headers,
+        method=request.method,
+        headers={"Content-Disposition": f"attachment; filename={block_id}.block"},
+        data=data,
+        relocate=partial(block_storage.get_block_location, block_id),
+    )
 
 @router.delete("/{block_id}")
 async def delete_block(block_id: str):
     """Elimina un bloque del DataNode"""
+    _check_block_ids(block_id)
     try:
         success = await block_storage.delete_block(block_id)
         
@@ -90,9 +330,21 @@ async def delete_block(block_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting block: {str(e)}")
 
+# Antes que /{block_id}/info, que de lo contrario la captura con block_id="storage"
+@router.get("/storage/info", response_model=StorageInfo)
+async def get_storage_info():
+    """Obtiene información del almacenamiento"""
+    try:
+        info = block_storage.get_storage_usage()
+        return StorageInfo(**info)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting storage info: {str(e)}")
+
 @router.get("/{block_id}/info", response_model=BlockInfo)
 async def get_block_info(block_id: str):
     """Obtiene información de un bloque"""
+    _check_block_ids(block_id)
     try:
         info = await block_storage.get_block_info(block_id)
         
@@ -116,40 +368,137 @@ async def list_blocks():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing blocks: {str(e)}")
 
-@router.get("/storage/info", response_model=StorageInfo)
-async def get_storage_info():
-    """Obtiene información del almacenamiento"""
+@router.get("/list/page", response_model=BlockListing)
+async def list_blocks_page(
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """Lista una página de los bloques almacenados, ordenados por id.
+
+    `next_cursor` (el id del último bloque de la página) pide la siguiente.
+    """
     try:
-        info = block_storage.get_storage_usage()
-        return StorageInfo(**info)
+        blocks = await block_storage.list_blocks(limit, cursor)
+        next_cursor = blocks[-1]["block_id"] if len(blocks) == limit else None
+        return BlockListing(blocks=[BlockInfo(**block) for block in blocks], next_cursor=next_cursor)
     
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting storage info: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error listing blocks: {str(e)}")
+
+@router.get("/{block_id}/checksums", response_model=ChunkChecksumInfo)
+async def get_chunk_checksums(block_id: str):
+    """Obtiene los checksums CRC32 de los fragmentos de un bloque"""
+    _check_block_ids(block_id)
+    if backend_storage.get_block_location(block_id) is None:
+        raise HTTPException(status_code=404, detail="Block not found")
+    checksums = await backend_storage.get_chunk_checksums(block_id)
+    if checksums is None:
+        raise HTTPException(status_code=404, detail="Block has no chunk checksums")
+    return ChunkChecksumInfo(block_id=block_id, chunk_size=checksums.chunk_size, checksums=list(checksums.crcs))
 
 @router.post("/verify/{block_id}")
-async def verify_block(block_id: str, expected_checksum: str):
-    """Verifica la integridad de un bloque"""
+async def verify_block(
+    block_id: str,
+    expected_checksum: Optional[str] = None,
+    offset: Optional[int] = Query(None, ge=0),
+    length: Optional[int] = Query(None, ge=1),
+):
+    """Verifica la integridad de un bloque leyéndolo del disco por fragmentos.
+
+    Sin `expected_checksum` se compara con el checksum guardado. Con
+    `offset`/`length` se verifica solo ese rango con los checksums de
+    fragmento (se leen únicamente los fragmentos que toca); el bloque
+    completo también indica qué fragmentos están dañados.
+    """
+    _check_block_ids(block_id)
+    # Del almacenamiento (no de la caché): se verifica lo almacenado
+    location = backend_storage.get_block_location(block_id)
+    if location is None:
+        raise HTTPException(status_code=404, detail="Block not found")
+    expected_checksum = expected_checksum or location.checksum
+    ranged = offset is not None or length is not None
+    start = offset or 0
+    end = min(start + length, location.size) if length is not None else location.size
+    if ranged and start >= location.size:
+        raise HTTPException(status_code=416, detail="Range outside block")
+
+    relocate = partial(backend_storage.get_block_location, block_id)
     try:
-        # Recuperar el bloque
-        data = await block_storage.retrieve_block(block_id)
-        
-        if data is None:
-            raise HTTPException(status_code=404, detail="Block not found")
-        
-        # Calcular checksum
-        calculated_checksum = hashlib.sha256(data).hexdigest()
-        
-        # Verificar
-        is_valid = calculated_checksum == expected_checksum
-        
-        return {
-            "block_id": block_id,
-            "is_valid": is_valid,
-            "expected_checksum": expected_checksum,
-            "calculated_checksum": calculated_checksum
-        }
-    
-    except HTTPException:
-        raise
+        checksums = await backend_storage.get_chunk_checksums(block_id)
+        if ranged and checksums is not None:
+            corrupt_chunks = await BlockScrubber.verify_range(location, checksums, start, end, relocate)
+            BYTES_READ.inc(end - start)
+            if corrupt_chunks:
+                CHUNK_CHECKSUM_ERRORS.labels("verify").inc(len(corrupt_chunks))
+            return {
+                "block_id": block_id,
+                "is_valid": not corrupt_chunks and expected_checksum == location.checksum,
+                "offset": start,
+                "length": end - start,
+                "chunk_size": checksums.chunk_size,
+                "corrupt_chunks": corrupt_chunks,
+            }
+
+        # Bloque completo (o sin checksums de fragmento: solo queda el SHA-256)
+        chunk_hasher = ChunkHasher(checksums.chunk_size) if checksums is not None else None
+        calculated_checksum = await BlockScrubber.hash_block(location, chunk_hasher=chunk_hasher, relocate=relocate)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Block not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error verifying block: {str(e)}")
+    BYTES_READ.inc(location.size)
+
+    # Verificar
+    is_valid = calculated_checksum == expected_checksum
+    corrupt_chunks = None
+    if chunk_hasher is not None:
+        corrupt_chunks = checksums.mismatches(chunk_hasher.finish())
+        if corrupt_chunks:
+            CHUNK_CHECKSUM_ERRORS.labels("verify").inc(len(corrupt_chunks))
+
+    return {
+        "block_id": block_id,
+        "is_valid": is_valid,
+        "expected_checksum": expected_checksum,
+        "calculated_checksum": calculated_checksum,
+        "corrupt_chunks": corrupt_chunks,
+    }
+
+@router.get("/scrub")
+async def get_scrub_status(request: Request):
+    """Estado del verificador de bloques en segundo plano y bloques corruptos detectados"""
+    return request.app.state.block_scrubber.get_status()
+
+@router.post("/scrub")
+async def start_scrub(request: Request):
+    """Adelanta la próxima pasada del verificador de bloques"""
+    if not request.app.state.block_scrubber.trigger():
+        raise HTTPException(status_code=409, detail="Block scrubber is disabled")
+    return {"message": "Scrub scheduled"}
+
+@router.get("/cache", response_model=CacheInfo)
+async def get_cache_info():
+    """Obtiene el estado de la caché de bloques"""
+    return CacheInfo(**block_storage.get_cache_info())
+
+@router.post("/cache/warm", response_model=CacheWarmResult, dependencies=[Depends(verify_debug_token)])
+async def warm_cache(request: CacheWarmRequest):
+    """Precarga bloques en la caché (por ejemplo, los de un archivo muy leído).
+
+    Con `pin` los bloques quedan fijados y no se desalojan hasta liberarlos
+    con `/blocks/cache/unpin`. Como fija memoria del nodo, exige el
+    DEBUG_TOKEN en `X-Debug-Token`, igual que `/debug`.
+    """
+    _check_block_ids(*request.block_ids)
+    try:
+        result = await block_storage.warm(request.block_ids, request.pin)
+        return CacheWarmResult(**result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error warming cache: {str(e)}")
+
+@router.post("/cache/unpin", dependencies=[Depends(verify_debug_token)])
+async def unpin_cache(request: CacheUnpinRequest):
+    """Libera bloques fijados en la caché; pasan a desalojarse como los demás"""
+    _check_block_ids(*request.block_ids)
+    unpinned = block_storage.unpin(request.block_ids)
+    return {"message": "Blocks unpinned", "unpinned": unpinned}
@@ -1,6 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from common import profiling, tracing
+from . import metrics
 from .api import blocks
+from .services.block_report import BlockReporter
+from .services.block_scrubber import BlockScrubber
+from .storage.segment_storage import SegmentBlockStorage
+import asyncio
 import os
 
 # Crear la aplicación FastAPI
@@ -19,14 +25,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas de Prometheus (latencia por ruta, E/S y uso del almacenamiento)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.register_storage(blocks.block_storage)
+metrics.register_cache(blocks.block_storage)
+
+# Perfilado opcional por petición y registro de peticiones lentas
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Trazas distribuidas (contexto propagado en la cabecera traceparent)
+app.add_middleware(tracing.TracingMiddleware)
+
 # Incluir routers
 app.include_router(blocks.router)
+app.include_router(metrics.router)
+app.include_router(profiling.router)
+app.include_router(tracing.router)
 
 @app.on_event("startup")
 async def startup_event():
     """Evento que se ejecuta al iniciar la aplicación"""
     node_id = os.getenv("NODE_ID", "unknown")
     storage_path = os.getenv("STORAGE_PATH", "/app/storage/blocks")
+    namenode_url = os.getenv("NAMENODE_URL", "http://namenode:8000")
+    datanode_url = os.getenv("DATANODE_URL", f"http://{node_id}:8000")
+
+    # Reporte periódico de bloques al NameNode (recolección de basura)
+    reporter = BlockReporter(blocks.block_storage, namenode_url, node_id, datanode_url)
+    app.state.block_reporter = asyncio.create_task(reporter.run())
+
+    # Verificación periódica de los bloques contra su checksum (bit rot)
+    scrubber = BlockScrubber(blocks.backend_storage, namenode_url, node_id, datanode_url)
+    metrics.register_scrubber(scrubber)
+    app.state.block_scrubber = scrubber
+    app.state.scrubber_task = asyncio.create_task(scrubber.run())
+
+    # Compactación de segmentos en segundo plano (STORAGE_ENGINE=segments)
+    if isinstance(blocks.backend_storage, SegmentBlockStorage):
+        app.state.compactor = asyncio.create_task(blocks.backend_storage.run_compactor())
+
     print(f"DataNode {node_id} iniciado correctamente")
     print(f"Storage path: {storage_path}")
 
@@ -0,0 +1,202 @@
+import shutil
+import time
+from typing import Callable, Dict
+
+from fastapi import APIRouter, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    GCCollector,
+    Histogram,
+    PlatformCollector,
+    ProcessCollector,
+    generate_latest,
+)
+
+# Registro propio del servicio (más las métricas estándar del proceso)
+REGISTRY = CollectorRegistry()
+ProcessCollector(registry=REGISTRY)
+PlatformCollector(registry=REGISTRY)
+GCCollector(registry=REGISTRY)
+
+# Métricas HTTP (etiquetadas por plantilla de ruta para acotar la cardinalidad)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latencia de las peticiones HTTP",
+    ["method", "route"],
+    registry=REGISTRY,
+)
+REQUESTS_TOTAL = Counter(
+    "http_requests_total",
+    "Peticiones HTTP atendidas",
+    ["method", "route", "status"],
+    registry=REGISTRY,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Peticiones HTTP en curso",
+    registry=REGISTRY,
+)
+
+# Métricas del almacenamiento de bloques
+BYTES_WRITTEN = Counter(
+    "datanode_bytes_written_total",
+    "Bytes de bloques escritos en disco",
+    registry=REGISTRY,
+)
+BYTES_READ = Counter(
+    "datanode_bytes_read_total",
+    "Bytes de bloques leídos de disco",
+    registry=REGISTRY,
+)
+BLOCK_OPERATIONS = Counter(
+    "datanode_block_operations_total",
+    "Operaciones sobre bloques",
+    ["operation", "result"],
+    registry=REGISTRY,
+)
+DISK_LATENCY = Histogram(
+    "datanode_disk_operation_duration_seconds",
+    "Duración de las operaciones de disco sobre bloques",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    registry=REGISTRY,
+)
+STORED_BYTES = Gauge(
+    "datanode_storage_used_bytes",
+    "Bytes ocupados por los bloques almacenados",
+    registry=REGISTRY,
+)
+STORED_BLOCKS = Gauge(
+    "datanode_stored_blocks",
+    "Bloques almacenados",
+    registry=REGISTRY,
+)
+BLOCK_CACHE_REQUESTS = Counter(
+    "datanode_block_cache_requests_total",
+    "Consultas a la caché de bloques",
+    ["result"],
+    registry=REGISTRY,
+)
+BLOCK_CACHE_EVICTIONS = Counter(
+    "datanode_block_cache_evictions_total",
+    "Bloques desalojados de la caché para liberar espacio",
+    registry=REGISTRY,
+)
+BLOCK_CACHE_BYTES = Gauge(
+    "datanode_block_cache_bytes",
+    "Bytes de bloques en la caché",
+    registry=REGISTRY,
+)
+BLOCK_CACHE_BLOCKS = Gauge(
+    "datanode_block_cache_blocks",
+    "Bloques en la caché",
+    registry=REGISTRY,
+)
+SCRUB_BLOCKS = Counter(
+    "datanode_scrub_blocks_total",
+    "Bloques verificados por el verificador en segundo plano",
+    ["result"],
+    registry=REGISTRY,
+)
+SCRUB_BYTES = Counter(
+    "datanode_scrub_bytes_total",
+    "Bytes leídos por el verificador en segundo plano",
+    registry=REGISTRY,
+)
+CORRUPT_BLOCKS = Gauge(
+    "datanode_corrupt_blocks",
+    "Bloques corruptos detectados por el verificador",
+    registry=REGISTRY,
+)
+CHUNK_CHECKSUM_ERRORS = Counter(
+    "datanode_chunk_checksum_errors_total",
+    "Fragmentos de bloque cuyo CRC32 no coincide con el guardado",
+    ["operation"],
+    registry=REGISTRY,
+)
+DISK_FREE = Gauge(
+    "datanode_disk_free_bytes",
+    "Espacio libre en el disco del almacenamiento",
+    registry=REGISTRY,
+)
+
+router = APIRouter(tags=["metrics"])
+
+
+def register_storage(block_storage):
+    """Expone el uso del almacenamiento; se calcula al momento de cada scrape"""
+    STORED_BYTES.set_function(lambda: block_storage.get_storage_usage()["total_size"])
+    STORED_BLOCKS.set_function(lambda: block_storage.get_storage_usage()["block_count"])
+    DISK_FREE.set_function(lambda: shutil.disk_usage(block_storage.storage_path).free)
+
+
+def register_scrubber(block_scrubber):
+    """Expone los bloques corruptos detectados por el verificador"""
+    CORRUPT_BLOCKS.set_function(lambda: len(block_scrubber.corrupt))
+
+
+def register_cache(block_cache):
+    """Expone la ocupación de la caché de bloques"""
+    BLOCK_CACHE_BYTES.set_function(lambda: block_cache.size)
+    BLOCK_CACHE_BLOCKS.set_function(lambda: len(block_cache))
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas en formato de exposición de Prometheus"""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide latencia, estado y concurrencia de cada petición.
+
+    Es ASGI puro (sin BaseHTTPMiddleware) para que el costo por petición se
+    limite a dos lecturas de reloj y la actualización de tres métricas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Callable, str] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec()
+            route = self._route_template(scope)
+            REQUEST_LATENCY.labels(scope["method"], route).observe(elapsed)
+            REQUESTS_TOTAL.labels(scope["method"], route, str(status_code)).inc()
+
+    def _route_template(self, scope) -> str:
+        # El router deja el endpoint resuelto en el scope; se traduce a su plantilla
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get(endpoint)
+        if route is None:
+            for candidate in scope["app"].routes:
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+            else:
+                route = "unmatched"
+            self._routes[endpoint] = route
+        return route
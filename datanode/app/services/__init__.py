@@ -0,0 +1,6 @@
+"""
+Services module for DataNode
+"""
+from .block_report import BlockReporter
+
+__all__ = ["BlockReporter"]
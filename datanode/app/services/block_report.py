@@ -0,0 +1,83 @@
+import asyncio
+import os
+from typing import Dict, List
+
+import httpx
+
+from ..storage.block_storage import BlockStorage
+
+
+def namenode_auth_headers() -> Dict[str, str]:
+    """Cabecera con el secreto compartido que autentica al DataNode ante el NameNode"""
+    return {"X-DataNode-Token": os.getenv("DATANODE_TOKEN", "")}
+
+
+class BlockReporter:
+    """Envía reportes periódicos de bloques al NameNode y elimina los huérfanos"""
+
+    def __init__(
+        self,
+        block_storage: BlockStorage,
+        namenode_url: str,
+        node_id: str,
+        datanode_url: str,
+    ):
+        self.block_storage = block_storage
+        self.namenode_url = namenode_url
+        self.node_id = node_id
+        self.datanode_url = datanode_url
+        self.interval = int(os.getenv("BLOCK_REPORT_INTERVAL", 300))  # segundos
+        # Borrados por lote y pausa entre lotes para no saturar el disco
+        self.delete_batch_size = int(os.getenv("GC_DELETE_BATCH_SIZE", 100))
+        self.delete_batch_pause = float(os.getenv("GC_DELETE_BATCH_PAUSE", 1.0))
+
+    async def run(self):
+        """Ciclo principal del reporte de bloques"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.send_report()
+            except Exception as e:
+                print(f"Error enviando reporte de bloques: {e}")
+
+    async def send_report(self) -> int:
+        """Envía un reporte de bloques y procesa los borrados ordenados por el NameNode"""
+        blocks = await self.block_storage.list_blocks()
+        report = {
+            "node_id": self.node_id,
+            "datanode_url": self.datanode_url,
+            "blocks": [
+                {
+                    "block_id": block["block_id"],
+                    "size": block["size"],
+                    "created_at": block["created_at"],
+                }
+                for block in blocks
+            ],
+        }
+
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            response = await client.post(
+                f"{self.namenode_url}/datanodes/block-report",
+                json=report,
+                headers=namenode_auth_headers(),
+            )
+            response.raise_for_status()
+
+        blocks_to_delete = response.json().get("blocks_to_delete", [])
+        if blocks_to_delete:
+            deleted = await self.delete_blocks(blocks_to_delete)
+            print(f"GC: {deleted}/{len(blocks_to_delete)} bloques huérfanos eliminados")
+            return deleted
+        return 0
+
+    async def delete_blocks(self, block_ids: List[str]) -> int:
+        """Elimina bloques en lotes, pausando entre lotes"""
+        deleted = 0
+        for start in range(0, len(block_ids), self.delete_batch_size):
+            if start > 0:
+                await asyncio.sleep(self.delete_batch_pause)
+            for block_id in block_ids[start:start + self.delete_batch_size]:
+                if await self.block_storage.delete_block(block_id):
+                    deleted += 1
+        return deleted
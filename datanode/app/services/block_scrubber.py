@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from ..metrics import CHUNK_CHECKSUM_ERRORS, SCRUB_BLOCKS, SCRUB_BYTES
+from ..storage.block_storage import BlockLocation, open_block_file
+from ..storage.chunk_checksums import ChunkChecksums, ChunkHasher, chunk_count, load_chunk_checksums
+from .block_report import namenode_auth_headers
+
+# Tamaño de las lecturas al verificar un bloque
+VERIFY_READ_SIZE = 1024 * 1024
+# Bloques pedidos por página al recorrer el almacenamiento
+SCRUB_PAGE_SIZE = 1000
+
+
+class ScrubBudget:
+    """Limita el ritmo de lectura a `bandwidth` bytes/s y `iops` lecturas/s.
+
+    Cada lectura espera lo necesario para que el acumulado no supere el
+    presupuesto. Si la lectura va atrasada (disco lento) no se acumula
+    crédito de más de un segundo: no hay ráfagas al recuperarse.
+    """
+
+    def __init__(self, bandwidth: int, iops: int):
+        self.bandwidth = bandwidth
+        self.iops = iops
+        self._reset()
+
+    def _reset(self):
+        self.started = time.monotonic()
+        self.bytes = 0
+        self.reads = 0
+
+    async def consume(self, size: int):
+        self.bytes += size
+        self.reads += 1
+        target = max(
+            self.bytes / self.bandwidth if self.bandwidth > 0 else 0,
+            self.reads / self.iops if self.iops > 0 else 0,
+        )
+        delay = target - (time.monotonic() - self.started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif delay < -1:
+            self._reset()
+
+
+class BlockScrubber:
+    """Verifica periódicamente todos los bloques contra su checksum guardado.
+
+    Recorre el almacenamiento página a página y recalcula el SHA-256 de cada
+    bloque leyéndolo del disco por fragmentos, dentro de un presupuesto de
+    ancho de banda e IOPS para no competir con las lecturas de los clientes.
+    En la misma lectura se recalculan los CRC de fragmento, para indicar qué
+    fragmentos del bloque están dañados. Los bloques corruptos se reportan
+    al NameNode (los reportes que fallan se reintentan en la siguiente
+    página).
+    """
+
+    def __init__(
+        self,
+        block_storage,
+        namenode_url: str,
+        node_id: str,
+        datanode_url: str,
+    ):
+        self.block_storage = block_storage
+        self.namenode_url = namenode_url
+        self.node_id = node_id
+        self.datanode_url = datanode_url
+        self.interval = int(os.getenv("SCRUB_INTERVAL", 604800))  # segundos; 0 lo desactiva
+        self.bandwidth = int(os.getenv("SCRUB_BANDWIDTH", 1024 * 1024))  # bytes/s
+        self.iops = int(os.getenv("SCRUB_IOPS", 20))  # lecturas/s
+        # Bloques corruptos de la última pasada completa más los de la actual
+        self.corrupt: Dict[str, Dict] = {}
+        self.scanned = 0
+        self.pass_started_at: Optional[float] = None
+        self.last_pass_completed_at: Optional[float] = None
+        self._unreported: List[Dict] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @staticmethod
+    async def hash_block(location: BlockLocation, budget: Optional[ScrubBudget] = None,
+                         chunk_hasher: Optional[ChunkHasher] = None,
+                         relocate: Optional[Callable[[], Optional[BlockLocation]]] = None) -> str:
+        """SHA-256 de un bloque leído del disco por fragmentos de VERIFY_READ_SIZE.
+
+        Con `chunk_hasher` también se calculan los CRC de fragmento en la misma lectura.
+        `relocate` es el de `open_block_file`.
+        """
+        fd, location = await open_block_file(location, relocate)
+        try:
+            hasher = hashlib.sha256()
+            position, end = location.offset, location.offset + location.size
+            while position < end:
+                size = min(VERIFY_READ_SIZE, end - position)
+                if budget is not None:
+                    await budget.consume(size)
+                read = await asyncio.to_thread(BlockScrubber._read_into, fd, hasher, chunk_hasher, size, position)
+                if not read:
+                    # Archivo truncado: el checksum ya no va a coincidir
+                    break
+                position += read
+            return hasher.hexdigest()
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _read_into(fd: int, hasher, chunk_hasher: Optional[ChunkHasher], size: int, position: int) -> int:
+        chunk = os.pread(fd, size, position)
+        hasher.update(chunk)
+        if chunk_hasher is not None:
+            chunk_hasher.update(chunk)
+        return len(chunk)
+
+    @staticmethod
+    async def verify_range(location: BlockLocation, checksums: ChunkChecksums, start: int, end: int,
+                           relocate: Optional[Callable[[], Optional[BlockLocation]]] = None) -> List[int]:
+        """Fragmentos corruptos entre los bytes [start, end): solo se leen los que tocan el rango"""
+        chunks = checksums.chunk_span(start, min(end, location.size))
+        per_read = max(VERIFY_READ_SIZE // checksums.chunk_size, 1)
+        corrupt = []
+        fd, location = await open_block_file(location, relocate)
+        try:
+            for first in range(chunks.start, chunks.stop, per_read):
+                chunk_start = first * checksums.chunk_size
+                chunk_end = min(min(first + per_read, chunks.stop) * checksums.chunk_size, location.size)
+                data = await asyncio.to_thread(
+                    os.pread, fd, chunk_end - chunk_start, location.offset + chunk_start
+                )
+                corrupt += checksums.find_corrupt(data, first)
+                if len(data) < chunk_end - chunk_start:
+                    # Archivo truncado: los fragmentos que faltan tampoco coinciden
+                    corrupt += range(first + chunk_count(len(data), checksums.chunk_size), chunks.stop)
+                    break
+        finally:
+            os.close(fd)
+        return corrupt
+
+    async def run(self):
+        """Ciclo principal: una pasada completa y luego SCRUB_INTERVAL de espera"""
+        if self.interval <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await self.scrub()
+            except Exception as e:
+                print(f"Error verificando bloques: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def trigger(self) -> bool:
+        """Adelanta la próxima pasada; False si el verificador está desactivado"""
+        if self._wakeup is None:
+            return False
+        self._wakeup.set()
+        return True
+
+    async def scrub(self) -> int:
+        """Verifica todos los bloques; retorna los corruptos encontrados"""
+        budget = ScrubBudget(self.bandwidth, self.iops)
+        found: Dict[str, Dict] = {}
+        self.scanned = 0
+        self.pass_started_at = time.time()
+        after = None
+        while True:
+            page = await self.block_storage.list_blocks(SCRUB_PAGE_SIZE, after)
+            for block in page:
+                corrupt = await self.scrub_block(block["block_id"], budget)
+                self.scanned += 1
+                if corrupt is not None:
+                    found[block["block_id"]] = corrupt
+                    self.corrupt[block["block_id"]] = corrupt
+                    self._unreported.append(corrupt)
+            if self._unreported:
+                await self.report()
+            if len(page) < SCRUB_PAGE_SIZE:
+                break
+            after = page[-1]["block_id"]
+
+        self.corrupt = found
+        self.pass_started_at = None
+        self.last_pass_completed_at = time.time()
+        print(f"Verificación de bloques: {self.scanned} verificados, {len(found)} corruptos")
+        return len(found)
+
+    async def scrub_block(self, block_id: str, budget: ScrubBudget) -> Optional[Dict]:
+        """Verifica un bloque; retorna el detalle si está corrupto"""
+        location = self.block_storage.get_block_location(block_id)
+        if location is None:
+            return None
+        try:
+            checksums = await asyncio.to_thread(load_chunk_checksums, location.path, location.offset, location.size)
+            chunk_hasher = ChunkHasher(checksums.chunk_size) if checksums is not None else None
+            calculated = await self.hash_block(location, budget, chunk_hasher)
+        except FileNotFoundError:
+            # Eliminado (o compactado) durante la pasada
+            return None
+        SCRUB_BYTES.inc(location.size)
+
+        if calculated == location.checksum:
+            SCRUB_BLOCKS.labels("ok").inc()
+            return None
+        current = self.block_storage.get_block_location(block_id)
+        if current is None or current.checksum != location.checksum:
+            # Eliminado o reescrito mientras se leía
+            return None
+        SCRUB_BLOCKS.labels("corrupt").inc()
+        # Sin checksums de fragmento (bloque anterior a ese formato) solo se sabe que el bloque está dañado
+        corrupt_chunks = None
+        if chunk_hasher is not None:
+            corrupt_chunks = checksums.mismatches(chunk_hasher.finish())
+            CHUNK_CHECKSUM_ERRORS.labels("scrub").inc(len(corrupt_chunks))
+        print(f"Verificación de bloques: bloque {block_id} corrupto (fragmentos: {corrupt_chunks})")
+        return {
+            "block_id": block_id,
+            "expected_checksum": location.checksum,
+            "calculated_checksum": calculated,
+            "chunk_size": checksums.chunk_size if checksums is not None else None,
+            "corrupt_chunks": corrupt_chunks,
+        }
+
+    async def report(self):
+        """Reporta al NameNode los bloques corruptos pendientes"""
+        blocks, self._unreported = self._unreported, []
+        try:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                response = await client.post(
+                    f"{self.namenode_url}/datanodes/corrupt-blocks",
+                    json={
+                        "node_id": self.node_id,
+                        "datanode_url": self.datanode_url,
+                        "blocks": blocks,
+                    },
+                    headers=namenode_auth_headers(),
+                )
+                response.raise_for_status()
+        except Exception as e:
+            print(f"Error reportando bloques corruptos: {e}")
+            self._unreported = blocks + self._unreported
+
+    def get_status(self) -> Dict:
+        return {
+            "enabled": self._wakeup is not None,
+            "running": self.pass_started_at is not None,
+            "pass_started_at": self.pass_started_at,
+            "last_pass_completed_at": self.last_pass_completed_at,
+            "scanned": self.scanned,
+            "corrupt_blocks": list(self.corrupt.values()),
+            "unreported": len(self._unreported),
+        }
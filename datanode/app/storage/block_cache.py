@@ -0,0 +1,271 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Optional
+
+from ..metrics import BLOCK_CACHE_EVICTIONS, BLOCK_CACHE_REQUESTS
+from .block_storage import BlockLocation
+from .chunk_checksums import ChunkChecksums
+
+# Bytes de bloques que la caché mantiene en memoria (0 la desactiva)
+BLOCK_CACHE_SIZE = int(os.getenv("BLOCK_CACHE_SIZE", 256 * 1024 * 1024))
+# Bloques más grandes que esto no se cachean (salvo que se pidan con warm)
+BLOCK_CACHE_MAX_BLOCK = int(os.getenv("BLOCK_CACHE_MAX_BLOCK", 64 * 1024 * 1024))
+# Fracción de la caché que pueden ocupar los bloques fijados con warm
+BLOCK_CACHE_MAX_PINNED = float(os.getenv("BLOCK_CACHE_MAX_PINNED", 0.5))
+# Ids recordados para la admisión al segundo acceso
+GHOST_ENTRIES = 10000
+
+
+class CachedBlock(NamedTuple):
+    data: bytes
+    checksum: str
+
+
+class CachedBlockStorage:
+    """Caché LRU de bloques calientes delante de un almacenamiento de bloques.
+
+    Expone la misma interfaz que `BlockStorage` y `SegmentBlockStorage` y
+    delega en el almacenamiento envuelto. Las lecturas pasan primero por un
+    LRU limitado en bytes; escribir o eliminar un bloque lo invalida, así
+    que también lo invalidan los borrados del recolector de basura.
+
+    Un bloque entra a la caché en su segundo acceso (se recuerdan los ids
+    vistos una vez): un recorrido completo, como una re-replicación, no
+    desplaza a los bloques calientes. `warm` carga bloques sin esperar el
+    segundo acceso y puede fijarlos; los fijados no se desalojan hasta
+    `unpin` y no ocupan más de BLOCK_CACHE_MAX_PINNED de la capacidad, así
+    que siempre queda lugar para el LRU. Si dos peticiones fallan sobre el mismo bloque, se lee del
+    disco una sola vez.
+    """
+
+    def __init__(self, storage, capacity: int = BLOCK_CACHE_SIZE,
+                 max_block_size: int = BLOCK_CACHE_MAX_BLOCK,
+                 max_pinned: float = BLOCK_CACHE_MAX_PINNED):
+        self.storage = storage
+        self.storage_path = storage.storage_path
+        self.capacity = capacity
+        self.max_block_size = min(max_block_size, capacity)
+        self.max_pinned_size = int(capacity * min(max(max_pinned, 0.0), 1.0))
+        self.size = 0
+        self.pinned_size = 0
+        self._lru: "OrderedDict[str, CachedBlock]" = OrderedDict()
+        self._pinned: Dict[str, CachedBlock] = {}
+        self._ghosts: "OrderedDict[str, None]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    # Consultas de la caché
+    def __len__(self) -> int:
+        return len(self._lru) + len(self._pinned)
+
+    def _lookup(self, block_id: str, checksum: str) -> Optional[bytes]:
+        cached = self._pinned.get(block_id)
+        if cached is None:
+            cached = self._lru.get(block_id)
+            if cached is not None:
+                self._lru.move_to_end(block_id)
+        if cached is None:
+            return None
+        if cached.checksum != checksum:
+            # El bloque cambió sin pasar por esta caché: la copia no sirve
+            self.invalidate(block_id)
+            return None
+        return cached.data
+
+    def _admit(self, block_id: str, size: int) -> bool:
+        """Decide si un bloque que no está en caché debe cargarse en ella"""
+        if size > self.max_block_size:
+            return False
+        if block_id in self._ghosts:
+            del self._ghosts[block_id]
+            return True
+        self._ghosts[block_id] = None
+        if len(self._ghosts) > GHOST_ENTRIES:
+            self._ghosts.popitem(last=False)
+        return False
+
+    async def read_cached(self, location: BlockLocation, block_id: str) -> Optional[bytes]:
+        """Contenido de un bloque si está en caché o corresponde admitirlo.
+
+        Retorna None cuando conviene servir el bloque desde el disco (sin
+        cargarlo en memoria).
+        """
+        data = self._lookup(block_id, location.checksum)
+        if data is not None:
+            BLOCK_CACHE_REQUESTS.labels("hit").inc()
+            return data
+        BLOCK_CACHE_REQUESTS.labels("miss").inc()
+        if not self._admit(block_id, location.size):
+            return None
+        return await self._load(block_id, location.checksum)
+
+    async def _load(self, block_id: str, checksum: str, pin: bool = False) -> Optional[bytes]:
+        """Lee un bloque del almacenamiento y lo guarda en la caché"""
+        future = self._loading.get(block_id)
+        if future is not None:
+            data = await asyncio.shield(future)
+            if pin and data is not None:
+                self._pin(block_id)
+            return data
+
+        future = self._loading[block_id] = asyncio.get_running_loop().create_future()
+        try:
+            data = await self.storage.retrieve_block(block_id)
+        except BaseException as e:
+            if self._loading.get(block_id) is future:
+                del self._loading[block_id]
+            future.set_exception(e)
+            future.exception()  # Marcada como consultada si nadie más la espera
+            raise
+        # Si el bloque se invalidó durante la lectura, la copia puede ser vieja
+        if self._loading.get(block_id) is future:
+            del self._loading[block_id]
+            if data is not None:
+                self._insert(block_id, CachedBlock(data, checksum), pin)
+        future.set_result(data)
+        return data
+
+    # Mantenimiento
+    def _insert(self, block_id: str, cached: CachedBlock, pin: bool):
+        self._discard(block_id)
+        if pin and self._can_pin(len(cached.data)):
+            self._pinned[block_id] = cached
+            self.pinned_size += len(cached.data)
+        else:
+            self._lru[block_id] = cached
+        self.size += len(cached.data)
+        while self.size > self.capacity and self._lru:
+            _, evicted = self._lru.popitem(last=False)
+            self.size -= len(evicted.data)
+            BLOCK_CACHE_EVICTIONS.inc()
+
+    def _discard(self, block_id: str):
+        cached = self._lru.pop(block_id, None)
+        if cached is None:
+            cached = self._pinned.pop(block_id, None)
+            if cached is None:
+                return
+            self.pinned_size -= len(cached.data)
+        self.size -= len(cached.data)
+
+    def _can_pin(self, size: int) -> bool:
+        return self.pinned_size + size <= self.max_pinned_size
+
+    def _pin(self, block_id: str):
+        cached = self._lru.get(block_id)
+        if cached is not None and self._can_pin(len(cached.data)):
+            del self._lru[block_id]
+            self._pinned[block_id] = cached
+            self.pinned_size += len(cached.data)
+
+    def invalidate(self, block_id: str):
+        """Descarta la copia en caché de un bloque (y cualquier lectura en curso)"""
+        self._discard(block_id)
+        self._loading.pop(block_id, None)
+
+    async def warm(self, block_ids: Iterable[str], pin: bool = False) -> Dict[str, List[str]]:
+        """Carga bloques en la caché sin esperar su segundo acceso.
+
+        Con `pin` quedan fijados. Los bloques fijados no pueden superar
+        `max_pinned_size`: los que no entran se reportan en `skipped`.
+        """
+        result = {"cached": [], "missing": [], "skipped": []}
+        for block_id in block_ids:
+            location = self.storage.get_block_location(block_id)
+            if location is None:
+                result["missing"].append(block_id)
+                continue
+            if location.size > self.capacity or (
+                pin and block_id not in self._pinned and not self._can_pin(location.size)
+            ):
+                result["skipped"].append(block_id)
+                continue
+
+            if self._lookup(block_id, location.checksum) is not None:
+                if pin:
+                    self._pin(block_id)
+                data = True
+            else:
+                data = await self._load(block_id, location.checksum, pin)
+            if data is None:
+                result["missing"].append(block_id)
+            elif pin and block_id not in self._pinned:
+                # Otra carga fijada ocupó el espacio mientras se leía este bloque
+                result["skipped"].append(block_id)
+            else:
+                result["cached"].append(block_id)
+        return result
+
+    def unpin(self, block_ids: Iterable[str]) -> int:
+        """Devuelve bloques fijados al LRU; retorna cuántos estaban fijados"""
+        unpinned = 0
+        for block_id in block_ids:
+            cached = self._pinned.pop(block_id, None)
+            if cached is not None:
+                self.pinned_size -= len(cached.data)
+                self.size -= len(cached.data)
+                self._insert(block_id, cached, pin=False)
+                unpinned += 1
+        return unpinned
+
+    def get_cache_info(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "max_block_size": self.max_block_size,
+            "size": self.size,
+            "blocks": len(self),
+            "pinned_blocks": len(self._pinned),
+            "pinned_size": self.pinned_size,
+            "max_pinned_size": self.max_pinned_size,
+        }
+
+    # Interfaz del almacenamiento
+    async def retrieve_block(self, block_id: str) -> Optional[bytes]:
+        """Recuperar un bloque, desde la caché si está"""
+        location = self.storage.get_block_location(block_id)
+        if location is None:
+            return None
+        data = await self.read_cached(location, block_id)
+        if data is None:
+            data = await self.storage.retrieve_block(block_id)
+        return data
+
+    def get_block_location(self, block_id: str) -> Optional[BlockLocation]:
+        return self.storage.get_block_location(block_id)
+
+    async def get_chunk_checksums(self, block_id: str) -> Optional[ChunkChecksums]:
+        return await self.storage.get_chunk_checksums(block_id)
+
+    # Se invalida antes y después: una lectura concurrente puede haber
+    # vuelto a cargar la versión anterior mientras tanto
+    async def store_block(self, block_id: str, data: bytes, checksum: str) -> bool:
+        self.invalidate(block_id)
+        try:
+            return await self.storage.store_block(block_id, data, checksum)
+        finally:
+            self.invalidate(block_id)
+
+    async def store_block_stream(
+        self, block_id: str, chunks: AsyncIterator[bytes], checksum: str
+    ) -> Optional[int]:
+        self.invalidate(block_id)
+        try:
+            return await self.storage.store_block_stream(block_id, chunks, checksum)
+        finally:
+            self.invalidate(block_id)
+
+    async def delete_block(self, block_id: str) -> bool:
+        self.invalidate(block_id)
+        try:
+            return await self.storage.delete_block(block_id)
+        finally:
+            self.invalidate(block_id)
+
+    async def get_block_info(self, block_id: str) -> Optional[Dict]:
+        return await self.storage.get_block_info(block_id)
+
+    async def list_blocks(self, limit: Optional[int] = None, after: Optional[str] = None) -> List[Dict]:
+        return await self.storage.list_blocks(limit, after)
+
+    def get_storage_usage(self) -> Dict:
+        return self.storage.get_storage_usage()
@@ -0,0 +1,21 @@
+import re
+
+# Ids de bloque aceptados: hasta 64 letras ASCII, dígitos, '-' o '_' (incluye
+# los UUID que asigna el NameNode). El id forma parte del nombre del archivo
+# del bloque, así que nunca puede traer separadores de ruta ni '..'
+BLOCK_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class InvalidBlockIdError(ValueError):
+    """Id de bloque con caracteres o largo no permitidos"""
+
+
+def is_valid_block_id(block_id: str) -> bool:
+    return BLOCK_ID_PATTERN.fullmatch(block_id) is not None
+
+
+def check_block_id(block_id: str) -> str:
+    """Retorna el id si es válido; si no, lanza InvalidBlockIdError"""
+    if not is_valid_block_id(block_id):
+        raise InvalidBlockIdError(f"Invalid block id: {block_id!r}")
+    return block_id
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class IndexEntry(NamedTuple):
+    size: int
+    checksum: str
+    created_at: str
+
+
+def _record_entry(record: Dict) -> IndexEntry:
+    return IndexEntry(record["size"], record["checksum"], record["created_at"])
+
+
+class SortedIds:
+    """Ids de un dict de bloques en orden, para paginar por id.
+
+    Las altas se acumulan y se ordenan recién al listar (timsort aprovecha
+    la parte ya ordenada: O(n + k log k)); una baja se quita de la lista
+    ordenada por bisección, o de las altas pendientes si aún no se ordenó.
+    Listar es poco frecuente frente a escribir, así que escribir no paga
+    el orden.
+    """
+
+    def __init__(self, entries: Dict):
+        self.entries = entries
+        self._ids: List[str] = []
+        self._added: List[str] = []
+
+    def reset(self):
+        self._ids = sorted(self.entries)
+        self._added = []
+
+    def add(self, block_id: str):
+        self._added.append(block_id)
+
+    def remove(self, block_id: str):
+        index = bisect_left(self._ids, block_id)
+        if index < len(self._ids) and self._ids[index] == block_id:
+            del self._ids[index]
+        else:
+            self._added.remove(block_id)
+
+    def page(self, after: Optional[str], limit: Optional[int]) -> List[str]:
+        """Ids a partir del siguiente a `after`"""
+        if self._added:
+            self._ids.extend(self._added)
+            self._ids.sort()
+            self._added = []
+        start = bisect_right(self._ids, after) if after else 0
+        end = len(self._ids) if limit is None else start + limit
+        return self._ids[start:end]
+
+
+class BlockIndex:
+    """Índice persistente de los bloques de un DataNode.
+
+    Los bloques viven en un dict en memoria, con contadores de bytes y de
+    bloques que se actualizan en cada alta o baja: consultar el uso del
+    almacenamiento no recorre nada. Cada cambio se agrega como una línea
+    JSON a `blocks_index.log`; las líneas pendientes se escriben juntas, con
+    un solo fsync por lote (group commit). Cuando el registro acumula el
+    doble de líneas que bloques vivos se reescribe con una línea por bloque,
+    así que arrancar cuesta leer un archivo y no recorrer el directorio.
+    """
+
+    LOG_NAME = "blocks_index.log"
+    # Líneas mínimas del registro antes de considerar compactarlo
+    COMPACT_MIN_RECORDS = int(os.getenv("INDEX_COMPACT_MIN_RECORDS", 100000))
+
+    def __init__(self, directory: Path, fsync: bool = True):
+        self.directory = directory
+        self.log_path = directory / self.LOG_NAME
+        self.fsync = fsync
+        self.entries: Dict[str, IndexEntry] = {}
+        self.total_size = 0
+        self.order = SortedIds(self.entries)
+        self._log_records = 0
+        self._file = None
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def exists(self) -> bool:
+        return self.log_path.exists()
+
+    def load(self) -> int:
+        """Carga el registro; retorna las líneas leídas.
+
+        Una línea incompleta al final (caída a mitad de una escritura) marca
+        el final del registro: ese cambio nunca se confirmó al cliente, y se
+        trunca para que los cambios siguientes no queden pegados a ella.
+        """
+        records = 0
+        valid_length = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if record is None or not line.endswith(b"\n"):
+                    print(f"Índice de bloques: registro incompleto descartado en {self.log_path}")
+                    f.close()
+                    os.truncate(self.log_path, valid_length)
+                    break
+                valid_length += len(line)
+                self._apply_record(record)
+                records += 1
+        self._log_records = records
+        self.order.reset()
+        return records
+
+    def import_entries(self, entries: Iterable[Tuple[str, IndexEntry]]):
+        """Carga bloques existentes (migración) y los guarda como registro inicial"""
+        for block_id, entry in entries:
+            self._apply_put(block_id, entry)
+        self._rewrite(list(self.entries.items()))
+        self._log_records = len(self.entries)
+
+    # Consultas
+    def get(self, block_id: str) -> Optional[IndexEntry]:
+        return self.entries.get(block_id)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def page(self, after: Optional[str], limit: Optional[int]) -> List[Tuple[str, IndexEntry]]:
+        """Bloques ordenados por id a partir del siguiente a `after`"""
+        return [(block_id, self.entries[block_id]) for block_id in self.order.page(after, limit)]
+
+    # Cambios
+    # El cambio se aplica en memoria recién cuando es durable: si la escritura
+    # falla, el índice sigue mostrando lo que quedó en el registro
+    def put(self, block_id: str, size: int, checksum: str, created_at: str) -> asyncio.Future:
+        """Registra un bloque; el future se resuelve cuando el cambio es durable"""
+        return self._append({
+            "op": "put", "id": block_id, "size": size,
+            "checksum": checksum, "created_at": created_at,
+        })
+
+    def delete(self, block_id: str) -> asyncio.Future:
+        """Da de baja un bloque; el future se resuelve cuando el cambio es durable"""
+        return self._append({"op": "delete", "id": block_id})
+
+    def _apply_record(self, record: Dict):
+        if record["op"] == "put":
+            self._apply_put(record["id"], _record_entry(record))
+        else:
+            self._apply_delete(record["id"])
+
+    def _apply_put(self, block_id: str, entry: IndexEntry):
+        previous = self.entries.get(block_id)
+        if previous is None:
+            self.order.add(block_id)
+        else:
+            self.total_size -= previous.size
+        self.entries[block_id] = entry
+        self.total_size += entry.size
+
+    def _apply_delete(self, block_id: str):
+        previous = self.entries.pop(block_id, None)
+        if previous is not None:
+            self.total_size -= previous.size
+            self.order.remove(block_id)
+
+    # Escritura
+    def _append(self, record: Dict) -> asyncio.Future:
+        if self._writer is None:
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.create_task(self._run_writer())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((record, future))
+        self._wakeup.set()
+        return future
+
+    async def _run_writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+
+            try:
+                if self._log_records + len(batch) > max(self.COMPACT_MIN_RECORDS, 2 * len(self.entries)):
+                    # El estado en memoria más el lote: reescribirlo lo cubre
+                    snapshot = dict(self.entries)
+                    for record, _ in batch:
+                        if record["op"] == "put":
+                            snapshot[record["id"]] = _record_entry(record)
+                        else:
+                            snapshot.pop(record["id"], None)
+                    await asyncio.to_thread(self._rewrite, list(snapshot.items()))
+                    self._log_records = len(snapshot)
+                else:
+                    await asyncio.to_thread(
+                        self._write_lines, [json.dumps(record) + "\n" for record, _ in batch]
+                    )
+                    self._log_records += len(batch)
+            except Exception as e:
+                print(f"Índice de bloques: error escribiendo {len(batch)} cambios: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for record, future in batch:
+                self._apply_record(record)
+                if not future.done():
+                    future.set_result(None)
+
+    def _write_lines(self, lines: List[str]):
+        if self._file is None:
+            self._file = open(self.log_path, "a", encoding="utf-8")
+        offset = os.fstat(self._file.fileno()).st_size
+        try:
+            self._file.writelines(lines)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError:
+            # Lo que haya llegado al disco del lote se descarta: la memoria no lo aplica
+            file, self._file = self._file, None
+            try:
+                file.close()
+            except OSError:
+                pass
+            os.truncate(self.log_path, offset)
+            raise
+
+    def _rewrite(self, snapshot: List[Tuple[str, IndexEntry]]):
+        """Reescribe el registro con una línea por bloque (archivo temporal + rename)"""
+        temp_path = self.log_path.with_name(self.LOG_NAME + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(
+                json.dumps({
+                    "op": "put", "id": block_id, "size": entry.size,
+                    "checksum": entry.checksum, "created_at": entry.created_at,
+                }) + "\n"
+                for block_id, entry in snapshot
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        os.replace(temp_path, self.log_path)
+        directory_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
@@ -0,0 +1,331 @@
+import os
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Callable, Dict, List, NamedTuple, Optional, Tuple
+from fastapi import HTTPException
+import aiofiles
+from common.tracing import span
+from ..metrics import BLOCK_OPERATIONS, BYTES_READ, BYTES_WRITTEN, DISK_LATENCY
+from .block_ids import check_block_id
+from .block_index import BlockIndex, IndexEntry
+from .chunk_checksums import ChunkChecksums, ChunkHasher, load_chunk_checksums
+
+# Política de durabilidad de los bloques escritos:
+#   always: fsync del archivo antes del rename y del directorio después
+#   data:   solo fsync del archivo (el rename puede perderse ante una caída)
+#   none:   sin fsync, el sistema operativo decide cuándo escribir
+BLOCK_FSYNC = os.getenv("BLOCK_FSYNC", "always")
+# Tamaño de los fragmentos en que se escribe un bloque (memoria por upload)
+WRITE_CHUNK_SIZE = int(os.getenv("WRITE_CHUNK_SIZE", 1024 * 1024))
+# Niveles de subdirectorios (2 caracteres hexadecimales del hash del id cada uno)
+BLOCK_SHARD_LEVELS = int(os.getenv("BLOCK_SHARD_LEVELS", 2))
+
+
+class BlockLocation(NamedTuple):
+    """Dónde leer un bloque: `size` bytes de `path` a partir de `offset`"""
+    path: Path
+    offset: int
+    size: int
+    checksum: str
+
+
+async def open_block_file(
+    location: BlockLocation, relocate: Optional[Callable[[], Optional[BlockLocation]]] = None
+) -> Tuple[int, BlockLocation]:
+    """Abre el archivo de un bloque en un hilo; retorna (descriptor, ubicación abierta).
+
+    Una ubicación consultada antes de una compactación puede apuntar a un
+    segmento que ya se eliminó aunque el bloque siga vivo en otro: con
+    `relocate` se vuelve a resolver la ubicación y se reintenta una vez.
+    Lanza FileNotFoundError si el bloque ya no existe (o se reescribió).
+    """
+    try:
+        return await asyncio.to_thread(os.open, location.path, os.O_RDONLY), location
+    except FileNotFoundError:
+        current = relocate() if relocate is not None else None
+        if current is None or current.path == location.path or current.checksum != location.checksum:
+            raise
+        return await asyncio.to_thread(os.open, current.path, os.O_RDONLY), current
+
+
+class BlockStorage:
+    """Almacenamiento de bloques en disco.
+
+    Cada bloque es un archivo en un subdirectorio elegido por el hash de su
+    id (`ab/cd/block_<id>.dat` con dos niveles), para que ningún directorio
+    acumule millones de entradas. El archivo lleva los datos y, a
+    continuación, los checksums de cada fragmento (ver chunk_checksums). Los
+    metadatos viven en el índice persistente (BlockIndex); el arranque no
+    recorre los directorios.
+    """
+
+    TEMP_DIR = "tmp"
+    TEMP_SUFFIX = ".tmp"
+    LAYOUT_FILE = "storage_layout.json"
+    # Formato anterior: un archivo JSON con todos los metadatos y bloques sin subdirectorios
+    LEGACY_METADATA_FILE = "blocks_metadata.json"
+
+    def __init__(self, storage_path: str = "/app/storage"):
+        self.storage_path = Path(storage_path)
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.temp_path = self.storage_path / self.TEMP_DIR
+        self.temp_path.mkdir(exist_ok=True)
+        self.shard_levels = self._load_layout()
+        self._known_shards = set()
+        self._remove_temp_files()
+
+        started = time.time()
+        self.index = BlockIndex(self.storage_path, fsync=BLOCK_FSYNC != "none")
+        if self.index.exists():
+            self.index.load()
+        else:
+            self._migrate_legacy_metadata()
+        print(
+            f"Índice de bloques: {len(self.index)} bloques, {self.index.total_size} bytes "
+            f"(cargado en {time.time() - started:.2f}s)"
+        )
+    
+    def _load_layout(self) -> int:
+        # La cantidad de niveles queda fijada por los datos ya escritos
+        layout_file = self.storage_path / self.LAYOUT_FILE
+        if layout_file.exists():
+            with open(layout_file, 'r') as f:
+                return json.load(f)["shard_levels"]
+        with open(layout_file, 'w') as f:
+            json.dump({"shard_levels": BLOCK_SHARD_LEVELS}, f)
+        return BLOCK_SHARD_LEVELS
+    
+    def _remove_temp_files(self):
+        # Escrituras interrumpidas por una caída: nunca llegaron a confirmarse
+        for temp_path in self.temp_path.iterdir():
+            temp_path.unlink(missing_ok=True)
+    
+    def _migrate_legacy_metadata(self):
+        """Importa `blocks_metadata.json` y mueve los bloques a sus subdirectorios"""
+        legacy_file = self.storage_path / self.LEGACY_METADATA_FILE
+        entries = []
+        if legacy_file.exists():
+            with open(legacy_file, 'r') as f:
+                blocks = json.load(f).get("blocks", {})
+            for block_id, metadata in blocks.items():
+                legacy_path = self.storage_path / f"block_{block_id}.dat"
+                if legacy_path.exists():
+                    block_path = self._get_block_path(block_id)
+                    block_path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(legacy_path, block_path)
+                entries.append((
+                    block_id,
+                    IndexEntry(metadata["size"], metadata["checksum"], metadata["created_at"]),
+                ))
+        self.index.import_entries(entries)
+        if legacy_file.exists():
+            legacy_file.rename(legacy_file.with_name(legacy_file.name + ".migrated"))
+            print(f"Índice de bloques: {len(entries)} bloques migrados desde {legacy_file.name}")
+    
+    def _get_block_path(self, block_id: str) -> Path:
+        # Un id con separadores o '..' saldría del directorio de almacenamiento
+        check_block_id(block_id)
+        digest = hashlib.md5(block_id.encode()).hexdigest()
+        shards = [digest[2 * level:2 * level + 2] for level in range(self.shard_levels)]
+        return self.storage_path.joinpath(*shards, f"block_{block_id}.dat")
+    
+    def _ensure_shard(self, shard: Path):
+        """Crea el subdirectorio de un bloque la primera vez que se usa"""
+        if shard in self._known_shards:
+            return
+        created = []
+        directory = shard
+        while directory != self.storage_path and not directory.exists():
+            created.append(directory)
+            directory = directory.parent
+        shard.mkdir(parents=True, exist_ok=True)
+        if BLOCK_FSYNC == "always":
+            # Hace durables las entradas de los directorios recién creados
+            for directory in created:
+                self._sync_directory(directory.parent)
+        self._known_shards.add(shard)
+    
+    def _calculate_checksum(self, data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+    
+    async def store_block(self, block_id: str, data: bytes, checksum: str) -> bool:
+        """Almacenar un bloque con verificación de checksum"""
+        async def single_chunk():
+            yield data
+
+        try:
+            return await self.store_block_stream(block_id, single_chunk(), checksum) is not None
+        except Exception:
+            return False
+    
+    async def store_block_stream(
+        self, block_id: str, chunks: AsyncIterator[bytes], checksum: str
+    ) -> Optional[int]:
+        """Almacenar un bloque que llega por fragmentos.
+
+        Cada fragmento se escribe en un archivo temporal y actualiza el
+        checksum incremental y los CRC de fragmento, de modo que la memoria
+        por upload no depende del tamaño del bloque. Si el checksum
+        coincide, se agregan los CRC al final, el archivo se sincroniza
+        según BLOCK_FSYNC y se renombra de forma atómica al nombre
+        definitivo: un lector nunca ve un bloque a medio escribir.
+        Retorna los bytes escritos, o None si el checksum no coincide.
+        """
+        block_path = self._get_block_path(block_id)
+        temp_path = self.temp_path / f"{block_path.name}.{uuid.uuid4().hex}{self.TEMP_SUFFIX}"
+        hasher = hashlib.sha256()
+        chunk_hasher = ChunkHasher()
+        size = 0
+
+        try:
+            with span("write", block_id=block_id) as write_span:
+                start = time.perf_counter()
+                f = await asyncio.to_thread(open, temp_path, "wb")
+                try:
+                    async for chunk in chunks:
+                        # Hash y escritura en un hilo: sha256 y crc32 liberan el GIL
+                        await asyncio.to_thread(self._write_chunk, f, hasher, chunk_hasher, chunk)
+                        size += len(chunk)
+                    if hasher.hexdigest() != checksum:
+                        BLOCK_OPERATIONS.labels("store", "checksum_mismatch").inc()
+                        return None
+                    await asyncio.to_thread(f.write, chunk_hasher.finish().encode())
+                    if BLOCK_FSYNC in ("always", "data"):
+                        with span("fsync"):
+                            await asyncio.to_thread(self._sync_file, f)
+                finally:
+                    await asyncio.to_thread(f.close)
+                write_span.set(size=size)
+
+                await asyncio.to_thread(self._ensure_shard, block_path.parent)
+                os.replace(temp_path, block_path)
+                if BLOCK_FSYNC == "always":
+                    await asyncio.to_thread(self._sync_directory, block_path.parent)
+                DISK_LATENCY.labels("write").observe(time.perf_counter() - start)
+                BYTES_WRITTEN.inc(size)
+        except BaseException:
+            BLOCK_OPERATIONS.labels("store", "error").inc()
+            raise
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+        # Registrar el bloque en el índice
+        with span("metadata"):
+            await self.index.put(block_id, size, checksum, str(time.time()))
+        BLOCK_OPERATIONS.labels("store", "ok").inc()
+        return size
+    
+    @staticmethod
+    def _write_chunk(f: BinaryIO, hasher, chunk_hasher: ChunkHasher, chunk: bytes):
+        hasher.update(chunk)
+        chunk_hasher.update(chunk)
+        f.write(chunk)
+    
+    @staticmethod
+    def _sync_file(f: BinaryIO):
+        f.flush()
+        os.fsync(f.fileno())
+    
+    @staticmethod
+    def _sync_directory(directory: Path):
+        # Hace durable el rename (la entrada del directorio)
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    
+    async def retrieve_block(self, block_id: str) -> Optional[bytes]:
+        """Recuperar un bloque"""
+        entry = self.index.get(block_id)
+        if entry is None:
+            BLOCK_OPERATIONS.labels("retrieve", "not_found").inc()
+            return None
+        
+        try:
+            block_path = self._get_block_path(block_id)
+            if not block_path.exists():
+                BLOCK_OPERATIONS.labels("retrieve", "not_found").inc()
+                return None
+            
+            start = time.perf_counter()
+            async with aiofiles.open(block_path, 'rb') as f:
+                # Solo los datos: después vienen los checksums de fragmento
+                data = await f.read(entry.size)
+            DISK_LATENCY.labels("read").observe(time.perf_counter() - start)
+            BYTES_READ.inc(len(data))
+            BLOCK_OPERATIONS.labels("retrieve", "ok").inc()
+            
+            return data
+        except Exception:
+            BLOCK_OPERATIONS.labels("retrieve", "error").inc()
+            return None
+    
+    def get_block_location(self, block_id: str) -> Optional[BlockLocation]:
+        """Ubicación de un bloque, para servirlo directamente desde el archivo"""
+        entry = self.index.get(block_id)
+        if entry is None:
+            BLOCK_OPERATIONS.labels("retrieve", "not_found").inc()
+            return None
+        return BlockLocation(self._get_block_path(block_id), 0, entry.size, entry.checksum)
+    
+    async def get_chunk_checksums(self, block_id: str) -> Optional[ChunkChecksums]:
+        """Checksums de fragmento de un bloque; None si no existe o no los tiene"""
+        entry = self.index.get(block_id)
+        if entry is None:
+            return None
+        try:
+            return await asyncio.to_thread(load_chunk_checksums, self._get_block_path(block_id), 0, entry.size)
+        except FileNotFoundError:
+            return None
+    
+    async def delete_block(self, block_id: str) -> bool:
+        """Eliminar un bloque"""
+        if self.index.get(block_id) is None:
+            BLOCK_OPERATIONS.labels("delete", "not_found").inc()
+            return False
+        
+        try:
+            # Primero el índice: ante una caída queda a lo sumo un archivo sin referencias
+            await self.index.delete(block_id)
+            
+            block_path = self._get_block_path(block_id)
+            start = time.perf_counter()
+            block_path.unlink(missing_ok=True)
+            DISK_LATENCY.labels("delete").observe(time.perf_counter() - start)
+            BLOCK_OPERATIONS.labels("delete", "ok").inc()
+            return True
+        except Exception:
+            BLOCK_OPERATIONS.labels("delete", "error").inc()
+            return False
+    
+    async def get_block_info(self, block_id: str) -> Optional[Dict]:
+        """Obtener información de un bloque"""
+        entry = self.index.get(block_id)
+        if entry is None:
+            return None
+        
+        block_info = entry._asdict()
+        block_info["block_id"] = block_id
+        return block_info
+    
+    async def list_blocks(self, limit: Optional[int] = None, after: Optional[str] = None) -> List[Dict]:
+        """Listar los bloques ordenados por id; `limit` y `after` paginan"""
+        blocks = []
+        for block_id, entry in self.index.page(after, limit):
+            block_info = entry._asdict()
+            block_info["block_id"] = block_id
+            blocks.append(block_info)
+        return blocks
+    
+    def get_storage_usage(self) -> Dict:
+        """Obtener información de uso de almacenamiento (contadores del índice)"""
+        return {
+            "total_size": self.index.total_size,
+            "block_count": len(self.index),
+            "storage_path": str(self.storage_path)
+        }
\ No newline at end of file
@@ -0,0 +1,122 @@
+import os
+import struct
+import zlib
+from array import array
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+# Bytes de datos cubiertos por cada checksum de fragmento
+BYTES_PER_CHECKSUM = int(os.getenv("BYTES_PER_CHECKSUM", 64 * 1024))
+
+# Los checksums de fragmento se guardan justo después de los datos del bloque
+# (en su archivo o en su registro del segmento):
+#
+#     4 bytes "GCK1", u32 bytes por checksum, u32 crc32 de la lista, un u32 CRC32 por fragmento
+#
+# Un bloque escrito antes de este formato no tiene nada después de sus datos
+# (o tiene el siguiente registro del segmento, que no empieza con la marca).
+TRAILER_MAGIC = b"GCK1"
+TRAILER_HEADER = struct.Struct("<4sII")
+CRC_SIZE = 4
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return (size + chunk_size - 1) // chunk_size
+
+
+def trailer_length(size: int, chunk_size: int) -> int:
+    """Bytes que ocupan los checksums de un bloque de `size` bytes (0 si no tiene)"""
+    if chunk_size <= 0:
+        return 0
+    return TRAILER_HEADER.size + CRC_SIZE * chunk_count(size, chunk_size)
+
+
+class ChunkChecksums(NamedTuple):
+    chunk_size: int
+    crcs: array
+
+    def chunk_span(self, start: int, end: int) -> range:
+        """Índices de los fragmentos que cubren los bytes [start, end)"""
+        if end <= start:
+            return range(0)
+        return range(start // self.chunk_size, (end - 1) // self.chunk_size + 1)
+
+    def find_corrupt(self, data: bytes, first_chunk: int) -> List[int]:
+        """Fragmentos de `data` (alineado al inicio de `first_chunk`) cuyo CRC no coincide"""
+        corrupt = []
+        view = memoryview(data)
+        for position in range(0, len(view), self.chunk_size):
+            index = first_chunk + position // self.chunk_size
+            if index >= len(self.crcs) or zlib.crc32(view[position:position + self.chunk_size]) != self.crcs[index]:
+                corrupt.append(index)
+        return corrupt
+
+    def mismatches(self, other: "ChunkChecksums") -> List[int]:
+        """Fragmentos cuyo CRC difiere del de `other` (calculado con el mismo tamaño)"""
+        corrupt = [index for index, (a, b) in enumerate(zip(self.crcs, other.crcs)) if a != b]
+        shorter = min(len(self.crcs), len(other.crcs))
+        return corrupt + list(range(shorter, max(len(self.crcs), len(other.crcs))))
+
+    def encode(self) -> bytes:
+        raw_crcs = self.crcs.tobytes()
+        return TRAILER_HEADER.pack(TRAILER_MAGIC, self.chunk_size, zlib.crc32(raw_crcs)) + raw_crcs
+
+
+class ChunkHasher:
+    """Calcula el CRC32 de cada fragmento de BYTES_PER_CHECKSUM a medida que llegan los datos"""
+
+    def __init__(self, chunk_size: int = BYTES_PER_CHECKSUM):
+        self.chunk_size = chunk_size
+        self.crcs = array("I")
+        self._crc = 0
+        self._filled = 0  # Bytes del fragmento actual
+
+    def update(self, data: bytes):
+        view = memoryview(data)
+        position = 0
+        while position < len(view):
+            take = min(self.chunk_size - self._filled, len(view) - position)
+            self._crc = zlib.crc32(view[position:position + take], self._crc)
+            self._filled += take
+            position += take
+            if self._filled == self.chunk_size:
+                self.crcs.append(self._crc)
+                self._crc = 0
+                self._filled = 0
+
+    def finish(self) -> ChunkChecksums:
+        crcs = array("I", self.crcs)
+        if self._filled:
+            crcs.append(self._crc)
+        return ChunkChecksums(self.chunk_size, crcs)
+
+
+def read_chunk_checksums(fd: int, offset: int, size: int) -> Optional[ChunkChecksums]:
+    """Checksums de fragmento del bloque de `size` bytes que empieza en `offset`.
+
+    Retorna None si el bloque no los tiene (escrito antes de este formato) o
+    si están dañados: en ese caso solo queda el SHA-256 del bloque completo.
+    """
+    position = offset + size
+    header = os.pread(fd, TRAILER_HEADER.size, position)
+    if len(header) < TRAILER_HEADER.size:
+        return None
+    magic, chunk_size, crc = TRAILER_HEADER.unpack(header)
+    if magic != TRAILER_MAGIC or chunk_size <= 0:
+        return None
+    length = CRC_SIZE * chunk_count(size, chunk_size)
+    raw_crcs = os.pread(fd, length, position + TRAILER_HEADER.size)
+    if len(raw_crcs) < length or zlib.crc32(raw_crcs) != crc:
+        return None
+    crcs = array("I")
+    crcs.frombytes(raw_crcs)
+    return ChunkChecksums(chunk_size, crcs)
+
+
+def load_chunk_checksums(path: Path, offset: int, size: int) -> Optional[ChunkChecksums]:
+    """Como `read_chunk_checksums`, abriendo el archivo del bloque"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return read_chunk_checksums(fd, offset, size)
+    finally:
+        os.close(fd)
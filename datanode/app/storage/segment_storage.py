@@ -0,0 +1,613 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+from functools import partial
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from common.tracing import span
+
+from ..metrics import BLOCK_OPERATIONS, BYTES_READ, BYTES_WRITTEN, DISK_LATENCY
+from .block_ids import check_block_id
+from .block_index import SortedIds
+from .block_storage import BLOCK_FSYNC, BlockLocation, open_block_file
+from .chunk_checksums import ChunkChecksums, ChunkHasher, read_chunk_checksums, trailer_length
+
+# Tamaño a partir del cual se cierra el segmento activo y se abre otro
+SEGMENT_SIZE = int(os.getenv("SEGMENT_SIZE", 64 * 1024 * 1024))
+# Fracción de bytes muertos de un segmento cerrado que dispara su compactación
+COMPACTION_THRESHOLD = float(os.getenv("COMPACTION_THRESHOLD", 0.5))
+# Frecuencia con que se buscan segmentos para compactar
+COMPACTION_INTERVAL = int(os.getenv("COMPACTION_INTERVAL", 60))  # segundos
+# Bytes de un segmento que la compactación lee por paso
+COMPACTION_BATCH_BYTES = 4 * 1024 * 1024
+# Bloques que se reciben en memoria; los más grandes pasan a un archivo temporal
+SPOOL_MAX_SIZE = 1024 * 1024
+# Fragmentos más chicos se hashean en el event loop (un hilo cuesta más que el hash)
+INLINE_HASH_MAX = 256 * 1024
+# Bloques más chicos se leen en el event loop con un descriptor abierto por segmento
+INLINE_READ_MAX = 64 * 1024
+
+PUT = 0
+TOMBSTONE = 1
+
+# crc32, tipo, secuencia, segmento del bloque borrado (tombstones) o bytes por
+# checksum de fragmento (PUT; 0 si no los lleva), largo del id, tamaño de los
+# datos, checksum SHA-256, fecha de creación. En un PUT, después de los datos
+# van los checksums de fragmento (ver chunk_checksums)
+RECORD_HEADER = struct.Struct("<IBQIHQ32sd")
+
+
+class SegmentEntry(NamedTuple):
+    segment: int
+    offset: int  # inicio de los datos dentro del segmento
+    size: int
+    checksum: str
+    created_at: str
+    seq: int
+    chunk_size: int = 0  # 0: registro escrito sin checksums de fragmento
+
+
+class PendingRecord(NamedTuple):
+    kind: int
+    block_id: str
+    seq: int
+    target: int
+    size: int
+    checksum: bytes
+    created_at: float
+    source: Union[bytes, BinaryIO, None]
+    future: asyncio.Future
+    # Entrada original si el registro es una copia de la compactación
+    copy_of: Optional[SegmentEntry]
+    # Checksums de fragmento codificados (PUT)
+    trailer: bytes
+
+    @property
+    def chunk_size(self) -> int:
+        return self.target if self.kind == PUT else 0
+
+
+def _record_length(block_id: str, size: int, chunk_size: int = 0) -> int:
+    return RECORD_HEADER.size + len(block_id.encode()) + size + trailer_length(size, chunk_size)
+
+
+class SegmentBlockStorage:
+    """Almacenamiento de bloques en segmentos de log (STORAGE_ENGINE=segments).
+
+    Pensado para bloques pequeños: en lugar de un archivo por bloque, cada
+    bloque se agrega como registro al final del segmento activo, y un
+    índice en memoria guarda segmento y offset de cada bloque vivo. Las
+    escrituras pendientes se agregan juntas con un solo fsync por lote
+    (group commit). Borrar agrega un tombstone; la compactación en segundo
+    plano copia los bloques vivos de los segmentos con muchos bytes
+    muertos al segmento activo y elimina el segmento viejo.
+
+    Cada registro lleva un número de secuencia: al arrancar se recorren los
+    encabezados de todos los segmentos y, por bloque, gana el registro de
+    secuencia mayor, sin importar en qué segmento quedó tras compactar. Un
+    tombstone se conserva mientras exista el segmento del bloque que borró.
+    """
+
+    SEGMENTS_DIR = "segments"
+    TEMP_DIR = "tmp"
+    SEGMENT_PREFIX = "segment_"
+    SEGMENT_SUFFIX = ".log"
+
+    def __init__(self, storage_path: str = "/app/storage"):
+        self.storage_path = Path(storage_path)
+        self.segments_path = self.storage_path / self.SEGMENTS_DIR
+        self.segments_path.mkdir(parents=True, exist_ok=True)
+        self.temp_path = self.storage_path / self.TEMP_DIR
+        self.temp_path.mkdir(exist_ok=True)
+        for temp_path in self.temp_path.iterdir():
+            temp_path.unlink(missing_ok=True)
+
+        self.entries: Dict[str, SegmentEntry] = {}
+        self.order = SortedIds(self.entries)
+        self.total_size = 0
+        # segmento -> [bytes escritos, bytes de registros vivos]
+        self.segments: Dict[int, List[int]] = {}
+        # Segmentos compactados que se eliminan en la siguiente pasada (lecturas en curso)
+        self._retired: List[int] = []
+        # Descriptores de lectura por segmento (lecturas pequeñas en el event loop)
+        self._read_fds: Dict[int, int] = {}
+        self._next_seq = 1
+
+        started = time.time()
+        self._recover()
+        print(
+            f"Segmentos: {len(self.entries)} bloques, {self.total_size} bytes en "
+            f"{len(self.segments)} segmentos (cargado en {time.time() - started:.2f}s)"
+        )
+
+        # El segmento activo pertenece al escritor
+        self._active = max(self.segments, default=0) + 1
+        self._active_file: Optional[BinaryIO] = None
+        self._active_size = 0
+        self.segments[self._active] = [0, 0]
+        # Primer segmento que puede tener escrituras sin aplicar al índice
+        self._open_segment = self._active
+        self._pending: List[PendingRecord] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._compaction_lock = asyncio.Lock()
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.segments_path / f"{self.SEGMENT_PREFIX}{segment:010d}{self.SEGMENT_SUFFIX}"
+
+    # Recuperación
+    def _recover(self):
+        latest: Dict[str, Tuple[int, Optional[SegmentEntry]]] = {}
+        for filename in sorted(os.listdir(self.segments_path)):
+            if filename.startswith(self.SEGMENT_PREFIX) and filename.endswith(self.SEGMENT_SUFFIX):
+                segment = int(filename[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)])
+                self._scan_segment(segment, latest)
+
+        for block_id, (_, entry) in latest.items():
+            if entry is not None:
+                self.entries[block_id] = entry
+                self.segments[entry.segment][1] += _record_length(block_id, entry.size, entry.chunk_size)
+                self.total_size += entry.size
+        self.order.reset()
+
+    def _scan_segment(self, segment: int, latest: Dict):
+        """Lee los encabezados de un segmento (salta los datos).
+
+        Un registro incompleto o con encabezado corrupto (caída a mitad de
+        una escritura) marca el final del segmento y se trunca.
+        """
+        path = self._segment_path(segment)
+        file_size = os.path.getsize(path)
+        offset = 0
+        with open(path, "rb") as f:
+            while offset < file_size:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                crc, kind, seq, target, id_length, size, checksum, created_at = RECORD_HEADER.unpack(header)
+                raw_id = f.read(id_length)
+                chunk_size = target if kind == PUT else 0
+                length = size + trailer_length(size, chunk_size)
+                end = offset + RECORD_HEADER.size + id_length + length
+                if zlib.crc32(header[4:] + raw_id) != crc or end > file_size:
+                    break
+                f.seek(length, os.SEEK_CUR)
+
+                block_id = raw_id.decode()
+                current = latest.get(block_id)
+                # A igual secuencia gana el tombstone (el que cubre la copia de una compactación)
+                if current is None or seq > current[0] or (seq == current[0] and kind == TOMBSTONE):
+                    entry = None
+                    if kind == PUT:
+                        entry = SegmentEntry(
+                            segment, offset + RECORD_HEADER.size + id_length, size,
+                            checksum.hex(), str(created_at), seq, chunk_size,
+                        )
+                    latest[block_id] = (seq, entry)
+                self._next_seq = max(self._next_seq, seq + 1)
+                offset = end
+
+        if offset < file_size:
+            print(f"Segmentos: {file_size - offset} bytes incompletos truncados en {path.name}")
+            os.truncate(path, offset)
+        self.segments[segment] = [offset, 0]
+
+    # Consultas
+    def get_block_location(self, block_id: str) -> Optional[BlockLocation]:
+        """Ubicación de un bloque dentro de su segmento"""
+        entry = self.entries.get(block_id)
+        if entry is None:
+            BLOCK_OPERATIONS.labels("retrieve", "not_found").inc()
+            return None
+        return BlockLocation(self._segment_path(entry.segment), entry.offset, entry.size, entry.checksum)
+
+    async def get_chunk_checksums(self, block_id: str) -> Optional[ChunkChecksums]:
+        """Checksums de fragmento de un bloque; None si no existe o no los tiene"""
+        entry = self.entries.get(block_id)
+        if entry is None or not entry.chunk_size:
+            return None
+        try:
+            fd = os.open(self._segment_path(entry.segment), os.O_RDONLY)
+        except FileNotFoundError:
+            # Segmento compactado y eliminado después de consultar el índice
+            return None
+        try:
+            return await asyncio.to_thread(read_chunk_checksums, fd, entry.offset, entry.size)
+        finally:
+            os.close(fd)
+
+    async def retrieve_block(self, block_id: str) -> Optional[bytes]:
+        """Recuperar un bloque"""
+        location = self.get_block_location(block_id)
+        if location is None:
+            return None
+        try:
+            start = time.perf_counter()
+            if location.size <= INLINE_READ_MAX:
+                # Un pread chico desde la caché de páginas cuesta menos que pasar a un hilo
+                segment = self.entries[block_id].segment
+                fd = self._read_fds.get(segment)
+                if fd is None:
+                    fd = self._read_fds[segment] = os.open(location.path, os.O_RDONLY)
+                data = os.pread(fd, location.size, location.offset)
+            else:
+                # La compactación puede eliminar el segmento mientras se pasa al hilo
+                fd, location = await open_block_file(location, partial(self.get_block_location, block_id))
+                try:
+                    data = await asyncio.to_thread(os.pread, fd, location.size, location.offset)
+                finally:
+                    os.close(fd)
+            DISK_LATENCY.labels("read").observe(time.perf_counter() - start)
+            BYTES_READ.inc(len(data))
+            BLOCK_OPERATIONS.labels("retrieve", "ok").inc()
+            return data
+        except Exception:
+            BLOCK_OPERATIONS.labels("retrieve", "error").inc()
+            return None
+
+    async def get_block_info(self, block_id: str) -> Optional[Dict]:
+        """Obtener información de un bloque"""
+        entry = self.entries.get(block_id)
+        if entry is None:
+            return None
+        return {
+            "block_id": block_id,
+            "size": entry.size,
+            "checksum": entry.checksum,
+            "created_at": entry.created_at,
+        }
+
+    async def list_blocks(self, limit: Optional[int] = None, after: Optional[str] = None) -> List[Dict]:
+        """Listar los bloques ordenados por id; `limit` y `after` paginan"""
+        blocks = []
+        for block_id in self.order.page(after, limit):
+            entry = self.entries[block_id]
+            blocks.append({
+                "block_id": block_id,
+                "size": entry.size,
+                "checksum": entry.checksum,
+                "created_at": entry.created_at,
+            })
+        return blocks
+
+    def get_storage_usage(self) -> Dict:
+        """Obtener información de uso de almacenamiento"""
+        return {
+            "total_size": self.total_size,
+            "block_count": len(self.entries),
+            "storage_path": str(self.storage_path)
+        }
+
+    # Escritura
+    async def store_block(self, block_id: str, data: bytes, checksum: str) -> bool:
+        """Almacenar un bloque con verificación de checksum"""
+        async def single_chunk():
+            yield data
+
+        try:
+            return await self.store_block_stream(block_id, single_chunk(), checksum) is not None
+        except Exception:
+            return False
+
+    async def store_block_stream(
+        self, block_id: str, chunks: AsyncIterator[bytes], checksum: str
+    ) -> Optional[int]:
+        """Almacenar un bloque que llega por fragmentos.
+
+        El bloque se recibe en memoria (o en un archivo temporal si supera
+        SPOOL_MAX_SIZE) mientras se calcula el checksum, y recién completo y
+        verificado se agrega al segmento activo. Retorna los bytes escritos,
+        o None si el checksum no coincide.
+        """
+        check_block_id(block_id)
+        hasher = hashlib.sha256()
+        chunk_hasher = ChunkHasher()
+        buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, dir=self.temp_path)
+        size = 0
+        try:
+            with span("write", block_id=block_id) as write_span:
+                start = time.perf_counter()
+                async for chunk in chunks:
+                    if len(chunk) <= INLINE_HASH_MAX and size + len(chunk) <= SPOOL_MAX_SIZE:
+                        # Todavía en memoria: hashear y copiar aquí es más barato que un hilo
+                        self._write_chunk(buffer, hasher, chunk_hasher, chunk)
+                    else:
+                        await asyncio.to_thread(self._write_chunk, buffer, hasher, chunk_hasher, chunk)
+                    size += len(chunk)
+                if hasher.hexdigest() != checksum:
+                    BLOCK_OPERATIONS.labels("store", "checksum_mismatch").inc()
+                    return None
+                write_span.set(size=size)
+                buffer.seek(0)
+                source = buffer.read() if size <= SPOOL_MAX_SIZE else buffer
+
+                # El escritor aplica el bloque al índice cuando el lote es durable
+                checksums = chunk_hasher.finish()
+                await self._append(
+                    PUT, block_id, self._take_seq(), checksums.chunk_size, size, bytes.fromhex(checksum),
+                    time.time(), source, trailer=checksums.encode(),
+                )
+                DISK_LATENCY.labels("write").observe(time.perf_counter() - start)
+                BYTES_WRITTEN.inc(size)
+        except BaseException:
+            BLOCK_OPERATIONS.labels("store", "error").inc()
+            raise
+        finally:
+            buffer.close()
+
+        BLOCK_OPERATIONS.labels("store", "ok").inc()
+        return size
+
+    @staticmethod
+    def _write_chunk(buffer: BinaryIO, hasher, chunk_hasher: ChunkHasher, chunk: bytes):
+        hasher.update(chunk)
+        chunk_hasher.update(chunk)
+        buffer.write(chunk)
+
+    async def delete_block(self, block_id: str) -> bool:
+        """Eliminar un bloque: agrega un tombstone.
+
+        El escritor quita el bloque del índice cuando el tombstone es durable:
+        si la escritura falla, el bloque sigue disponible.
+        """
+        entry = self.entries.get(block_id)
+        if entry is None:
+            BLOCK_OPERATIONS.labels("delete", "not_found").inc()
+            return False
+
+        try:
+            start = time.perf_counter()
+            await self._append(TOMBSTONE, block_id, self._take_seq(), entry.segment, 0, bytes(32), time.time(), None)
+            DISK_LATENCY.labels("delete").observe(time.perf_counter() - start)
+            BLOCK_OPERATIONS.labels("delete", "ok").inc()
+            return True
+        except Exception:
+            BLOCK_OPERATIONS.labels("delete", "error").inc()
+            return False
+
+    def _take_seq(self) -> int:
+        seq = self._next_seq
+        self._next_seq += 1
+        return seq
+
+    def _apply_put(self, block_id: str, entry: SegmentEntry):
+        current = self.entries.get(block_id)
+        if current is not None:
+            if current.seq > entry.seq:
+                # Una escritura posterior del mismo bloque ya se aplicó
+                return
+            self._remove_entry(block_id, current, reorder=False)
+        else:
+            self.order.add(block_id)
+        self.entries[block_id] = entry
+        self.segments[entry.segment][1] += _record_length(block_id, entry.size, entry.chunk_size)
+        self.total_size += entry.size
+
+    def _remove_entry(self, block_id: str, entry: SegmentEntry, reorder: bool = True):
+        del self.entries[block_id]
+        if entry.segment in self.segments:
+            self.segments[entry.segment][1] -= _record_length(block_id, entry.size, entry.chunk_size)
+        self.total_size -= entry.size
+        if reorder:
+            self.order.remove(block_id)
+
+    def _append(self, kind: int, block_id: str, seq: int, target: int, size: int,
+                checksum: bytes, created_at: float, source,
+                copy_of: Optional[SegmentEntry] = None, trailer: bytes = b"") -> asyncio.Future:
+        """Encola un registro; el future retorna (segmento, offset de los datos) al ser durable"""
+        if self._writer is None:
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.create_task(self._run_writer())
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(
+            PendingRecord(kind, block_id, seq, target, size, checksum, created_at, source, future, copy_of, trailer)
+        )
+        self._wakeup.set()
+        return future
+
+    async def _run_writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+
+            try:
+                locations = await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                print(f"Segmentos: error escribiendo {len(batch)} registros: {e}")
+                for record in batch:
+                    if not record.future.done():
+                        record.future.set_exception(e)
+                continue
+
+            # Aplicar al índice aquí, sin ceder el loop: la compactación nunca
+            # ve un registro escrito que el índice todavía no refleja
+            for record, (segment, offset) in zip(batch, locations):
+                self.segments.setdefault(segment, [0, 0])[0] += _record_length(
+                    record.block_id, record.size, record.chunk_size
+                )
+                if record.kind == PUT:
+                    self._apply_written(record, segment, offset)
+                else:
+                    # Una escritura encolada antes del borrado pudo aplicarse después de él
+                    current = self.entries.get(record.block_id)
+                    if current is not None and current.seq <= record.seq:
+                        self._remove_entry(record.block_id, current)
+                        if current.segment != record.target:
+                            # La compactación movió el bloque antes del tombstone: otro
+                            # tombstone cubre la copia mientras su segmento exista
+                            self._append(
+                                TOMBSTONE, record.block_id, record.seq, current.segment, 0,
+                                bytes(32), time.time(), None,
+                            )
+                if not record.future.done():
+                    record.future.set_result((segment, offset))
+            self._open_segment = locations[-1][0]
+
+    def _apply_written(self, record: PendingRecord, segment: int, offset: int):
+        entry = SegmentEntry(
+            segment, offset, record.size, record.checksum.hex(), str(record.created_at), record.seq,
+            record.chunk_size,
+        )
+        if record.copy_of is None:
+            self._apply_put(record.block_id, entry)
+            return
+
+        current = self.entries.get(record.block_id)
+        if current is None:
+            # Se borró durante la copia: el tombstone debe cubrir también la copia.
+            # Lleva la secuencia de la copia para no ocultar una escritura posterior
+            self._append(TOMBSTONE, record.block_id, record.seq, segment, 0, bytes(32), time.time(), None)
+        elif current.seq == record.copy_of.seq:
+            self._remove_entry(record.block_id, current, reorder=False)
+            self.entries[record.block_id] = entry
+            self.segments[segment][1] += _record_length(record.block_id, record.size, record.chunk_size)
+            self.total_size += record.size
+
+    def _write_batch(self, batch: List[PendingRecord]) -> List[Tuple[int, int]]:
+        """Agrega un lote al segmento activo con un fsync (se ejecuta en un hilo)"""
+        locations = []
+        for record in batch:
+            raw_id = record.block_id.encode()
+            length = _record_length(record.block_id, record.size, record.chunk_size)
+            if self._active_size and self._active_size + length > SEGMENT_SIZE:
+                self._roll()
+            if self._active_file is None:
+                self._active_file = open(self._segment_path(self._active), "ab")
+                if BLOCK_FSYNC == "always":
+                    self._sync_directory()
+
+            header = RECORD_HEADER.pack(
+                0, record.kind, record.seq, record.target, len(raw_id),
+                record.size, record.checksum, record.created_at,
+            )
+            crc = zlib.crc32(header[4:] + raw_id)
+            self._active_file.write(struct.pack("<I", crc) + header[4:] + raw_id)
+            if isinstance(record.source, bytes):
+                self._active_file.write(record.source)
+            elif record.source is not None:
+                shutil.copyfileobj(record.source, self._active_file, 1024 * 1024)
+            self._active_file.write(record.trailer)
+            locations.append((self._active, self._active_size + RECORD_HEADER.size + len(raw_id)))
+            self._active_size += length
+
+        self._active_file.flush()
+        if BLOCK_FSYNC in ("always", "data"):
+            os.fsync(self._active_file.fileno())
+        return locations
+
+    def _roll(self):
+        """Cierra el segmento activo y abre el siguiente"""
+        if self._active_file is not None:
+            self._active_file.flush()
+            if BLOCK_FSYNC in ("always", "data"):
+                os.fsync(self._active_file.fileno())
+            self._active_file.close()
+            self._active_file = None
+        self._active += 1
+        self._active_size = 0
+
+    def _sync_directory(self):
+        fd = os.open(self.segments_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # Compactación
+    async def run_compactor(self):
+        """Compacta periódicamente los segmentos con muchos bytes muertos"""
+        while True:
+            await asyncio.sleep(COMPACTION_INTERVAL)
+            try:
+                await self.compact()
+            except Exception as e:
+                print(f"Error compactando segmentos: {e}")
+
+    async def compact(self) -> int:
+        """Compacta los segmentos cerrados que superan COMPACTION_THRESHOLD"""
+        async with self._compaction_lock:
+            # Los segmentos compactados en la pasada anterior: un lector que
+            # todavía tenga su ubicación la vuelve a resolver (open_block_file)
+            for segment in self._retired:
+                fd = self._read_fds.pop(segment, None)
+                if fd is not None:
+                    os.close(fd)
+                self._segment_path(segment).unlink(missing_ok=True)
+            self._retired = []
+
+            compacted = 0
+            for segment, (written, live) in sorted(self.segments.items()):
+                if segment >= self._open_segment or not written:
+                    continue
+                if (written - live) / written >= COMPACTION_THRESHOLD:
+                    await self._compact_segment(segment)
+                    compacted += 1
+            return compacted
+
+    async def _compact_segment(self, segment: int):
+        started = time.time()
+        path = self._segment_path(segment)
+        copied = 0
+        with open(path, "rb") as f:
+            offset = 0
+            while True:
+                records, offset = await asyncio.to_thread(self._read_records, f, offset)
+                if not records:
+                    break
+                copies = []
+                for kind, block_id, seq, target, data_offset, size, checksum, created_at, data, trailer in records:
+                    entry = self.entries.get(block_id)
+                    if kind == PUT and entry is not None and (entry.segment, entry.offset) == (segment, data_offset):
+                        # La copia conserva la secuencia: una escritura o un borrado
+                        # posterior del bloque sigue ganando al recuperar
+                        copies.append(self._append(
+                            PUT, block_id, seq, target, size, checksum, created_at, data,
+                            copy_of=entry, trailer=trailer,
+                        ))
+                        copied += 1
+                    elif (kind == TOMBSTONE and block_id not in self.entries and target != segment
+                          and (target in self.segments or target in self._retired)):
+                        copies.append(self._append(TOMBSTONE, block_id, seq, target, 0, checksum, created_at, None))
+                await asyncio.gather(*copies)
+
+        del self.segments[segment]
+        self._retired.append(segment)
+        print(
+            f"Segmentos: segmento {segment} compactado, {copied} bloques copiados "
+            f"en {time.time() - started:.2f}s"
+        )
+
+    @staticmethod
+    def _read_records(f: BinaryIO, offset: int) -> Tuple[List[Tuple], int]:
+        """Lee registros completos desde `offset` hasta juntar COMPACTION_BATCH_BYTES"""
+        f.seek(offset)
+        records = []
+        read = 0
+        while read < COMPACTION_BATCH_BYTES:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            _, kind, seq, target, id_length, size, checksum, created_at = RECORD_HEADER.unpack(header)
+            block_id = f.read(id_length).decode()
+            data = trailer = None
+            if kind == PUT:
+                data = f.read(size)
+                # Los checksums de fragmento se copian tal cual, sin recalcularlos
+                trailer = f.read(trailer_length(size, target))
+            records.append((
+                kind, block_id, seq, target, offset + RECORD_HEADER.size + id_length,
+                size, checksum, created_at, data, trailer,
+            ))
+            length = _record_length(block_id, size, target if kind == PUT else 0)
+            offset += length
+            read += length
+        return records, offset
@@ -0,0 +1,43 @@
+import hashlib
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# Los tests se ejecutan desde el directorio del servicio (`python -m pytest tests`):
+# `app` es el paquete del servicio y `common` está en la raíz del repositorio
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]
+
+# Almacenamiento propio de la ejecución (se lee al importar app)
+DATA_DIR = tempfile.mkdtemp(prefix="griddfs-datanode-tests-")
+os.environ.setdefault("STORAGE_PATH", os.path.join(DATA_DIR, "blocks"))
+# Sin verificación en segundo plano: los tests leen y dañan sus propios bloques
+os.environ.setdefault("SCRUB_INTERVAL", "0")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Cliente HTTP del DataNode (arranca la aplicación una vez por ejecución)"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def store_block(client):
+    """Sube un bloque con un id nuevo y retorna el id"""
+    def store_block(data: bytes) -> str:
+        block_id = str(uuid.uuid4())
+        response = client.put(
+            f"/blocks/{block_id}", content=data,
+            headers={"X-Block-Checksum": hashlib.sha256(data).hexdigest()},
+        )
+        assert response.status_code == 200, response.text
+        return block_id
+
+    return store_block
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.storage.block_cache import CachedBlockStorage
+from app.storage.block_storage import BlockLocation
+from common import debug_auth
+
+
+class SlowStorage:
+    """Almacenamiento falso cuyas lecturas esperan a que el test las libere"""
+
+    storage_path = "/tmp"
+
+    def __init__(self, blocks: Dict[str, bytes]):
+        self.blocks = blocks
+        self.reads = 0
+        self.release = asyncio.Event()
+
+    def get_block_location(self, block_id: str) -> Optional[BlockLocation]:
+        data = self.blocks.get(block_id)
+        if data is None:
+            return None
+        return BlockLocation(Path(self.storage_path), 0, len(data), hashlib.sha256(data).hexdigest())
+
+    async def retrieve_block(self, block_id: str) -> Optional[bytes]:
+        self.reads += 1
+        data = self.blocks.get(block_id)
+        await self.release.wait()
+        return data
+
+    async def store_block(self, block_id: str, data: bytes, checksum: str) -> bool:
+        self.blocks[block_id] = data
+        return True
+
+
+def test_invalidation_during_load_discards_stale_copy():
+    """Un bloque reescrito mientras se cargaba no queda en caché con la versión anterior"""
+    async def scenario():
+        storage = SlowStorage({"a": b"old"})
+        cache = CachedBlockStorage(storage, capacity=1024)
+
+        load = asyncio.create_task(cache.warm(["a"]))
+        await asyncio.sleep(0)
+        assert storage.reads == 1
+        await cache.store_block("a", b"new", hashlib.sha256(b"new").hexdigest())
+        storage.release.set()
+        await load
+
+        assert len(cache) == 0
+        assert await cache.retrieve_block("a") == b"new"
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_misses_share_one_read():
+    """Dos peticiones que fallan sobre el mismo bloque leen del disco una sola vez"""
+    async def scenario():
+        storage = SlowStorage({"a": b"data"})
+        cache = CachedBlockStorage(storage, capacity=1024)
+
+        loads = [asyncio.create_task(cache.warm(["a"])) for _ in range(2)]
+        await asyncio.sleep(0)
+        storage.release.set()
+        results = await asyncio.gather(*loads)
+
+        assert storage.reads == 1
+        assert all(result["cached"] == ["a"] for result in results)
+        assert await cache.retrieve_block("a") == b"data"
+        assert storage.reads == 1
+
+    asyncio.run(scenario())
+
+
+def test_pinned_blocks_are_capped():
+    """Los bloques fijados no ocupan más de max_pinned de la capacidad"""
+    async def scenario():
+        storage = SlowStorage({"a": b"a" * 400, "b": b"b" * 400, "c": b"c" * 100})
+        storage.release.set()
+        cache = CachedBlockStorage(storage, capacity=1000, max_pinned=0.5)
+
+        first = await cache.warm(["a"], pin=True)
+        second = await cache.warm(["b", "c"], pin=True)
+        assert first["cached"] == ["a"]
+        assert second == {"cached": ["c"], "missing": [], "skipped": ["b"]}
+        assert cache.get_cache_info()["pinned_size"] == 500
+
+        # Sin fijar siguen entrando al LRU
+        assert (await cache.warm(["b"]))["cached"] == ["b"]
+        assert cache.get_cache_info()["pinned_blocks"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_cache_admin_requires_debug_token(client, monkeypatch):
+    body = {"block_ids": ["missing"]}
+    assert client.post("/blocks/cache/warm", json=body).status_code == 404
+
+    monkeypatch.setattr(debug_auth, "DEBUG_TOKEN", "secret")
+    assert client.post("/blocks/cache/warm", json=body).status_code == 401
+    assert client.post("/blocks/cache/unpin", json=body, headers={"X-Debug-Token": "wrong"}).status_code == 401
+
+    headers = {"X-Debug-Token": "secret"}
+    response = client.post("/blocks/cache/warm", json=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["missing"] == ["missing"]
+    assert client.post("/blocks/cache/unpin", json=body, headers=headers).json()["unpinned"] == 0
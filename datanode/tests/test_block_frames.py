@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from app.api import block_frames
+from app.api.block_frames import FrameReader, encode_header
+from app.storage.block_ids import InvalidBlockIdError, is_valid_block_id
+from app.storage.block_storage import BlockStorage
+
+
+def _frame(block_id: str, data: bytes) -> bytes:
+    return encode_header(block_id, block_frames.OK, len(data), hashlib.sha256(data).hexdigest()) + data
+
+
+def _raw_frame(raw_id: bytes, data: bytes) -> bytes:
+    header = block_frames.FRAME_HEADER.pack(len(raw_id), block_frames.OK, len(data), hashlib.sha256(data).digest())
+    return header + raw_id + data
+
+
+async def _pieces(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def test_reader_parses_frames_split_across_chunks():
+    """Los encabezados y los datos pueden llegar partidos en cualquier punto"""
+    first, second = os.urandom(100), os.urandom(3000)
+    body = _frame("a", first) + _frame("b", second) + _frame("c", b"")
+
+    async def scenario():
+        reader = FrameReader(_pieces(body, 7))
+        frames = []
+        a = await reader.next_frame()
+        frames.append((a.block_id, a.size, a.checksum, await reader.read()))
+        b = await reader.next_frame()
+        frames.append((b.block_id, b.size, b.checksum, b"".join([chunk async for chunk in reader.chunks(1024)])))
+        # El bloque vacío se salta sin leerlo
+        assert (await reader.next_frame()).block_id == "c"
+        assert await reader.next_frame() is None
+        return frames
+
+    assert asyncio.run(scenario()) == [
+        ("a", 100, hashlib.sha256(first).hexdigest(), first),
+        ("b", 3000, hashlib.sha256(second).hexdigest(), second),
+    ]
+
+
+def test_unread_data_is_discarded_by_next_frame():
+    body = _frame("a", b"x" * 50) + _frame("b", b"y")
+
+    async def scenario():
+        reader = FrameReader(_pieces(body, 16))
+        await reader.next_frame()
+        frame = await reader.next_frame()
+        return frame.block_id, await reader.read()
+
+    assert asyncio.run(scenario()) == ("b", b"y")
+
+
+def test_truncated_body_raises_eof():
+    body = _frame("a", b"x" * 50)[:-10]
+
+    async def scenario():
+        reader = FrameReader(_pieces(body, 16))
+        await reader.next_frame()
+        await reader.read()
+
+    with pytest.raises(EOFError):
+        asyncio.run(scenario())
+
+
+def test_non_utf8_id_is_readable_but_invalid():
+    async def scenario():
+        return await FrameReader(_pieces(_raw_frame(b"\xff\xfe", b"x"), 64)).next_frame()
+
+    assert not is_valid_block_id(asyncio.run(scenario()).block_id)
+
+
+@pytest.mark.parametrize("block_id", ["../x", "a/b", "..", "a.b", "", "x" * 65, "á"])
+def test_invalid_ids_never_become_paths(tmp_path, block_id):
+    with pytest.raises(InvalidBlockIdError):
+        BlockStorage(str(tmp_path))._get_block_path(block_id)
+
+
+def test_uuid_and_short_ids_are_valid():
+    assert is_valid_block_id("0f8fad5b-d9cb-469f-a165-70867728950e")
+    assert is_valid_block_id("block_1")
+    assert is_valid_block_id("x" * 64)
+
+
+def test_batch_upload_reports_invalid_ids_per_frame(client):
+    body = (
+        _frame("../../escape", b"bad")
+        + _raw_frame(b"\xff\xfe", b"bad")
+        + _frame("good-block", b"good")
+    )
+    response = client.post("/blocks/batch/upload", content=body, headers={"Content-Type": block_frames.MEDIA_TYPE})
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == ["invalid_id", "invalid_id", "ok"]
+    assert client.get("/blocks/download/good-block").content == b"good"
+
+
+def test_routes_reject_invalid_ids_with_400(client):
+    data = b"payload"
+    checksum = hashlib.sha256(data).hexdigest()
+    response = client.post(
+        "/blocks/upload", data={"block_id": "../../escape", "checksum": checksum},
+        files={"file": ("block", data)},
+    )
+    assert response.status_code == 400
+    assert client.put("/blocks/a.b", content=data, headers={"X-Block-Checksum": checksum}).status_code == 400
+    assert client.get("/blocks/download/a.b").status_code == 400
+    assert client.delete("/blocks/a.b").status_code == 400
+    assert client.get("/blocks/a.b/info").status_code == 400
+    assert client.post("/blocks/batch/delete", json={"block_ids": ["ok", "../x"]}).status_code == 400
+    assert client.post("/blocks/batch/download", json={"block_ids": ["../x"]}).status_code == 400
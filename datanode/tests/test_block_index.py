@@ -0,0 +1,61 @@
+import asyncio
+import json
+import os
+
+from app.storage.block_index import BlockIndex
+
+
+def _put(block_id: str, size: int) -> bytes:
+    record = {"op": "put", "id": block_id, "size": size, "checksum": "c", "created_at": "1.0"}
+    return (json.dumps(record) + "\n").encode()
+
+
+def test_load_truncates_torn_tail(tmp_path):
+    """Una línea incompleta al final del registro se descarta y se trunca"""
+    index = BlockIndex(tmp_path, fsync=False)
+    valid = _put("a", 10) + _put("b", 20) + b'{"op": "delete", "id": "a"}\n'
+    with open(index.log_path, "wb") as f:
+        f.write(valid + _put("c", 30)[:-5])
+
+    assert index.load() == 3
+    assert [block_id for block_id, _ in index.page(None, None)] == ["b"]
+    assert index.total_size == 20
+    assert os.path.getsize(index.log_path) == len(valid)
+
+
+def test_changes_after_truncation_survive_reload(tmp_path):
+    """Los cambios escritos tras truncar no quedan pegados a la línea descartada"""
+    index = BlockIndex(tmp_path, fsync=False)
+    with open(index.log_path, "wb") as f:
+        f.write(_put("a", 10) + b'{"op": "put", "id": "b"')
+    index.load()
+
+    async def write():
+        await index.put("c", 30, "c", "2.0")
+
+    asyncio.run(write())
+    reloaded = BlockIndex(tmp_path, fsync=False)
+    assert reloaded.load() == 2
+    assert [block_id for block_id, _ in reloaded.page(None, None)] == ["a", "c"]
+
+
+def test_failed_write_leaves_index_unchanged(tmp_path):
+    """Un cambio cuyo lote no llega al disco no se aplica en memoria"""
+    index = BlockIndex(tmp_path, fsync=False)
+
+    async def scenario():
+        await index.put("a", 10, "c", "1.0")
+
+        def fail(lines):
+            raise OSError(5, "Input/output error")
+
+        index._write_lines = fail
+        results = await asyncio.gather(
+            index.put("b", 20, "c", "1.0"), index.delete("a"), return_exceptions=True
+        )
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, OSError) for result in results)
+    assert [block_id for block_id, _ in index.page(None, None)] == ["a"]
+    assert index.total_size == 10
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import zlib
+
+import pytest
+
+from app.api import blocks
+from app.storage.chunk_checksums import (
+    TRAILER_HEADER,
+    ChunkChecksums,
+    ChunkHasher,
+    load_chunk_checksums,
+    read_chunk_checksums,
+)
+
+CHUNK = 100
+
+
+def _checksums(data: bytes) -> ChunkChecksums:
+    hasher = ChunkHasher(CHUNK)
+    hasher.update(data)
+    return hasher.finish()
+
+
+def _write(tmp_path, content: bytes) -> int:
+    path = tmp_path / "block.dat"
+    path.write_bytes(content)
+    return os.open(path, os.O_RDONLY)
+
+
+def test_hasher_matches_per_chunk_crc_for_any_split():
+    data = os.urandom(1050)
+    expected = [zlib.crc32(data[i:i + CHUNK]) for i in range(0, len(data), CHUNK)]
+
+    hasher = ChunkHasher(CHUNK)
+    for start, end in ((0, 1), (1, 150), (150, 151), (151, 1050)):
+        hasher.update(data[start:end])
+    assert list(hasher.finish().crcs) == expected
+    assert list(_checksums(data).crcs) == expected
+
+
+def test_trailer_round_trip_at_offset(tmp_path):
+    """Los checksums se leen detrás de los datos, también dentro de un segmento"""
+    data = os.urandom(450)
+    checksums = _checksums(data)
+    fd = _write(tmp_path, b"prefix" + data + checksums.encode() + b"next record")
+    try:
+        assert read_chunk_checksums(fd, 6, len(data)) == checksums
+    finally:
+        os.close(fd)
+    assert load_chunk_checksums(tmp_path / "block.dat", 6, len(data)) == checksums
+
+
+def test_missing_or_damaged_trailer_returns_none(tmp_path):
+    data = os.urandom(450)
+    trailer = bytearray(_checksums(data).encode())
+
+    # Bloque anterior al formato: nada después de los datos
+    fd = _write(tmp_path, data)
+    assert read_chunk_checksums(fd, 0, len(data)) is None
+    os.close(fd)
+
+    # Un CRC alterado no coincide con el crc32 de la lista
+    damaged = bytearray(trailer)
+    damaged[TRAILER_HEADER.size] ^= 0xFF
+    fd = _write(tmp_path, data + bytes(damaged))
+    assert read_chunk_checksums(fd, 0, len(data)) is None
+    os.close(fd)
+
+    # Lista truncada
+    fd = _write(tmp_path, data + bytes(trailer[:-2]))
+    assert read_chunk_checksums(fd, 0, len(data)) is None
+    os.close(fd)
+
+
+def test_find_corrupt_and_mismatches():
+    data = bytearray(os.urandom(450))
+    checksums = _checksums(bytes(data))
+    data[250] ^= 0x01
+
+    assert checksums.chunk_span(150, 260) == range(1, 3)
+    assert checksums.chunk_span(10, 10) == range(0)
+    assert checksums.find_corrupt(bytes(data[200:]), 2) == [2]
+    assert checksums.mismatches(_checksums(bytes(data))) == [2]
+    assert checksums.mismatches(_checksums(bytes(data[:150]))) == [1, 2, 3, 4]
+
+
+def test_corrupt_chunk_is_detected_on_disk(client, store_block):
+    chunk_size = ChunkHasher().chunk_size
+    data = os.urandom(3 * chunk_size + 10)
+    block_id = store_block(data)
+
+    listing = client.get(f"/blocks/{block_id}/checksums").json()
+    assert listing["chunk_size"] == chunk_size
+    assert listing["checksums"] == [zlib.crc32(data[i:i + chunk_size]) for i in range(0, len(data), chunk_size)]
+
+    location = blocks.backend_storage.get_block_location(block_id)
+    with open(location.path, "r+b") as f:
+        f.seek(location.offset + chunk_size + 5)
+        f.write(bytes([data[chunk_size + 5] ^ 0xFF]))
+
+    full = client.post(f"/blocks/verify/{block_id}").json()
+    assert not full["is_valid"]
+    assert full["corrupt_chunks"] == [1]
+    assert full["expected_checksum"] == hashlib.sha256(data).hexdigest()
+
+    # Un rango que no toca el fragmento dañado sigue siendo válido
+    clean = client.post(f"/blocks/verify/{block_id}", params={"offset": 2 * chunk_size, "length": 100}).json()
+    assert clean["is_valid"] and clean["corrupt_chunks"] == []
+    ranged = client.post(f"/blocks/verify/{block_id}", params={"offset": chunk_size, "length": 10}).json()
+    assert ranged["corrupt_chunks"] == [1]
+
+    # La descarga de un rango dañado se corta en lugar de enviar datos corruptos
+    with pytest.raises(RuntimeError):
+        client.get(f"/blocks/download/{block_id}", headers={"range": f"bytes={chunk_size}-{chunk_size + 9}"})
@@ -0,0 +1,76 @@
+import hashlib
+import os
+
+DATA = os.urandom(1000)
+ETAG = f'"{hashlib.sha256(DATA).hexdigest()}"'
+
+
+def _download(client, block_id: str, **headers):
+    return client.get(f"/blocks/download/{block_id}", headers=headers)
+
+
+def test_full_download_carries_etag(client, store_block):
+    block_id = store_block(DATA)
+    response = _download(client, block_id)
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["etag"] == ETAG
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_range_requests(client, store_block):
+    block_id = store_block(DATA)
+
+    response = _download(client, block_id, range="bytes=10-19")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 10-19/1000"
+    assert response.content == DATA[10:20]
+
+    # Sufijo y rango abierto
+    assert _download(client, block_id, range="bytes=-5").content == DATA[-5:]
+    assert _download(client, block_id, range="bytes=990-").content == DATA[990:]
+    # Un fin más allá del bloque se recorta
+    assert _download(client, block_id, range="bytes=995-5000").content == DATA[995:]
+
+
+def test_unsatisfiable_range_returns_416(client, store_block):
+    block_id = store_block(DATA)
+    response = _download(client, block_id, range="bytes=1000-")
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1000"
+
+
+def test_multiple_ranges_serve_whole_block(client, store_block):
+    block_id = store_block(DATA)
+    response = _download(client, block_id, range="bytes=0-1,5-6")
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_range_and_if_none_match(client, store_block):
+    block_id = store_block(DATA)
+
+    matching = _download(client, block_id, range="bytes=0-9", **{"if-range": ETAG})
+    assert matching.status_code == 206
+    assert matching.content == DATA[:10]
+
+    # Otra versión: se ignora el rango y se sirve el bloque completo
+    stale = _download(client, block_id, range="bytes=0-9", **{"if-range": '"other"'})
+    assert stale.status_code == 200
+    assert stale.content == DATA
+
+    not_modified = _download(client, block_id, **{"if-none-match": ETAG})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+
+def test_head_sends_headers_only(client, store_block):
+    block_id = store_block(DATA)
+    response = client.head(f"/blocks/download/{block_id}", headers={"range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.headers["content-length"] == "100"
+    assert response.content == b""
+
+
+def test_missing_block_returns_404(client):
+    assert _download(client, "00000000-0000-0000-0000-000000000000").status_code == 404
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import os
+from functools import partial
+
+import pytest
+
+from app.services.block_scrubber import BlockScrubber
+from app.storage import segment_storage
+from app.storage.block_storage import open_block_file
+from app.storage.segment_storage import TOMBSTONE, SegmentBlockStorage
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    # Segmentos chicos para que unos pocos bloques llenen varios
+    monkeypatch.setattr(segment_storage, "SEGMENT_SIZE", 4000)
+    monkeypatch.setattr(segment_storage, "COMPACTION_THRESHOLD", 0.3)
+
+
+def _data(i: int, size: int = 500) -> bytes:
+    return bytes([i % 256]) * size
+
+
+async def _store(storage: SegmentBlockStorage, block_id: str, data: bytes):
+    assert await storage.store_block(block_id, data, hashlib.sha256(data).hexdigest())
+
+
+def test_recovery_keeps_latest_sequence(tmp_path):
+    """Al recuperar gana el registro de mayor secuencia de cada bloque, en cualquier segmento"""
+    async def scenario():
+        storage = SegmentBlockStorage(str(tmp_path))
+        for i in range(12):
+            await _store(storage, f"b{i}", _data(i))
+        await _store(storage, "b0", _data(100))
+        assert await storage.delete_block("b1")
+        await _store(storage, "b2", _data(102))
+        assert await storage.delete_block("b2")
+        assert await storage.delete_block("b3")
+        await _store(storage, "b3", _data(103))
+
+    asyncio.run(scenario())
+
+    async def reload():
+        storage = SegmentBlockStorage(str(tmp_path))
+        return storage, {block_id: await storage.retrieve_block(block_id) for block_id in storage.entries}
+
+    storage, blocks = asyncio.run(reload())
+    assert sorted(blocks) == sorted(f"b{i}" for i in range(12) if i not in (1, 2))
+    assert blocks["b0"] == _data(100)
+    assert blocks["b3"] == _data(103)
+    assert storage._next_seq > max(entry.seq for entry in storage.entries.values())
+
+
+def test_torn_record_is_truncated(tmp_path):
+    """Un registro incompleto al final de un segmento se trunca y no oculta los siguientes"""
+    async def write(storage, block_id, i):
+        await _store(storage, block_id, _data(i))
+
+    storage = SegmentBlockStorage(str(tmp_path))
+    asyncio.run(write(storage, "a", 1))
+    path = storage._segment_path(storage.entries["a"].segment)
+    size = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b"\x01\x02torn")
+
+    storage = SegmentBlockStorage(str(tmp_path))
+    assert path.stat().st_size == size
+    asyncio.run(write(storage, "b", 2))
+    assert set(SegmentBlockStorage(str(tmp_path)).entries) == {"a", "b"}
+
+
+def test_compaction_keeps_deletes_across_restart(tmp_path):
+    """Compactar no revive bloques borrados ni pierde los vivos"""
+    async def scenario():
+        storage = SegmentBlockStorage(str(tmp_path))
+        for i in range(30):
+            await _store(storage, f"b{i}", _data(i))
+        for i in range(0, 30, 2):
+            assert await storage.delete_block(f"b{i}")
+        for _ in range(3):
+            await storage.compact()
+        return set(storage.entries)
+
+    live = asyncio.run(scenario())
+    assert live == {f"b{i}" for i in range(1, 30, 2)}
+
+    async def reload():
+        storage = SegmentBlockStorage(str(tmp_path))
+        return {block_id: await storage.retrieve_block(block_id) for block_id in storage.entries}
+
+    blocks = asyncio.run(reload())
+    assert blocks == {f"b{i}": _data(i) for i in range(1, 30, 2)}
+
+
+def test_delete_during_compaction_covers_the_copy(tmp_path):
+    """Un bloque que la compactación mueve mientras su tombstone está pendiente no revive"""
+    async def scenario():
+        storage = SegmentBlockStorage(str(tmp_path))
+        for i in range(10):
+            await _store(storage, f"b{i}", _data(i))
+        for i in range(2, 6):
+            assert await storage.delete_block(f"b{i}")
+        for i in range(20, 40):
+            await _store(storage, f"c{i}", _data(i))
+        original_segment = storage.entries["b0"].segment
+
+        targets = []
+        append = storage._append
+
+        def spy(kind, block_id, seq, target, *args, **kwargs):
+            if kind == TOMBSTONE and block_id == "b0":
+                targets.append(target)
+            return append(kind, block_id, seq, target, *args, **kwargs)
+
+        storage._append = spy
+        compaction = asyncio.create_task(storage.compact())
+        await asyncio.sleep(0)
+        assert await storage.delete_block("b0")
+        await compaction
+        storage._append = append
+
+        # Compactar el resto hasta eliminar el segmento original del bloque
+        for _ in range(6):
+            for i in range(20, 40):
+                assert await storage.delete_block(f"c{i}")
+                await _store(storage, f"c{i}", _data(i))
+            await storage.compact()
+        return original_segment, targets
+
+    original_segment, targets = asyncio.run(scenario())
+    assert targets[0] == original_segment
+    assert len(targets) == 2 and targets[1] != original_segment
+    storage = SegmentBlockStorage(str(tmp_path))
+    assert "b0" not in storage.entries
+    assert "b1" in storage.entries
+
+
+def test_failed_tombstone_keeps_block(tmp_path):
+    """Si el tombstone no llega al disco el bloque sigue disponible"""
+    async def scenario():
+        storage = SegmentBlockStorage(str(tmp_path))
+        await _store(storage, "a", _data(1))
+
+        def fail(batch):
+            raise OSError(5, "Input/output error")
+
+        storage._write_batch = fail
+        deleted = await storage.delete_block("a")
+        return deleted, await storage.retrieve_block("a"), storage.get_storage_usage()
+
+    deleted, data, usage = asyncio.run(scenario())
+    assert not deleted
+    assert data == _data(1)
+    assert usage["block_count"] == 1
+
+
+def test_reader_of_compacted_segment_relocates(tmp_path):
+    """Una ubicación resuelta antes de compactar sigue sirviendo el bloque tras eliminar el segmento"""
+    async def scenario():
+        storage = SegmentBlockStorage(str(tmp_path))
+        for i in range(20):
+            await _store(storage, f"b{i}", _data(i))
+        first_segment = storage.entries["b0"].segment
+        for i in range(20):
+            if i != 1 and storage.entries[f"b{i}"].segment == first_segment:
+                assert await storage.delete_block(f"b{i}")
+
+        location = storage.get_block_location("b1")
+        # La primera pasada retira el segmento; la siguiente lo elimina
+        await storage.compact()
+        await storage.compact()
+        assert not location.path.exists()
+
+        with pytest.raises(FileNotFoundError):
+            await open_block_file(location)
+        relocate = partial(storage.get_block_location, "b1")
+        fd, current = await open_block_file(location, relocate)
+        try:
+            data = os.pread(fd, current.size, current.offset)
+        finally:
+            os.close(fd)
+        return data, location.checksum, await BlockScrubber.hash_block(location, relocate=relocate)
+
+    data, checksum, calculated = asyncio.run(scenario())
+    assert data == _data(1)
+    assert calculated == checksum
@@ -1,4 +1,4 @@
 # API module
-from . import auth, files, public
+from . import auth, datanodes, files, public
 
-__all__ = ["auth", "files", "public"]
+__all__ = ["auth", "datanodes", "files", "public"]
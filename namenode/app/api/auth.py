@@ -1,10 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional
 from ..database import get_db
-from ..services.auth_service import AuthService
+from ..services.auth_service import (
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    AuthService,
+    PasswordHashingBusyError,
+)
 from ..models.user import User
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
@@ -29,6 +33,11 @@ class UserResponse(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # segundos
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -36,7 +45,7 @@ class TokenData(BaseModel):
 # Dependencias
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -44,22 +53,34 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    username = AuthService.verify_token(token)
-    if username is None:
-        raise credentials_exception
-    
-    user = AuthService.get_user_by_username(db, username)
+    # Un token ya validado se resuelve desde la caché, sin consultar la base de datos
+    user = await AuthService.get_user_for_token(db, token)
     if user is None:
         raise credentials_exception
     
     return user
 
+def _issue_tokens(username: str) -> dict:
+    return {
+        "access_token": AuthService.create_access_token(data={"sub": username}),
+        "token_type": "bearer",
+        "refresh_token": AuthService.create_refresh_token(username),
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def _busy_exception(error: Exception) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": "1"},
+    )
+
 # Endpoints
 @router.post("/register", response_model=UserResponse)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Registra un nuevo usuario"""
     # Verificar si el usuario ya existe
-    existing_user = AuthService.get_user_by_username(db, user_data.username)
+    existing_user = await AuthService.get_user_by_username(db, user_data.username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -67,12 +88,15 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Crear nuevo usuario
-    user = AuthService.create_user(
-        db=db,
-        username=user_data.username,
-        email=user_data.email,
-        password=user_data.password
-    )
+    try:
+        user = await AuthService.create_user(
+            db=db,
+            username=user_data.username,
+            email=user_data.email,
+            password=user_data.password
+        )
+    except PasswordHashingBusyError as e:
+        raise _busy_exception(e)
     
     return UserResponse(
         id=user.id,
@@ -81,9 +105,12 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """Autentica un usuario y retorna un token JWT"""
-    user = AuthService.authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await AuthService.authenticate_user(db, form_data.username, form_data.password)
+    except PasswordHashingBusyError as e:
+        raise _busy_exception(e)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -91,11 +118,26 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = AuthService.create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    return _issue_tokens(user.username)
+
+@router.post("/refresh", response_model=Token)
+async def refresh(request: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """Emite un token de acceso nuevo a partir de un refresh token (sin bcrypt)"""
+    payload = AuthService.decode_token(request.refresh_token, token_type="refresh")
+    user = None
+    if payload is not None:
+        user = await AuthService.get_user_by_username(db, payload["sub"])
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return _issue_tokens(user.username)
 
 @router.get("/me", response_model=UserResponse)
-def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: User = Depends(get_current_user)):
     """Obtiene información del usuario actual"""
     return UserResponse(
         id=current_user.id,
@@ -0,0 +1,102 @@
+import hmac
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_db
+from ..services.corrupt_block_service import CorruptBlockService
+from ..services.gc_service import GCService
+
+router = APIRouter(prefix="/datanodes", tags=["datanodes"])
+
+# Secreto compartido con los DataNodes; sin configurar se rechazan sus reportes
+DATANODE_TOKEN = os.getenv("DATANODE_TOKEN", "")
+
+
+async def verify_datanode(x_datanode_token: Optional[str] = Header(None)):
+    """Autentica a un DataNode por el secreto compartido"""
+    if not DATANODE_TOKEN or not hmac.compare_digest(
+        (x_datanode_token or "").encode(), DATANODE_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid DataNode token"
+        )
+
+
+# Modelos Pydantic
+class ReportedBlock(BaseModel):
+    block_id: str
+    size: int
+    created_at: Optional[str] = None
+
+
+class BlockReport(BaseModel):
+    node_id: str
+    datanode_url: str
+    blocks: List[ReportedBlock]
+
+
+class BlockReportResponse(BaseModel):
+    blocks_to_delete: List[str]
+
+
+class CorruptBlock(BaseModel):
+    block_id: str
+    expected_checksum: str
+    calculated_checksum: str
+    # Fragmentos dañados, si el bloque tiene checksums de fragmento
+    chunk_size: Optional[int] = None
+    corrupt_chunks: Optional[List[int]] = None
+
+
+class CorruptBlockReport(BaseModel):
+    node_id: str
+    datanode_url: str
+    blocks: List[CorruptBlock]
+
+
+class CorruptBlockInfo(CorruptBlock):
+    node_id: str
+    datanode_url: str
+    reported_at: str
+    file_id: Optional[int] = None
+    block_index: Optional[int] = None
+
+
+# Endpoints
+@router.post(
+    "/block-report",
+    response_model=BlockReportResponse,
+    dependencies=[Depends(verify_datanode)],
+)
+async def block_report(report: BlockReport, db: AsyncSession = Depends(get_db)):
+    """Recibe el reporte de bloques de un DataNode y retorna los bloques huérfanos a eliminar"""
+    CorruptBlockService.prune(report.datanode_url, [block.block_id for block in report.blocks])
+    orphans = await GCService.find_orphan_blocks(
+        db, report.datanode_url, [block.model_dump() for block in report.blocks]
+    )
+    if orphans:
+        print(
+            f"GC: {len(orphans)} bloques huérfanos en {report.node_id} "
+            f"({len(report.blocks)} reportados)"
+        )
+
+    return BlockReportResponse(blocks_to_delete=orphans)
+
+
+@router.post("/corrupt-blocks", dependencies=[Depends(verify_datanode)])
+async def report_corrupt_blocks(report: CorruptBlockReport):
+    """Recibe los bloques corruptos detectados por el verificador de un DataNode"""
+    recorded = CorruptBlockService.record(
+        report.node_id, report.datanode_url, [block.model_dump() for block in report.blocks]
+    )
+    return {"recorded": recorded}
+
+
+@router.get("/corrupt-blocks", response_model=List[CorruptBlockInfo])
+async def list_corrupt_blocks(db: AsyncSession = Depends(get_db)):
+    """Lista los bloques corruptos reportados por los DataNodes"""
+    return await CorruptBlockService.list_blocks(db)
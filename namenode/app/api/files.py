@@ -1,15 +1,32 @@
+import base64
+import json
+import os
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 
-from fastapi import APIRouter, Body, Depends, HTTPException, status
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
+from common.tracing import span
+
+from ..database import AsyncSessionLocal, get_db
 from ..models.block import Block
+from ..models.directory import Directory
 from ..models.file import File
 from ..models.user import User
+from ..services.block_map_service import BlockMapService
 from ..services.file_service import FileService
+from ..services.job_service import JobService
+from ..services.memory_namespace import DirectoryNode
+from ..services.namespace_service import (
+    NamespaceError,
+    NamespaceService,
+    PathConflictError,
+    PathNotFoundError,
+)
 from .auth import get_current_user
 
 router = APIRouter(prefix="/files", tags=["files"])
@@ -30,15 +47,46 @@ class FileResponse(BaseModel):
         from_attributes = True
 
 
+class NamespaceEntry(BaseModel):
+    type: str  # "directory" o "file"
+    id: int
+    name: str
+    path: str
+    size: Optional[int] = None
+    num_blocks: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+
+class DirectoryListing(BaseModel):
+    entries: List[NamespaceEntry]
+    next_cursor: Optional[str] = None
+
+
 class FileUploadRequest(BaseModel):
     filename: str
     filepath: str
     size: int
+    # "full": lista de bloques en block_distribution; "compact": solo placement
+    plan: str = "full"
+    # True: el cliente confirmará el upload con POST /files/{file_id}/commit
+    # y hasta entonces el archivo puede eliminarse como abandonado
+    commit: bool = False
+
+
+class PlacementPlan(BaseModel):
+    datanodes: List[str]
+    start: int
+    stride: int
+    num_blocks: int
+    block_size: int
+    last_block_size: int
 
 
 class FileUploadResponse(BaseModel):
     file_id: int
-    block_distribution: List[dict]
+    block_size: int
+    block_distribution: Optional[List[dict]] = None
+    placement: PlacementPlan
 
 
 class BlockInfo(BaseModel):
@@ -54,102 +102,376 @@ class FileInfo(BaseModel):
     blocks: List[BlockInfo]
 
 
+# Bloques por petición en /files/register-blocks
+REGISTER_BATCH_MAX_BLOCKS = int(os.getenv("REGISTER_BATCH_MAX_BLOCKS", 10000))
+
+
 class BlockRegistrationRequest(BaseModel):
-    block_index: int
+    # El mapa de bloques compacto guarda el índice como u32
+    block_index: int = Field(ge=0, le=2**32 - 1)
     block_size: int
     datanode_url: str
     checksum: str
 
 
+class BlockBatchRegistrationRequest(BaseModel):
+    blocks: List[BlockRegistrationRequest] = Field(min_length=1, max_length=REGISTER_BATCH_MAX_BLOCKS)
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    type: str
+    target: str
+    status: str
+    total: Optional[int] = None
+    processed: int
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+# Paginación de listados
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", 1000))
+LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", 10000))
+
+
+def _entry_key(entry: Union[Directory, File]) -> Tuple[str, str]:
+    """Clave de ordenamiento (tipo, nombre) de una entrada del listado"""
+    if isinstance(entry, (Directory, DirectoryNode)):
+        return "directory", entry.name
+    return "file", entry.name
+
+
+def _encode_cursor(entry: Union[Directory, File]) -> str:
+    """Codifica la clave de la última entrada de una página como cursor opaco"""
+    raw = json.dumps(_entry_key(entry)).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        entry_type, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if entry_type not in ("directory", "file"):
+        raise ValueError("Invalid cursor")
+    return entry_type, name
+
+
+def _namespace_entry(entry: Union[Directory, File], parent_path: str) -> dict:
+    """Convierte un directorio o archivo en una entrada del listado"""
+    if isinstance(entry, (Directory, DirectoryNode)):
+        return {
+            "type": "directory",
+            "id": entry.id,
+            "name": entry.name,
+            "path": NamespaceService.join_path(parent_path, entry.name),
+            "size": None,
+            "num_blocks": None,
+            "created_at": entry.created_at,
+        }
+    return {
+        "type": "file",
+        "id": entry.id,
+        "name": entry.name,
+        "path": NamespaceService.join_path(parent_path, entry.name),
+        "size": entry.size,
+        "num_blocks": entry.num_blocks,
+        "created_at": entry.created_at,
+    }
+
+
+def _isoformat(value: datetime) -> str:
+    return value.isoformat()
+
+
+async def _resolve_listing_directory(db: AsyncSession, directory: str, owner_id: int) -> Directory:
+    try:
+        parent = await NamespaceService.resolve_directory(db, directory, owner_id)
+    except NamespaceError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if parent is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Directory not found"
+        )
+    return parent
+
+
+def _file_info_response(request: Request, file: File, rows: List[Tuple]):
+    """Arma la respuesta con el mapa de bloques, compacta si el cliente la acepta"""
+    if BlockMapService.accepts(request.headers.get("accept")):
+        file_info = FileResponse.model_validate(file).model_dump(mode="json")
+        content = BlockMapService.encode(file_info, rows)
+        if content is not None:
+            return Response(content=content, media_type=BlockMapService.MEDIA_TYPE)
+
+    return FileInfo(
+        file=file,
+        blocks=[
+            BlockInfo(
+                block_id=block_id,
+                block_index=block_index,
+                size=size,
+                datanode_url=datanode_url,
+                checksum=checksum,
+            )
+            for block_id, block_index, size, datanode_url, checksum in rows
+        ],
+    )
+
+
 # Endpoints
 @router.post("/upload", response_model=FileUploadResponse)
-def upload_file(
+async def upload_file(
     file_data: FileUploadRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Inicia el proceso de upload de un archivo"""
+    try:
+        # Crear los directorios padre que falten
+        parent_path, name = NamespaceService.split_path(file_data.filepath)
+        if not name:
+            raise NamespaceError("Invalid file path")
+        parent = await NamespaceService.make_directories(db, parent_path, current_user.id)
+    except PathConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except NamespaceError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
     # Verificar si el archivo ya existe
-    existing_file = FileService.get_file_by_path(
-        db, file_data.filepath, current_user.id
-    )
-    if existing_file:
+    if await NamespaceService.get_child_file(db, parent.id, name):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="File already exists"
+        )
+    if await NamespaceService.get_child_directory(db, parent.id, name):
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="File already exists"
+            status_code=status.HTTP_409_CONFLICT, detail="A directory exists at that path"
         )
 
     # Crear metadatos del archivo
-    file = FileService.create_file_metadata(
-        db=db,
-        filename=file_data.filename,
-        filepath=file_data.filepath,
-        size=file_data.size,
-        owner_id=current_user.id,
+    try:
+        file = await FileService.create_file_metadata(
+            db=db,
+            filename=file_data.filename,
+            filepath=NamespaceService.join_path(parent_path, name),
+            size=file_data.size,
+            owner_id=current_user.id,
+            parent_id=parent.id,
+            name=name,
+            pending=file_data.commit,
+        )
+    except PathConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except IntegrityError:
+        # Un upload concurrente creó el mismo nombre después de la verificación
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="File already exists"
+        )
+
+    with span("plan", size=file_data.size) as plan:
+        # Obtener DataNodes disponibles
+        datanodes = FileService.get_available_datanodes()
+        if not datanodes:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="No DataNodes available",
+            )
+
+        # Distribuir bloques: el plan compacto cuesta O(1) sea cual sea el archivo
+        placement = FileService.plan_placement(file_data.size, datanodes)
+        plan.set(blocks=placement["num_blocks"])
+
+    # Los clientes anteriores reciben además la lista expandida, bloque por bloque
+    block_distribution = None
+    if file_data.plan != "compact":
+        block_distribution = list(FileService.expand_placement(placement))
+
+    return FileUploadResponse(
+        file_id=file.id,
+        block_size=file.block_size,
+        block_distribution=block_distribution,
+        placement=placement,
     )
 
-    # Obtener DataNodes disponibles
-    datanodes = FileService.get_available_datanodes()
-    if not datanodes:
+
+@router.get("/list", response_model=DirectoryListing)
+async def list_files(
+    directory: str = "/",
+    limit: int = Query(LIST_PAGE_SIZE, ge=1, le=LIST_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Lista una página de un nivel de un directorio: subdirectorios y archivos"""
+    parent = await _resolve_listing_directory(db, directory, current_user.id)
+    try:
+        after = _decode_cursor(cursor) if cursor else None
+    except ValueError:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="No DataNodes available",
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
         )
 
-    # Distribuir bloques
-    block_distribution = FileService.distribute_blocks(file_data.size, datanodes)
+    parent_path = NamespaceService.normalize_path(directory)
+    entries = await NamespaceService.list_directory_page(db, parent, limit, after)
+
+    next_cursor = None
+    if len(entries) == limit:
+        next_cursor = _encode_cursor(entries[-1])
 
-    return FileUploadResponse(file_id=file.id, block_distribution=block_distribution)
+    return DirectoryListing(
+        entries=[_namespace_entry(entry, parent_path) for entry in entries],
+        next_cursor=next_cursor,
+    )
 
 
-@router.get("/list", response_model=List[FileResponse])
-def list_files(
+@router.get("/list/stream")
+async def stream_files(
     directory: str = "/",
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+):
+    """Lista un nivel completo de un directorio como NDJSON (una entrada por línea)"""
+    parent = await _resolve_listing_directory(db, directory, current_user.id)
+    parent_path = NamespaceService.normalize_path(directory)
+
+    async def generate():
+        after = None
+        while True:
+            entries = await NamespaceService.list_directory_page(
+                db, parent, LIST_MAX_PAGE_SIZE, after
+            )
+            if not entries:
+                break
+            yield "".join(
+                json.dumps(_namespace_entry(entry, parent_path), default=_isoformat) + "\n"
+                for entry in entries
+            )
+            if len(entries) < LIST_MAX_PAGE_SIZE:
+                break
+            after = _entry_key(entries[-1])
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/stat", response_model=FileResponse)
+async def stat_file(
+    path: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Obtiene los metadatos de un archivo por su ruta"""
+    try:
+        file = await FileService.get_file_by_path(db, path, current_user.id)
+    except NamespaceError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not file:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+        )
+
+    return file
+
+
+@router.delete(
+    "/rmdir", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED
+)
+async def remove_directory(
+    dirpath: str,
+    current_user: User = Depends(get_current_user),
+):
+    """Inicia el borrado recursivo de un directorio como trabajo en segundo plano"""
+    try:
+        job = await JobService.start_remove_directory(AsyncSessionLocal, dirpath, current_user.id)
+    except PathNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job_status(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
 ):
-    """Lista los archivos de un usuario en un directorio"""
-    files = FileService.list_user_files(db, current_user.id, directory)
-    return files
+    """Obtiene el progreso de un trabajo en segundo plano"""
+    job = JobService.get_job(job_id, current_user.id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
 
+    return job
 
-@router.get("/{file_id}", response_model=FileInfo)
-def get_file_info(
+
+@router.get(
+    "/{file_id}",
+    response_model=FileInfo,
+    responses={200: {"content": {BlockMapService.MEDIA_TYPE: {}}}},
+)
+async def get_file_info(
     file_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Obtiene información detallada de un archivo y sus bloques"""
-    file = FileService.get_file_by_id(db, file_id, current_user.id)
+    """Obtiene información detallada de un archivo y sus bloques.
+
+    Con `Accept: application/vnd.griddfs.blockmap` el mapa de bloques se
+    retorna en el formato binario compacto (ver BlockMapService).
+    """
+    file = await FileService.get_file_by_id(db, file_id, current_user.id)
     if not file:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
         )
 
-    blocks = FileService.get_file_blocks(db, file_id)
+    rows = await FileService.get_file_block_rows(db, file_id)
+    return _file_info_response(request, file, rows)
 
-    return FileInfo(
-        file=file,
-        blocks=[
-            BlockInfo(
-                block_id=block.block_id,
-                block_index=block.block_index,
-                size=block.size,
-                datanode_url=block.datanode_url,
-                checksum=block.checksum,
-            )
-            for block in blocks
-        ],
-    )
+
+@router.get(
+    "/{file_id}/blocks",
+    response_model=FileInfo,
+    responses={200: {"content": {BlockMapService.MEDIA_TYPE: {}}}},
+)
+async def get_file_block_range(
+    file_id: int,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    length: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Bloques que cubren el rango de bytes [offset, offset + length) de un archivo.
+
+    Sin `length` el rango llega hasta el final del archivo. Solo se leen los
+    bloques del rango, así que el costo es proporcional a los bloques
+    tocados y no al tamaño del archivo. Negocia el mismo formato compacto
+    que `GET /files/{file_id}`.
+    """
+    file = await FileService.get_file_by_id(db, file_id, current_user.id)
+    if not file:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+        )
+
+    block_range = FileService.block_range(file.size, file.block_size, offset, length)
+    if block_range is None:
+        rows = []
+    else:
+        rows = await FileService.get_file_block_rows(db, file_id, *block_range)
+    return _file_info_response(request, file, rows)
 
 
 @router.delete("/{file_id}")
-def delete_file(
+async def delete_file(
     file_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Elimina un archivo"""
-    success = FileService.delete_file(db, file_id, current_user.id)
+    success = await FileService.delete_file(db, file_id, current_user.id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
@@ -159,50 +481,66 @@ def delete_file(
 
 
 @router.post("/mkdir")
-def create_directory(
+async def create_directory(
     dirpath: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Crea un directorio"""
-    success = FileService.create_directory(db, dirpath, current_user.id)
+    """Crea un directorio y los padres que falten"""
+    try:
+        await NamespaceService.make_directories(db, dirpath, current_user.id)
+    except PathConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except NamespaceError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
     return {"message": "Directory created successfully"}
 
 
-@router.delete("/rmdir")
-def remove_directory(
-    dirpath: str,
+@router.post("/rename")
+async def rename_path(
+    src: str,
+    dst: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    """Elimina un directorio y todos sus archivos"""
-    success = FileService.remove_directory(db, dirpath, current_user.id)
-    return {"message": "Directory removed successfully"}
+    """Renombra o mueve un archivo o directorio"""
+    try:
+        await NamespaceService.rename(db, src, dst, current_user.id)
+    except PathNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except PathConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except NamespaceError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"message": "Path renamed successfully"}
 
 
 @router.post("/register-block/{file_id}")
-def register_block(
+async def register_block(
     file_id: int,
     request: BlockRegistrationRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Registra un bloque en el NameNode"""
     try:
-        file = FileService.get_file_by_id(db, file_id, current_user.id)
+        file = await FileService.get_file_by_id(db, file_id, current_user.id)
         if not file:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
             )
 
-        block = FileService.assign_block_to_datanode(
-            db=db,
-            file_id=file_id,
-            block_index=request.block_index,
-            block_size=request.block_size,
-            datanode_url=request.datanode_url,
-            checksum=request.checksum,
-        )
+        with span("register", block_index=request.block_index):
+            block = await FileService.assign_block_to_datanode(
+                db=db,
+                file_id=file_id,
+                block_index=request.block_index,
+                block_size=request.block_size,
+                datanode_url=request.datanode_url,
+                checksum=request.checksum,
+            )
 
         return {"block_id": block.block_id, "message": "Block registered successfully"}
     except Exception as e:
@@ -213,6 +551,51 @@ def register_block(
         )
 
 
+@router.post("/register-blocks/{file_id}")
+async def register_blocks(
+    file_id: int,
+    request: BlockBatchRegistrationRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Registra un lote de bloques en el NameNode con una sola escritura de metadatos"""
+    file = await FileService.get_file_by_id(db, file_id, current_user.id)
+    if not file:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+        )
+
+    with span("register", blocks=len(request.blocks)):
+        try:
+            blocks = await FileService.assign_blocks_to_datanodes(
+                db, file_id, [block.model_dump() for block in request.blocks]
+            )
+        except PathNotFoundError as e:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    return {
+        "block_ids": [block.block_id for block in blocks],
+        "message": "Blocks registered successfully",
+    }
+
+
+@router.post("/{file_id}/commit")
+async def commit_file(
+    file_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Confirma un upload después de subir todos los bloques a los DataNodes"""
+    try:
+        await FileService.commit_file(db, file_id, current_user.id)
+    except PathNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except PathConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+    return {"message": "File committed successfully"}
+
+
 @router.get("/test-endpoint", include_in_schema=False)
 def test_endpoint():
     """Endpoint de prueba"""
@@ -1,32 +1,104 @@
-from sqlalchemy import create_engine
+from sqlalchemy import event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
-import sqlite3
 
 # URL de la base de datos SQLite
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/namenode.db")
 
-# Crear el motor de la base de datos
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+# Drivers asíncronos para las URLs síncronas de configuraciones anteriores
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+# Pool de conexiones
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # segundos
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # segundos
+
+# Pragmas de SQLite. Con WAL las lecturas no bloquean al escritor; FULL
+# mantiene la durabilidad de cada commit, cuyo costo se reparte entre las
+# operaciones de un lote (ver MetadataWriter).
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "FULL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),  # milisegundos
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -65536)),  # negativo: KiB
+    "temp_store": "MEMORY",
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 268435456)),  # bytes
+}
+
+
+def get_async_database_url(url: str) -> str:
+    """Convierte una URL síncrona ("sqlite:///...") a su driver asíncrono"""
+    scheme, separator, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+
+ASYNC_DATABASE_URL = get_async_database_url(DATABASE_URL)
+
+# Crear el motor de la base de datos. aiosqlite usa NullPool por defecto
+# (una conexión y un hilo nuevos por sesión), así que el pool se fija
+# explícitamente para reutilizar conexiones.
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
 )
 
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Aplica los pragmas a cada conexión nueva del pool"""
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 # Crear la sesión
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 # Base para los modelos
 Base = declarative_base()
 
 # Función para obtener la sesión de la base de datos
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # Función para crear las tablas
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+# Función para actualizar bases de datos creadas con versiones anteriores
+def upgrade_schema(conn):
+    """Agrega las columnas e índices nuevos a las tablas existentes.
+
+    create_all solo crea las tablas que faltan; las columnas nuevas deben
+    ser nullable para poder agregarse sobre tablas con datos.
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                ))
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
@@ -1,10 +1,18 @@
+import asyncio
 import os
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .api import auth, files, public
-from .database import create_tables
+from common import profiling, tracing
+
+from .api import auth, datanodes, files, public
+from . import metrics, query_stats
+from .database import AsyncSessionLocal, create_tables, engine
+from .services.gc_service import GCService
+from .services.memory_namespace import memory_namespace
+from .services.metadata_writer import metadata_writer
+from .services.namespace_service import NamespaceService
 
 # Crear la aplicación FastAPI
 app = FastAPI(
@@ -22,21 +30,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas de Prometheus (latencia por ruta, peticiones en curso, consultas)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Consultas por petición, consultas lentas y presupuesto de consultas (N+1)
+app.add_middleware(query_stats.QueryStatsMiddleware)
+query_stats.instrument_engine(engine.sync_engine)
+
+# Perfilado opcional por petición y registro de peticiones lentas
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Trazas distribuidas (contexto propagado en la cabecera traceparent)
+app.add_middleware(tracing.TracingMiddleware)
+
 # Incluir routers
 app.include_router(auth.router)
 app.include_router(files.router)
 app.include_router(public.router)
+app.include_router(datanodes.router)
+app.include_router(metrics.router)
+app.include_router(profiling.router)
+app.include_router(tracing.router)
 
 
 @app.on_event("startup")
 async def startup_event():
     """Evento que se ejecuta al iniciar la aplicación"""
     # Crear las tablas de la base de datos
-    create_tables()
+    await create_tables()
+    # Escritor de metadatos con group commit
+    metadata_writer.start(AsyncSessionLocal)
+    # Ubicar en el árbol de directorios los archivos de versiones anteriores
+    async with AsyncSessionLocal() as db:
+        await NamespaceService.backfill_legacy_files(db)
+    # Cargar el espacio de nombres en memoria (imagen + edit log)
+    if memory_namespace.enabled:
+        await memory_namespace.load(AsyncSessionLocal)
+        app.state.checkpointer = asyncio.create_task(memory_namespace.run_checkpointer())
+    # Barrido periódico de uploads abandonados
+    app.state.gc_sweeper = asyncio.create_task(
+        GCService.run_abandoned_upload_sweeper(AsyncSessionLocal)
+    )
     print("NameNode iniciado correctamente")
     print(f"Block size configurado: {os.getenv('BLOCK_SIZE', '67108864')} bytes")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Evento que se ejecuta al detener la aplicación"""
+    await metadata_writer.stop()
+    if memory_namespace.enabled:
+        await memory_namespace.close()
+
+
 @app.get("/")
 async def root():
     """Endpoint raíz"""
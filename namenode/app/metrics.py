@@ -0,0 +1,108 @@
+import time
+from typing import Callable, Dict
+
+from fastapi import APIRouter, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    GCCollector,
+    Histogram,
+    PlatformCollector,
+    ProcessCollector,
+    generate_latest,
+)
+
+# Registro propio del servicio (más las métricas estándar del proceso)
+REGISTRY = CollectorRegistry()
+ProcessCollector(registry=REGISTRY)
+PlatformCollector(registry=REGISTRY)
+GCCollector(registry=REGISTRY)
+
+# Métricas HTTP (etiquetadas por plantilla de ruta para acotar la cardinalidad)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latencia de las peticiones HTTP",
+    ["method", "route"],
+    registry=REGISTRY,
+)
+REQUESTS_TOTAL = Counter(
+    "http_requests_total",
+    "Peticiones HTTP atendidas",
+    ["method", "route", "status"],
+    registry=REGISTRY,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Peticiones HTTP en curso",
+    registry=REGISTRY,
+)
+
+# Métricas de la base de datos de metadatos
+DB_QUERY_LATENCY = Histogram(
+    "namenode_db_query_duration_seconds",
+    "Duración de las consultas a la base de datos de metadatos",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+    registry=REGISTRY,
+)
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas en formato de exposición de Prometheus"""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide latencia, estado y concurrencia de cada petición.
+
+    Es ASGI puro (sin BaseHTTPMiddleware) para que el costo por petición se
+    limite a dos lecturas de reloj y la actualización de tres métricas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[Callable, str] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec()
+            route = self._route_template(scope)
+            REQUEST_LATENCY.labels(scope["method"], route).observe(elapsed)
+            REQUESTS_TOTAL.labels(scope["method"], route, str(status_code)).inc()
+
+    def _route_template(self, scope) -> str:
+        # El router deja el endpoint resuelto en el scope; se traduce a su plantilla
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get(endpoint)
+        if route is None:
+            for candidate in scope["app"].routes:
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+            else:
+                route = "unmatched"
+            self._routes[endpoint] = route
+        return route
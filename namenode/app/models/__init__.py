@@ -1,5 +1,6 @@
 from .user import User
 from .file import File
 from .block import Block
+from .directory import Directory
 
-__all__ = ["User", "File", "Block"]
+__all__ = ["User", "File", "Block", "Directory"]
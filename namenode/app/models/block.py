@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
@@ -17,3 +17,8 @@ class Block(Base):
 
     # Relaciones
     file = relationship("File", back_populates="blocks")
+
+    __table_args__ = (
+        # Mapa de bloques de un archivo en orden y consultas por rango de bytes
+        Index("ix_blocks_file_block_index", "file_id", "block_index"),
+    )
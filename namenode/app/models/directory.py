@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from ..database import Base
+
+class Directory(Base):
+    __tablename__ = "directories"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)  # Nombre dentro del directorio padre ("" para la raíz)
+    parent_id = Column(Integer, ForeignKey("directories.id"), nullable=True)  # NULL para la raíz
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relaciones
+    owner = relationship("User", back_populates="directories")
+
+    __table_args__ = (
+        # Búsqueda de un hijo por nombre y listado de un nivel
+        Index("ix_directories_parent_name", "parent_id", "name", unique=True),
+        # Una sola raíz por usuario
+        Index(
+            "ix_directories_owner_root", "owner_id", unique=True,
+            sqlite_where=parent_id.is_(None), postgresql_where=parent_id.is_(None)
+        ),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
@@ -9,13 +9,21 @@ class File(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
     filepath = Column(String, nullable=False)  # Ruta completa del archivo
+    name = Column(String, nullable=True)  # Nombre dentro del directorio padre
+    parent_id = Column(Integer, ForeignKey("directories.id"), nullable=True)  # Directorio padre
     size = Column(BigInteger, nullable=False)  # Tamaño en bytes
     block_size = Column(Integer, nullable=False)  # Tamaño de bloque configurado
     num_blocks = Column(Integer, nullable=False)  # Número de bloques
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    pending = Column(Boolean, nullable=True)  # Upload sin confirmar (NULL en archivos anteriores)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relaciones
     owner = relationship("User", back_populates="files")
     blocks = relationship("Block", back_populates="file", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Búsqueda de un archivo por nombre y listado de un nivel
+        Index("ix_files_parent_name", "parent_id", "name", unique=True),
+    )
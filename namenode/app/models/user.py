@@ -15,3 +15,4 @@ class User(Base):
 
     # Relaciones
     files = relationship("File", back_populates="owner")
+    directories = relationship("Directory", back_populates="owner")
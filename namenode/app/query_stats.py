@@ -0,0 +1,136 @@
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import DB_QUERY_LATENCY
+
+# Consultas más lentas que el umbral se registran con la cantidad y el tipo de sus parámetros
+SLOW_QUERY_THRESHOLD = float(os.getenv("SLOW_QUERY_THRESHOLD", 0.1))  # segundos
+# Consultas por petición a partir de las cuales se emite una advertencia (0 la desactiva)
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", 20))
+# Modo debug: la respuesta informa las consultas ejecutadas por la petición
+QUERY_DEBUG_HEADERS = os.getenv("QUERY_DEBUG_HEADERS", "false").lower() == "true"
+# Largo máximo de la sentencia en el log
+QUERY_LOG_MAX_LENGTH = 500
+
+
+class RequestQueryStats:
+    """Consultas ejecutadas durante una petición"""
+
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def most_repeated(self):
+        """(sentencia, repeticiones) de la sentencia más repetida"""
+        return self.statements.most_common(1)[0] if self.statements else (None, 0)
+
+
+_request_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+
+def _shorten(value) -> str:
+    text = " ".join(str(value).split())
+    if len(text) > QUERY_LOG_MAX_LENGTH:
+        return text[:QUERY_LOG_MAX_LENGTH] + "..."
+    return text
+
+
+def _describe_parameters(parameters, executemany: bool) -> str:
+    """Cantidad y tipos de los parámetros, nunca sus valores (pueden traer datos de usuarios)"""
+    rows = ""
+    if executemany:
+        rows = f"{len(parameters)} filas, "
+        parameters = parameters[0] if parameters else ()
+    if isinstance(parameters, dict):
+        types = [type(value).__name__ for value in parameters.values()]
+    else:
+        types = [type(value).__name__ for value in parameters or ()]
+    return f"{rows}{len(types)} parámetros ({', '.join(types)})"
+
+
+def instrument_engine(engine: Engine):
+    """Mide cada consulta del motor: métrica, consultas por petición y log de lentas.
+
+    Los eventos se ejecutan dentro del greenlet con el que SQLAlchemy corre
+    el driver asíncrono, que hereda el contexto de la tarea que hizo la
+    consulta: así cada consulta se atribuye a la petición que la originó.
+    Las escrituras agrupadas del MetadataWriter corren en su propia tarea y
+    no cuentan para ninguna petición.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        DB_QUERY_LATENCY.observe(elapsed)
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+
+        if elapsed >= SLOW_QUERY_THRESHOLD:
+            print(
+                f"Consulta lenta ({elapsed * 1000:.1f} ms): {_shorten(statement)} "
+                f"[{_shorten(_describe_parameters(parameters, executemany))}]"
+            )
+
+
+class QueryStatsMiddleware:
+    """Middleware ASGI que cuenta las consultas de cada petición.
+
+    Si una petición supera QUERY_BUDGET consultas se registra una
+    advertencia con la sentencia más repetida (el síntoma típico de un
+    N+1). Con QUERY_DEBUG_HEADERS la respuesta trae `X-Query-Count` y
+    `Server-Timing` con las consultas hechas hasta enviar las cabeceras.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            if QUERY_DEBUG_HEADERS and message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-query-count", str(stats.count).encode()),
+                    (
+                        b"server-timing",
+                        f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'.encode(),
+                    ),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            if QUERY_BUDGET and stats.count > QUERY_BUDGET:
+                statement, repetitions = stats.most_repeated()
+                print(
+                    f"Advertencia: {scope['method']} {scope['path']} ejecutó {stats.count} "
+                    f"consultas ({stats.duration * 1000:.1f} ms), presupuesto {QUERY_BUDGET}; "
+                    f"la más repetida ({repetitions} veces): {_shorten(statement)}"
+                )
@@ -1,20 +1,111 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models.user import User
+import asyncio
 import os
+import time
+import uuid
 
 # Configuración de seguridad
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
+
+# Caché de usuarios autenticados
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", 60))  # segundos
+
+# Pool de hilos exclusivo para bcrypt: una ráfaga de logins no ocupa los
+# hilos que usa el resto del NameNode
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", 2))
+# Operaciones de bcrypt en espera antes de rechazar logins con 503
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", 64))
 
 # Contexto para hashing de contraseñas
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_executor = ThreadPoolExecutor(
+    max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt"
+)
+
+
+class PasswordHashingBusyError(Exception):
+    """El pool de bcrypt tiene demasiadas operaciones en espera"""
+
+
+class PrincipalCache:
+    """Caché LRU acotada de usuarios autenticados, indexada por token.
+
+    Una entrada vive como máximo AUTH_CACHE_TTL segundos y nunca más allá
+    de la expiración del token, así que una petición autenticada con un
+    token ya visto no decodifica el JWT ni consulta la base de datos. Las
+    entradas de un usuario se invalidan cuando su fila cambia a través del
+    ORM; el TTL acota la vigencia ante cambios hechos por fuera de él.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[User, float]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[User]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if time.time() >= expires_at:
+            self._remove(token)
+            return None
+        self._entries.move_to_end(token)
+        return user
+
+    def put(self, token: str, user: User, token_expires_at: float):
+        if self.max_size <= 0:
+            return
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (user, min(time.time() + self.ttl, token_expires_at))
+        self._tokens_by_user.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        for token in self._tokens_by_user.pop(user_id, set()):
+            self._entries.pop(token, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def _remove(self, token: str):
+        user, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user.id]
+
+
+principal_cache = PrincipalCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_user(mapper, connection, target):
+    """Descarta los tokens en caché de un usuario modificado o eliminado"""
+    principal_cache.invalidate_user(target.id)
+
 
 class AuthService:
+    _pending_hashes = 0
+
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         """Verifica si la contraseña coincide con el hash"""
@@ -25,6 +116,18 @@ class AuthService:
         """Genera el hash de una contraseña"""
         return pwd_context.hash(password)
 
+    @staticmethod
+    async def run_password_hashing(function, *args):
+        """Ejecuta una operación de bcrypt en su pool acotado, fuera del event loop"""
+        if AuthService._pending_hashes >= BCRYPT_MAX_PENDING:
+            raise PasswordHashingBusyError("Too many concurrent logins")
+        AuthService._pending_hashes += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(password_executor, function, *args)
+        finally:
+            AuthService._pending_hashes -= 1
+
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         """Crea un token JWT de acceso"""
@@ -34,47 +137,86 @@ class AuthService:
         else:
             expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         
-        to_encode.update({"exp": expire})
+        to_encode.update({"exp": expire, "type": "access"})
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
         return encoded_jwt
 
     @staticmethod
-    def verify_token(token: str) -> Optional[str]:
-        """Verifica y decodifica un token JWT"""
+    def create_refresh_token(username: str) -> str:
+        """Crea un token JWT de larga duración que solo sirve para renovar el de acceso"""
+        expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        return jwt.encode(
+            {"sub": username, "exp": expire, "type": "refresh", "jti": str(uuid.uuid4())},
+            SECRET_KEY,
+            algorithm=ALGORITHM,
+        )
+
+    @staticmethod
+    def decode_token(token: str, token_type: str = "access") -> Optional[dict]:
+        """Verifica un token JWT del tipo indicado y retorna su payload"""
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            username: str = payload.get("sub")
-            if username is None:
-                return None
-            return username
         except JWTError:
             return None
+        if payload.get("sub") is None:
+            return None
+        # Los tokens emitidos antes de los refresh tokens no traen tipo: son de acceso
+        if payload.get("type", "access") != token_type:
+            return None
+        return payload
 
     @staticmethod
-    def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+    def verify_token(token: str) -> Optional[str]:
+        """Verifica y decodifica un token JWT"""
+        payload = AuthService.decode_token(token)
+        return payload["sub"] if payload else None
+
+    @staticmethod
+    async def get_user_for_token(db: AsyncSession, token: str) -> Optional[User]:
+        """Obtiene el usuario de un token, usando la caché de usuarios autenticados"""
+        user = principal_cache.get(token)
+        if user is not None:
+            return user
+
+        payload = AuthService.decode_token(token)
+        if payload is None:
+            return None
+        user = await AuthService.get_user_by_username(db, payload["sub"])
+        if user is not None:
+            principal_cache.put(token, user, float(payload["exp"]))
+        return user
+
+    @staticmethod
+    async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
         """Autentica un usuario con username y password"""
-        user = db.query(User).filter(User.username == username).first()
+        user = await AuthService.get_user_by_username(db, username)
         if not user:
             return None
-        if not AuthService.verify_password(password, user.hashed_password):
+        # bcrypt es costoso a propósito: ejecutarlo fuera del event loop
+        if not await AuthService.run_password_hashing(
+            AuthService.verify_password, password, user.hashed_password
+        ):
             return None
         return user
 
     @staticmethod
-    def create_user(db: Session, username: str, email: str, password: str) -> User:
+    async def create_user(db: AsyncSession, username: str, email: str, password: str) -> User:
         """Crea un nuevo usuario"""
-        hashed_password = AuthService.get_password_hash(password)
+        hashed_password = await AuthService.run_password_hashing(
+            AuthService.get_password_hash, password
+        )
         db_user = User(
             username=username,
             email=email,
             hashed_password=hashed_password
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
 
     @staticmethod
-    def get_user_by_username(db: Session, username: str) -> Optional[User]:
+    async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
         """Obtiene un usuario por username"""
-        return db.query(User).filter(User.username == username).first()
+        result = await db.execute(select(User).where(User.username == username))
+        return result.scalars().first()
@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.block import Block
+from .memory_namespace import memory_namespace
+
+
+class CorruptBlockService:
+    """Registro en memoria de los bloques corruptos reportados por los DataNodes.
+
+    Como el mapa de réplicas corruptas de HDFS, no se persiste: los
+    verificadores de los DataNodes lo reconstruyen en cada pasada. Un bloque
+    sale del registro cuando su DataNode deja de reportarlo en el reporte de
+    bloques (fue eliminado).
+    """
+
+    # block_id -> detalle del reporte
+    blocks: Dict[str, Dict] = {}
+    # Tamaño de los lotes de IDs consultados en la base de datos
+    QUERY_CHUNK_SIZE = 500
+
+    @staticmethod
+    def record(node_id: str, datanode_url: str, reported_blocks: List[Dict]) -> int:
+        """Registra los bloques corruptos de un reporte; retorna los nuevos"""
+        recorded = 0
+        reported_at = datetime.utcnow().isoformat()
+        for block in reported_blocks:
+            if block["block_id"] not in CorruptBlockService.blocks:
+                recorded += 1
+                print(f"Bloque corrupto {block['block_id']} en {node_id}")
+            CorruptBlockService.blocks[block["block_id"]] = {
+                **block,
+                "node_id": node_id,
+                "datanode_url": datanode_url,
+                "reported_at": reported_at,
+            }
+        return recorded
+
+    @staticmethod
+    def prune(datanode_url: str, reported_block_ids: List[str]):
+        """Descarta los bloques corruptos de un DataNode que ya no los tiene"""
+        present = set(reported_block_ids)
+        for block_id, block in list(CorruptBlockService.blocks.items()):
+            if block["datanode_url"] == datanode_url and block_id not in present:
+                del CorruptBlockService.blocks[block_id]
+
+    @staticmethod
+    async def list_blocks(db: AsyncSession) -> List[Dict]:
+        """Bloques corruptos, con el archivo al que pertenecen (None si ya no existe)"""
+        block_ids = list(CorruptBlockService.blocks)
+        owners: Dict[str, tuple] = {}
+        if memory_namespace.enabled:
+            for block_id in block_ids:
+                node = memory_namespace.blocks.get(block_id)
+                if node is not None:
+                    owners[block_id] = (node.file_id, node.block_index)
+        else:
+            for start in range(0, len(block_ids), CorruptBlockService.QUERY_CHUNK_SIZE):
+                chunk = block_ids[start:start + CorruptBlockService.QUERY_CHUNK_SIZE]
+                result = await db.execute(
+                    select(Block.block_id, Block.file_id, Block.block_index).where(
+                        Block.block_id.in_(chunk)
+                    )
+                )
+                for block_id, file_id, block_index in result.all():
+                    owners[block_id] = (file_id, block_index)
+
+        return [
+            {
+                **CorruptBlockService.blocks[block_id],
+                "file_id": owners.get(block_id, (None, None))[0],
+                "block_index": owners.get(block_id, (None, None))[1],
+            }
+            for block_id in block_ids
+        ]
@@ -0,0 +1,214 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import os
+
+
+class EditLogError(Exception):
+    """El edit log dejó de aceptar operaciones tras una escritura fallida"""
+
+
+class EditLog:
+    """Registro de operaciones sobre el espacio de nombres en memoria.
+
+    Cada mutación se agrega como una línea JSON con un txid creciente. Las
+    líneas pendientes se escriben juntas y con un solo fsync (group commit):
+    mientras un lote se sincroniza, las mutaciones que llegan forman el
+    siguiente. El registro se divide en segmentos `edits_<primer txid>.log`
+    que se descartan una vez cubiertos por un checkpoint.
+
+    Si una escritura falla, las operaciones del lote ya están aplicadas en
+    memoria pero no en disco: el registro rechaza toda operación posterior
+    (falla cerrado) hasta reiniciar, y el arranque recupera el estado durable.
+    """
+
+    SEGMENT_PREFIX = "edits_"
+    SEGMENT_SUFFIX = ".log"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.last_txid = 0
+        self.synced_txid = 0
+        self.failed: Optional[Exception] = None
+        self._fd: Optional[int] = None
+        self._segment_start = 0
+        self._pending: List[Tuple[int, bytes, asyncio.Future]] = []
+        self._last_future: Optional[asyncio.Future] = None
+        self._roll_after: Optional[int] = None
+        self._roll_waiters: List[asyncio.Future] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    # Recuperación
+    def segments(self) -> List[Tuple[int, str]]:
+        """Retorna los segmentos existentes como (primer txid, ruta), en orden"""
+        segments = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith(self.SEGMENT_PREFIX) and filename.endswith(self.SEGMENT_SUFFIX):
+                start = filename[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)]
+                if start.isdigit():
+                    segments.append((int(start), os.path.join(self.directory, filename)))
+        return sorted(segments)
+
+    def replay(self, after_txid: int, upto_txid: Optional[int] = None) -> Iterator[Dict]:
+        """Itera las operaciones registradas después de un txid (y hasta `upto_txid`).
+
+        Una línea incompleta al final de un segmento (caída a mitad de una
+        escritura) nunca se confirmó al cliente: se trunca el segmento en la
+        última línea válida y se continúa con los segmentos siguientes, que
+        el arranque posterior a la caída abrió a continuación.
+        """
+        for start, path in self.segments():
+            if upto_txid is not None and start > upto_txid:
+                return
+            valid_length = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    record = None
+                    if line.endswith(b"\n"):
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            pass
+                    if record is None:
+                        print(f"Edit log: registro incompleto descartado en {path}")
+                        f.close()
+                        os.truncate(path, valid_length)
+                        break
+                    valid_length += len(line)
+                    if upto_txid is not None and record["txid"] > upto_txid:
+                        return
+                    if record["txid"] > after_txid:
+                        yield record
+
+    # Escritura
+    def open(self, last_txid: int):
+        """Abre un segmento nuevo a continuación del último txid recuperado"""
+        self.last_txid = self.synced_txid = last_txid
+        self._open_segment(last_txid + 1)
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._run_writer())
+
+    def check_writable(self):
+        """Falla si una escritura anterior falló: la memoria ya no coincide con el disco"""
+        if self.failed is not None:
+            raise EditLogError(f"Edit log unavailable after a failed write: {self.failed}")
+
+    def append(self, record: Dict) -> asyncio.Future:
+        """Agrega una operación y retorna un future que se resuelve cuando es durable"""
+        self.check_writable()
+        self.last_txid += 1
+        record["txid"] = self.last_txid
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((self.last_txid, (json.dumps(record) + "\n").encode(), future))
+        self._last_future = future
+        self._wakeup.set()
+        return future
+
+    async def sync(self):
+        """Espera a que todas las operaciones agregadas hasta ahora sean durables"""
+        if self._last_future is not None and not self._last_future.done():
+            await asyncio.shield(self._last_future)
+
+    def roll(self) -> asyncio.Future:
+        """Cierra el segmento actual tras el último txid agregado.
+
+        Las operaciones posteriores van a un segmento nuevo, de modo que el
+        anterior puede descartarse cuando un checkpoint cubra su último txid.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._roll_after = self.last_txid
+        self._roll_waiters.append(future)
+        self._wakeup.set()
+        return future
+
+    def purge_segments(self, upto_txid: int) -> int:
+        """Elimina los segmentos cerrados cubiertos por un checkpoint"""
+        removed = 0
+        for start, path in self.segments():
+            if start <= upto_txid and start != self._segment_start:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    async def close(self):
+        await self.sync()
+        if self._writer:
+            self._writer.cancel()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _open_segment(self, start_txid: int):
+        path = os.path.join(
+            self.directory, f"{self.SEGMENT_PREFIX}{start_txid:020d}{self.SEGMENT_SUFFIX}"
+        )
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._segment_start = start_txid
+
+    async def _run_writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            roll_after, self._roll_after = self._roll_after, None
+            roll_waiters, self._roll_waiters = self._roll_waiters, []
+            if not batch and roll_after is None:
+                continue
+
+            try:
+                if self.failed is not None:
+                    raise EditLogError(f"Edit log unavailable after a failed write: {self.failed}")
+                await asyncio.to_thread(self._write_batch, batch, roll_after)
+            except Exception as e:
+                if self.failed is None:
+                    print(
+                        f"Edit log: error escribiendo {len(batch)} operaciones: {e}; "
+                        f"no se aceptan más operaciones hasta reiniciar"
+                    )
+                    self.failed = e
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                for future in roll_waiters:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            if batch:
+                self.synced_txid = batch[-1][0]
+            for txid, _, future in batch:
+                if not future.done():
+                    future.set_result(txid)
+            for future in roll_waiters:
+                if not future.done():
+                    future.set_result(roll_after)
+
+    def _write_batch(self, batch: List[Tuple[int, bytes, asyncio.Future]], roll_after: Optional[int]):
+        """Escribe un lote con un fsync por segmento (se ejecuta en un hilo)"""
+        if roll_after is None:
+            self._write_lines(line for _, line, _ in batch)
+            return
+
+        self._write_lines(line for txid, line, _ in batch if txid <= roll_after)
+        if roll_after + 1 != self._segment_start:
+            os.close(self._fd)
+            self._open_segment(roll_after + 1)
+        rest = [line for txid, line, _ in batch if txid > roll_after]
+        if rest:
+            self._write_lines(rest)
+
+    def _write_lines(self, lines):
+        data = memoryview(b"".join(lines))
+        offset = os.lseek(self._fd, 0, os.SEEK_END)
+        try:
+            while data:
+                data = data[os.write(self._fd, data):]
+            os.fsync(self._fd)
+        except OSError:
+            # No dejar un registro a medio escribir delante de los siguientes
+            try:
+                os.ftruncate(self._fd, offset)
+            except OSError:
+                pass
+            raise
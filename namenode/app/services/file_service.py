@@ -1,8 +1,14 @@
-from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models.file import File
 from ..models.block import Block
 from ..models.user import User
+from .memory_namespace import memory_namespace
+from .metadata_writer import metadata_writer
+from .namespace_errors import PathConflictError, PathNotFoundError
+from .namespace_service import NamespaceService
 import os
 import hashlib
 import uuid
@@ -26,100 +32,179 @@ class FileService:
         return hashlib.sha256(data).hexdigest()
 
     @staticmethod
-    def create_file_metadata(
-        db: Session, 
+    async def create_file_metadata(
+        db: AsyncSession, 
         filename: str, 
         filepath: str, 
         size: int, 
-        owner_id: int
+        owner_id: int,
+        parent_id: int,
+        name: str,
+        pending: bool = False
     ) -> File:
-        """Crea los metadatos de un archivo"""
+        """Crea los metadatos de un archivo.
+
+        Con `pending` el archivo queda sin confirmar hasta que el cliente
+        llama a commit_file tras subir todos sus bloques.
+        """
         num_blocks = FileService.calculate_file_blocks(size)
+        if memory_namespace.enabled:
+            NamespaceService.check_not_deleting(parent_id)
+            return await memory_namespace.create_file(
+                filename=filename,
+                size=size,
+                block_size=FileService.BLOCK_SIZE,
+                num_blocks=num_blocks,
+                owner_id=owner_id,
+                parent_id=parent_id,
+                name=name,
+                pending=pending
+            )
         
-        file = File(
-            filename=filename,
-            filepath=filepath,
-            size=size,
-            block_size=FileService.BLOCK_SIZE,
-            num_blocks=num_blocks,
-            owner_id=owner_id
-        )
-        
-        db.add(file)
-        db.commit()
-        db.refresh(file)
-        return file
+        async def create(writer_db: AsyncSession) -> File:
+            # Se verifica al escribir: el borrado pudo empezar mientras esperaba
+            NamespaceService.check_not_deleting(parent_id)
+            # created_at se fija aquí para no releer la fila después del commit
+            file = File(
+                filename=filename,
+                filepath=filepath,
+                name=name,
+                parent_id=parent_id,
+                size=size,
+                block_size=FileService.BLOCK_SIZE,
+                num_blocks=num_blocks,
+                owner_id=owner_id,
+                pending=pending or None,
+                created_at=datetime.utcnow()
+            )
+            writer_db.add(file)
+            await writer_db.flush()
+            return file
+
+        return await metadata_writer.submit(create)
 
     @staticmethod
-    def get_file_by_path(db: Session, filepath: str, owner_id: int) -> Optional[File]:
+    async def get_file_by_path(db: AsyncSession, filepath: str, owner_id: int) -> Optional[File]:
         """Obtiene un archivo por su ruta y propietario"""
-        return db.query(File).filter(
-            File.filepath == filepath,
-            File.owner_id == owner_id
-        ).first()
+        parent_path, name = NamespaceService.split_path(filepath)
+        parent = await NamespaceService.resolve_directory(db, parent_path, owner_id)
+        if parent is None:
+            return None
+        return await NamespaceService.get_child_file(db, parent.id, name)
 
     @staticmethod
-    def get_file_by_id(db: Session, file_id: int, owner_id: int) -> Optional[File]:
+    async def get_file_by_id(db: AsyncSession, file_id: int, owner_id: int) -> Optional[File]:
         """Obtiene un archivo por su ID y propietario"""
-        return db.query(File).filter(
-            File.id == file_id,
-            File.owner_id == owner_id
-        ).first()
+        if memory_namespace.enabled:
+            return memory_namespace.get_file(file_id, owner_id)
 
-    @staticmethod
-    def list_user_files(db: Session, owner_id: int, directory: str = "/") -> List[File]:
-        """Lista los archivos de un usuario en un directorio"""
-        return db.query(File).filter(
-            File.owner_id == owner_id,
-            File.filepath.like(f"{directory}%")
-        ).all()
+        result = await db.execute(
+            select(File).where(
+                File.id == file_id,
+                File.owner_id == owner_id
+            )
+        )
+        return result.scalars().first()
 
     @staticmethod
-    def delete_file(db: Session, file_id: int, owner_id: int) -> bool:
+    async def delete_file(db: AsyncSession, file_id: int, owner_id: int) -> bool:
         """Elimina un archivo y sus bloques"""
-        file = FileService.get_file_by_id(db, file_id, owner_id)
-        if not file:
-            return False
-        
-        # Eliminar bloques asociados
-        db.query(Block).filter(Block.file_id == file_id).delete()
-        
-        # Eliminar archivo
-        db.delete(file)
-        db.commit()
-        return True
-
-    @staticmethod
-    def create_directory(db: Session, dirpath: str, owner_id: int) -> bool:
-        """Crea un directorio (en GridDFS, los directorios son virtuales)"""
-        # En GridDFS, los directorios son implícitos basados en las rutas de archivos
-        # No necesitamos crear entradas en la base de datos para directorios
-        return True
-
-    @staticmethod
-    def remove_directory(db: Session, dirpath: str, owner_id: int) -> bool:
-        """Elimina un directorio y todos sus archivos"""
-        # Eliminar todos los archivos en el directorio
-        files = db.query(File).filter(
-            File.owner_id == owner_id,
-            File.filepath.like(f"{dirpath}%")
-        ).all()
-        
-        for file in files:
-            FileService.delete_file(db, file.id, owner_id)
-        
-        return True
+        if memory_namespace.enabled:
+            return await memory_namespace.delete_file(file_id, owner_id)
+
+        async def remove(writer_db: AsyncSession) -> bool:
+            file = await FileService.get_file_by_id(writer_db, file_id, owner_id)
+            if not file:
+                return False
+
+            # Eliminar bloques asociados (borrado por conjunto, sin cargar la relación)
+            await writer_db.execute(delete(Block).where(Block.file_id == file_id))
+
+            # Eliminar archivo
+            await writer_db.execute(delete(File).where(File.id == file_id))
+            return True
+
+        return await metadata_writer.submit(remove)
+
+    @staticmethod
+    async def commit_file(db: AsyncSession, file_id: int, owner_id: int):
+        """Confirma un upload una vez registrados todos sus bloques"""
+        if memory_namespace.enabled:
+            return await memory_namespace.commit_file(file_id, owner_id)
+
+        async def commit(writer_db: AsyncSession):
+            file = await FileService.get_file_by_id(writer_db, file_id, owner_id)
+            if not file:
+                raise PathNotFoundError("File not found")
+            registered = await writer_db.scalar(
+                select(func.count(Block.id)).where(Block.file_id == file_id)
+            )
+            if registered < file.num_blocks:
+                raise PathConflictError("File has missing blocks")
+            if file.pending:
+                await writer_db.execute(
+                    update(File).where(File.id == file_id).values(pending=None)
+                )
+
+        await metadata_writer.submit(commit)
 
     @staticmethod
-    def get_file_blocks(db: Session, file_id: int) -> List[Block]:
+    async def get_file_blocks(db: AsyncSession, file_id: int) -> List[Block]:
         """Obtiene todos los bloques de un archivo ordenados por índice"""
-        return db.query(Block).filter(
-            Block.file_id == file_id
-        ).order_by(Block.block_index).all()
+        if memory_namespace.enabled:
+            return memory_namespace.get_file_blocks(file_id)
+
+        result = await db.execute(
+            select(Block).where(
+                Block.file_id == file_id
+            ).order_by(Block.block_index)
+        )
+        return result.scalars().all()
+
+    @staticmethod
+    async def get_file_block_rows(
+        db: AsyncSession,
+        file_id: int,
+        first_index: Optional[int] = None,
+        last_index: Optional[int] = None
+    ) -> List[Tuple[str, int, int, str, str]]:
+        """Bloques de un archivo como tuplas (block_id, block_index, size, datanode_url, checksum).
+
+        Evita construir un objeto por bloque: es la lectura que usan los
+        formatos compactos para archivos con millones de bloques. Con
+        first_index/last_index solo se leen los bloques de ese rango
+        (índice (file_id, block_index)).
+        """
+        if memory_namespace.enabled:
+            return [
+                (block.block_id, block.block_index, block.size, block.datanode_url, block.checksum)
+                for block in memory_namespace.get_file_blocks(file_id, first_index, last_index)
+            ]
+
+        query = select(
+            Block.block_id, Block.block_index, Block.size, Block.datanode_url, Block.checksum
+        ).where(Block.file_id == file_id)
+        if first_index is not None:
+            query = query.where(Block.block_index >= first_index)
+        if last_index is not None:
+            query = query.where(Block.block_index <= last_index)
+        result = await db.execute(query.order_by(Block.block_index))
+        return [tuple(row) for row in result.all()]
+
+    @staticmethod
+    def block_range(file_size: int, block_size: int, offset: int, length: Optional[int]) -> Optional[Tuple[int, int]]:
+        """Índices (primero, último) de los bloques que cubren [offset, offset + length).
+
+        Retorna None si el rango no toca el archivo.
+        """
+        end = file_size if length is None else min(file_size, offset + length)
+        if offset >= end:
+            return None
+        return offset // block_size, (end - 1) // block_size
 
     @staticmethod
-    def assign_block_to_datanode(
-        db: Session,
+    async def assign_block_to_datanode(
+        db: AsyncSession,
         file_id: int,
         block_index: int,
         block_size: int,
@@ -128,20 +213,60 @@ class FileService:
     ) -> Block:
         """Asigna un bloque a un DataNode específico"""
         block_id = FileService.generate_block_id()
+        if memory_namespace.enabled:
+            return await memory_namespace.add_block(
+                file_id=file_id,
+                block_id=block_id,
+                block_index=block_index,
+                size=block_size,
+                datanode_url=datanode_url,
+                checksum=checksum
+            )
         
-        block = Block(
-            block_id=block_id,
-            file_id=file_id,
-            block_index=block_index,
-            size=block_size,
-            datanode_url=datanode_url,
-            checksum=checksum
-        )
-        
-        db.add(block)
-        db.commit()
-        db.refresh(block)
-        return block
+        async def register(writer_db: AsyncSession) -> Block:
+            block = Block(
+                block_id=block_id,
+                file_id=file_id,
+                block_index=block_index,
+                size=block_size,
+                datanode_url=datanode_url,
+                checksum=checksum,
+                created_at=datetime.utcnow()
+            )
+            writer_db.add(block)
+            await writer_db.flush()
+            return block
+
+        return await metadata_writer.submit(register)
+
+    @staticmethod
+    async def assign_blocks_to_datanodes(db: AsyncSession, file_id: int, blocks: List[Dict]) -> List[Block]:
+        """Asigna un lote de bloques con una sola escritura de metadatos.
+
+        Cada bloque trae `block_index`, `block_size`, `datanode_url` y
+        `checksum`; el resultado conserva el orden del lote.
+        """
+        records = [
+            {
+                "block_id": FileService.generate_block_id(),
+                "block_index": block["block_index"],
+                "size": block["block_size"],
+                "datanode_url": block["datanode_url"],
+                "checksum": block["checksum"],
+            }
+            for block in blocks
+        ]
+        if memory_namespace.enabled:
+            return await memory_namespace.add_blocks(file_id, records)
+
+        async def register(writer_db: AsyncSession) -> List[Block]:
+            created_at = datetime.utcnow()
+            rows = [Block(file_id=file_id, created_at=created_at, **record) for record in records]
+            writer_db.add_all(rows)
+            await writer_db.flush()
+            return rows
+
+        return await metadata_writer.submit(register)
 
     @staticmethod
     def get_available_datanodes() -> List[str]:
@@ -155,19 +280,38 @@ class FileService:
         ]
 
     @staticmethod
-    def distribute_blocks(file_size: int, datanodes: List[str]) -> List[Dict]:
-        """Distribuye los bloques entre los DataNodes disponibles"""
+    def plan_placement(file_size: int, datanodes: List[str]) -> Dict:
+        """Plan de ubicación compacto de los bloques de un archivo.
+
+        El bloque i va al DataNode `datanodes[(start + stride * i) % len(datanodes)]`
+        y mide `block_size`, salvo el último, que mide `last_block_size`. Se
+        calcula en O(1) y ocupa lo mismo sea cual sea el tamaño del archivo.
+        """
         num_blocks = FileService.calculate_file_blocks(file_size)
-        distribution = []
-        
-        for i in range(num_blocks):
-            datanode_index = i % len(datanodes)
-            block_size = min(FileService.BLOCK_SIZE, file_size - i * FileService.BLOCK_SIZE)
-            
-            distribution.append({
+        return {
+            "datanodes": datanodes,
+            "start": 0,
+            "stride": 1,
+            "num_blocks": num_blocks,
+            "block_size": FileService.BLOCK_SIZE,
+            "last_block_size": file_size - (num_blocks - 1) * FileService.BLOCK_SIZE if num_blocks else 0,
+        }
+
+    @staticmethod
+    def expand_placement(plan: Dict) -> Iterator[Dict]:
+        """Expande un plan de ubicación bloque por bloque"""
+        datanodes = plan["datanodes"]
+        last_index = plan["num_blocks"] - 1
+        for i in range(plan["num_blocks"]):
+            yield {
                 "block_index": i,
-                "datanode_url": datanodes[datanode_index],
-                "block_size": block_size
-            })
-        
-        return distribution
+                "datanode_url": datanodes[(plan["start"] + plan["stride"] * i) % len(datanodes)],
+                "block_size": plan["last_block_size"] if i == last_index else plan["block_size"],
+            }
+
+    @staticmethod
+    def distribute_blocks(file_size: int, datanodes: List[str]) -> List[Dict]:
+        """Distribuye los bloques entre los DataNodes disponibles"""
+        return list(FileService.expand_placement(
+            FileService.plan_placement(file_size, datanodes)
+        ))
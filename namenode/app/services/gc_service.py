@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+from typing import Dict, List
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.file import File
+from ..models.block import Block
+from .memory_namespace import memory_namespace
+import asyncio
+import os
+import time
+
+class GCService:
+    # Tiempo mínimo que debe tener un bloque antes de considerarlo huérfano.
+    # Protege los uploads en curso: el cliente puede escribir el bloque en el
+    # DataNode antes de registrarlo en el NameNode.
+    GRACE_PERIOD = int(os.getenv("GC_GRACE_PERIOD", 3600))  # segundos
+    # Máximo de bloques cuyo borrado se ordena en la respuesta a un reporte
+    MAX_DELETES_PER_REPORT = int(os.getenv("GC_MAX_DELETES_PER_REPORT", 1000))
+    # Tiempo tras el cual un upload sin confirmar o incompleto se considera abandonado
+    UPLOAD_TIMEOUT = int(os.getenv("GC_UPLOAD_TIMEOUT", 86400))  # segundos
+    # Intervalo entre barridos de uploads abandonados
+    SWEEP_INTERVAL = int(os.getenv("GC_SWEEP_INTERVAL", 600))  # segundos
+    # Tamaño de los lotes de IDs consultados en la base de datos
+    QUERY_CHUNK_SIZE = 500
+
+    @staticmethod
+    async def find_orphan_blocks(
+        db: AsyncSession, datanode_url: str, reported_blocks: List[Dict]
+    ) -> List[str]:
+        """Compara el reporte de un DataNode con los metadatos y retorna los bloques huérfanos.
+
+        Solo cuentan los bloques registrados en el DataNode que reporta: su
+        reporte no decide nada sobre los bloques ubicados en otros nodos.
+        """
+        now = time.time()
+        candidates = [
+            block["block_id"]
+            for block in reported_blocks
+            if now - float(block.get("created_at") or now) >= GCService.GRACE_PERIOD
+        ]
+
+        # Sin bloques registrados en el nodo (base de datos nueva o restaurada
+        # por error, o un DATANODE_URL distinto del que usa el NameNode) todos
+        # sus bloques parecerían huérfanos
+        if memory_namespace.enabled:
+            if not any(block.datanode_url == datanode_url for block in memory_namespace.blocks.values()):
+                print(f"GC: el NameNode no tiene bloques registrados en {datanode_url}, no se ordenan borrados")
+                return []
+            orphans = []
+            for block_id in candidates:
+                block = memory_namespace.blocks.get(block_id)
+                if block is None or block.datanode_url != datanode_url:
+                    orphans.append(block_id)
+            return orphans[:GCService.MAX_DELETES_PER_REPORT]
+
+        registered = await db.execute(
+            select(Block.id).where(Block.datanode_url == datanode_url).limit(1)
+        )
+        if registered.first() is None:
+            print(f"GC: el NameNode no tiene bloques registrados en {datanode_url}, no se ordenan borrados")
+            return []
+
+        known = set()
+        for start in range(0, len(candidates), GCService.QUERY_CHUNK_SIZE):
+            chunk = candidates[start:start + GCService.QUERY_CHUNK_SIZE]
+            result = await db.execute(
+                select(Block.block_id).where(
+                    Block.block_id.in_(chunk), Block.datanode_url == datanode_url
+                )
+            )
+            known.update(result.scalars().all())
+
+        orphans = [block_id for block_id in candidates if block_id not in known]
+        return orphans[:GCService.MAX_DELETES_PER_REPORT]
+
+    @staticmethod
+    async def purge_abandoned_uploads(db: AsyncSession) -> int:
+        """Elimina los metadatos de uploads que nunca se confirmaron o registraron todos sus bloques"""
+        cutoff = datetime.utcnow() - timedelta(seconds=GCService.UPLOAD_TIMEOUT)
+        if memory_namespace.enabled:
+            return await memory_namespace.purge_abandoned_uploads(cutoff)
+
+        registered = select(
+            Block.file_id,
+            func.count(Block.id).label("registered")
+        ).group_by(Block.file_id).subquery()
+
+        result = await db.execute(
+            select(File.id).outerjoin(
+                registered, registered.c.file_id == File.id
+            ).where(
+                File.created_at < cutoff,
+                or_(
+                    File.pending.is_(True),
+                    func.coalesce(registered.c.registered, 0) < File.num_blocks
+                )
+            )
+        )
+        file_ids = result.scalars().all()
+
+        # Los bloques que ya estaban en los DataNodes quedan huérfanos y se
+        # eliminan en el siguiente reporte de bloques de cada nodo
+        for start in range(0, len(file_ids), GCService.QUERY_CHUNK_SIZE):
+            chunk = file_ids[start:start + GCService.QUERY_CHUNK_SIZE]
+            await db.execute(delete(Block).where(Block.file_id.in_(chunk)))
+            await db.execute(delete(File).where(File.id.in_(chunk)))
+            await db.commit()
+
+        return len(file_ids)
+
+    @staticmethod
+    async def run_abandoned_upload_sweeper(session_factory):
+        """Barre periódicamente los uploads abandonados"""
+        while True:
+            await asyncio.sleep(GCService.SWEEP_INTERVAL)
+            try:
+                async with session_factory() as db:
+                    purged = await GCService.purge_abandoned_uploads(db)
+                if purged:
+                    print(f"GC: {purged} uploads abandonados eliminados")
+            except Exception as e:
+                print(f"GC: error barriendo uploads abandonados: {e}")
@@ -0,0 +1,158 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from .namespace_service import NamespaceService, PathNotFoundError
+import asyncio
+import os
+import uuid
+
+class JobService:
+    """Ejecuta operaciones largas sobre los metadatos como trabajos en segundo plano"""
+
+    # Archivos eliminados por transacción en un borrado recursivo
+    DELETE_CHUNK_SIZE = int(os.getenv("RMDIR_CHUNK_SIZE", 1000))
+    # Pausa entre lotes para liberar el lock de escritura de SQLite
+    DELETE_CHUNK_PAUSE = float(os.getenv("RMDIR_CHUNK_PAUSE", 0.05))  # segundos
+    # Trabajos terminados que se conservan para consultar su resultado
+    MAX_FINISHED_JOBS = 1000
+
+    _jobs: Dict[str, Dict] = {}
+    _tasks: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def get_job(job_id: str, owner_id: int) -> Optional[Dict]:
+        """Obtiene el estado de un trabajo del usuario"""
+        job = JobService._jobs.get(job_id)
+        if job is None or job["owner_id"] != owner_id:
+            return None
+        return job
+
+    @staticmethod
+    async def start_remove_directory(session_factory, dirpath: str, owner_id: int) -> Dict:
+        """Inicia el borrado recursivo de un directorio en segundo plano.
+
+        El directorio se resuelve (en el espacio del usuario) antes de crear
+        el trabajo: si no existe se lanza PathNotFoundError y no se encola
+        nada. El trabajo solo ejecuta el borrado.
+        """
+        subtree = await JobService._in_session(
+            session_factory, JobService._resolve_subtree, dirpath, owner_id
+        )
+        if subtree is None:
+            raise PathNotFoundError(f"Directory not found: {dirpath}")
+        directory_ids, removable_ids = subtree
+        # Marcados desde antes de responder: mkdir, upload y rename no crean
+        # entradas nuevas en ellos mientras dura el trabajo
+        NamespaceService.deleting.update(removable_ids)
+
+        JobService._prune_finished_jobs()
+
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "type": "rmdir",
+            "owner_id": owner_id,
+            "target": dirpath,
+            "status": "pending",
+            "total": None,
+            "processed": 0,
+            "error": None,
+            "created_at": datetime.utcnow(),
+            "finished_at": None,
+        }
+        JobService._jobs[job_id] = job
+        JobService._tasks[job_id] = asyncio.create_task(
+            JobService._run_remove_directory(session_factory, job, directory_ids, removable_ids)
+        )
+        return job
+
+    @staticmethod
+    async def _run_remove_directory(
+        session_factory, job: Dict, directory_ids: List[int], removable_ids: List[int]
+    ):
+        """Elimina los archivos del subárbol en lotes y luego sus directorios"""
+        job["status"] = "running"
+        kept_ids = set(directory_ids) - set(removable_ids)
+        try:
+            while True:
+                job["total"] = job["processed"] + await JobService._in_session(
+                    session_factory,
+                    NamespaceService.count_subtree_files, directory_ids
+                )
+                deleted = await JobService._remove_subtree_files(
+                    session_factory, job, directory_ids
+                )
+                # Una petición que pasó la verificación antes de marcar el
+                # subárbol puede terminar después: repetir hasta que no quede nada
+                rescanned = await JobService._in_session(
+                    session_factory,
+                    NamespaceService.subtree_directory_ids, directory_ids[0]
+                )
+                known_ids = kept_ids.union(removable_ids)
+                created = [
+                    directory_id for directory_id in rescanned if directory_id not in known_ids
+                ]
+                NamespaceService.deleting.update(created)
+                removable_ids = removable_ids + created
+                directory_ids = rescanned
+                if not created and deleted == 0:
+                    break
+
+            await JobService._in_session(
+                session_factory,
+                NamespaceService.remove_directories, removable_ids
+            )
+            job["status"] = "completed"
+        except Exception as e:
+            print(f"Error en trabajo {job['job_id']}: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            NamespaceService.deleting.difference_update(removable_ids)
+            job["finished_at"] = datetime.utcnow()
+            JobService._tasks.pop(job["job_id"], None)
+
+    @staticmethod
+    async def _remove_subtree_files(session_factory, job: Dict, directory_ids: List[int]) -> int:
+        """Elimina en lotes los archivos de los directorios; retorna cuántos eliminó"""
+        removed = 0
+        while True:
+            deleted = await JobService._in_session(
+                session_factory,
+                NamespaceService.remove_subtree_files_chunk, directory_ids,
+                JobService.DELETE_CHUNK_SIZE
+            )
+            if deleted == 0:
+                return removed
+            removed += deleted
+            job["processed"] += deleted
+            # Ceder el lock de escritura a las peticiones en primer plano
+            await asyncio.sleep(JobService.DELETE_CHUNK_PAUSE)
+
+    @staticmethod
+    async def _resolve_subtree(db, dirpath: str, owner_id: int) -> Optional[Tuple[List[int], List[int]]]:
+        """Retorna los IDs del subárbol y los de los directorios a eliminar (nunca la raíz)"""
+        directory = await NamespaceService.resolve_directory(db, dirpath, owner_id)
+        if directory is None:
+            return None
+
+        directory_ids = await NamespaceService.subtree_directory_ids(db, directory.id)
+        if directory.parent_id is None:
+            return directory_ids, directory_ids[1:]
+        return directory_ids, directory_ids
+
+    @staticmethod
+    async def _in_session(session_factory, operation, *args):
+        # Una sesión por lote: las conexiones vuelven al pool entre lotes
+        async with session_factory() as db:
+            return await operation(db, *args)
+
+    @staticmethod
+    def _prune_finished_jobs():
+        finished = [
+            job for job in JobService._jobs.values() if job["finished_at"] is not None
+        ]
+        excess = len(finished) - JobService.MAX_FINISHED_JOBS
+        if excess > 0:
+            finished.sort(key=lambda job: job["finished_at"])
+            for job in finished[:excess]:
+                del JobService._jobs[job["job_id"]]
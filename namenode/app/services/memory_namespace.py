@@ -0,0 +1,735 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Collection, Dict, List, Optional, Set, Tuple, Union
+from sqlalchemy import select
+from common.tracing import span
+from ..models.block import Block
+from ..models.directory import Directory
+from ..models.file import File
+from .edit_log import EditLog
+from .namespace_errors import PathConflictError, PathNotFoundError
+import asyncio
+import json
+import os
+import time
+
+
+class DirectoryNode:
+    """Directorio del espacio de nombres en memoria (mismos atributos que Directory)"""
+
+    __slots__ = (
+        "id", "name", "parent", "owner_id", "created_at",
+        "directories", "files", "directory_names", "file_names",
+    )
+
+    def __init__(self, id: int, name: str, owner_id: int, created_at: datetime):
+        self.id = id
+        self.name = name
+        self.parent: Optional["DirectoryNode"] = None
+        self.owner_id = owner_id
+        self.created_at = created_at
+        self.directories: Dict[str, "DirectoryNode"] = {}
+        self.files: Dict[str, "FileNode"] = {}
+        # Nombres ordenados para la paginación por keyset
+        self.directory_names: List[str] = []
+        self.file_names: List[str] = []
+
+    @property
+    def parent_id(self) -> Optional[int]:
+        return self.parent.id if self.parent else None
+
+    @property
+    def path(self) -> str:
+        names = []
+        directory = self
+        while directory.parent is not None:
+            names.append(directory.name)
+            directory = directory.parent
+        return "/" + "/".join(reversed(names))
+
+    def add_directory(self, directory: "DirectoryNode"):
+        directory.parent = self
+        self.directories[directory.name] = directory
+        insort(self.directory_names, directory.name)
+
+    def remove_directory(self, name: str):
+        del self.directories[name]
+        del self.directory_names[bisect_left(self.directory_names, name)]
+
+    def add_file(self, file: "FileNode"):
+        file.parent = self
+        self.files[file.name] = file
+        insort(self.file_names, file.name)
+
+    def remove_file(self, name: str):
+        del self.files[name]
+        del self.file_names[bisect_left(self.file_names, name)]
+
+
+class FileNode:
+    """Archivo del espacio de nombres en memoria (mismos atributos que File)"""
+
+    __slots__ = (
+        "id", "filename", "name", "parent", "size", "block_size", "num_blocks",
+        "owner_id", "created_at", "updated_at", "blocks", "pending",
+    )
+
+    def __init__(
+        self, id: int, filename: str, name: str, size: int, block_size: int,
+        num_blocks: int, owner_id: int, created_at: datetime,
+        updated_at: Optional[datetime] = None, pending: bool = False
+    ):
+        self.id = id
+        self.filename = filename
+        self.name = name
+        self.parent: Optional[DirectoryNode] = None
+        self.size = size
+        self.block_size = block_size
+        self.num_blocks = num_blocks
+        self.owner_id = owner_id
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.blocks: List["BlockNode"] = []
+        self.pending = pending
+
+    @property
+    def parent_id(self) -> Optional[int]:
+        return self.parent.id if self.parent else None
+
+    @property
+    def filepath(self) -> str:
+        # La ruta se deriva del árbol: renombrar un directorio no toca sus archivos
+        parent_path = self.parent.path if self.parent else "/"
+        return f"{parent_path.rstrip('/')}/{self.name}"
+
+
+class BlockNode:
+    """Bloque registrado de un archivo (mismos atributos que Block)"""
+
+    __slots__ = (
+        "block_id", "file_id", "block_index", "size", "datanode_url", "checksum", "created_at",
+    )
+
+    def __init__(
+        self, block_id: str, file_id: int, block_index: int, size: int,
+        datanode_url: str, checksum: str, created_at: datetime
+    ):
+        self.block_id = block_id
+        self.file_id = file_id
+        self.block_index = block_index
+        self.size = size
+        self.datanode_url = datanode_url
+        self.checksum = checksum
+        self.created_at = created_at
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _block_index(block: "BlockNode") -> int:
+    return block.block_index
+
+
+class MemoryNamespace:
+    """Espacio de nombres completo en memoria, al estilo del NameNode de HDFS.
+
+    El árbol de directorios, los archivos y el mapa de bloques viven en RAM:
+    listar, resolver rutas y consultar bloques no tocan la base de datos.
+    Cada mutación se aplica en memoria y se agrega al edit log; el llamador
+    recibe respuesta cuando la operación es durable. Los checkpoints
+    periódicos guardan una imagen del árbol y descartan el registro que
+    cubren, de modo que reiniciar cuesta cargar la imagen más las
+    operaciones posteriores a ella.
+    """
+
+    IMAGE_NAME = "fsimage.json"
+    IMAGE_VERSION = 2
+
+    # Operaciones del edit log desde el último checkpoint que disparan uno nuevo
+    CHECKPOINT_TXNS = int(os.getenv("CHECKPOINT_TXNS", 100000))
+    # Tiempo máximo entre checkpoints si hubo operaciones
+    CHECKPOINT_INTERVAL = int(os.getenv("CHECKPOINT_INTERVAL", 3600))  # segundos
+    # Frecuencia con que se evalúan las condiciones anteriores
+    CHECKPOINT_CHECK_INTERVAL = 60  # segundos
+
+    def __init__(self, path: str, enabled: bool):
+        self.path = path
+        self.enabled = enabled
+        self.edit_log = EditLog(path)
+        self.directories: Dict[int, DirectoryNode] = {}
+        self.roots: Dict[int, DirectoryNode] = {}
+        self.files: Dict[int, FileNode] = {}
+        self.blocks: Dict[str, BlockNode] = {}
+        # Archivos sin confirmar o con menos bloques registrados que los esperados
+        self.incomplete: Set[int] = set()
+        self.next_directory_id = 1
+        self.next_file_id = 1
+        self.checkpoint_txid = 0
+        self.last_checkpoint = time.time()
+        self._checkpoint_lock = asyncio.Lock()
+
+    # Consultas (en memoria, sin esperas)
+    def get_child_directory(self, parent_id: int, name: str) -> Optional[DirectoryNode]:
+        parent = self.directories.get(parent_id)
+        return parent.directories.get(name) if parent else None
+
+    def get_child_file(self, parent_id: int, name: str) -> Optional[FileNode]:
+        parent = self.directories.get(parent_id)
+        return parent.files.get(name) if parent else None
+
+    def get_file(self, file_id: int, owner_id: int) -> Optional[FileNode]:
+        file = self.files.get(file_id)
+        if file is None or file.owner_id != owner_id:
+            return None
+        return file
+
+    def get_file_blocks(
+        self, file_id: int, first_index: Optional[int] = None, last_index: Optional[int] = None
+    ) -> List[BlockNode]:
+        """Bloques de un archivo por índice, opcionalmente solo los de [first_index, last_index]"""
+        file = self.files.get(file_id)
+        if file is None:
+            return []
+        # file.blocks se mantiene ordenado por índice: un rango cuesta O(log n + k)
+        start = 0 if first_index is None else bisect_left(file.blocks, first_index, key=_block_index)
+        end = len(file.blocks) if last_index is None else bisect_right(file.blocks, last_index, key=_block_index)
+        return file.blocks[start:end]
+
+    def list_directory_page(
+        self,
+        directory: DirectoryNode,
+        limit: int,
+        after: Optional[Tuple[str, str]] = None
+    ) -> List[Union[DirectoryNode, FileNode]]:
+        """Lista una página de un nivel ordenada por (tipo, nombre)"""
+        after_type, after_name = after or ("directory", None)
+        entries: List[Union[DirectoryNode, FileNode]] = []
+
+        if after_type == "directory":
+            names = directory.directory_names
+            start = bisect_right(names, after_name) if after_name is not None else 0
+            entries.extend(directory.directories[name] for name in names[start:start + limit])
+            after_name = None
+
+        if len(entries) < limit:
+            names = directory.file_names
+            start = bisect_right(names, after_name) if after_name is not None else 0
+            remaining = limit - len(entries)
+            entries.extend(directory.files[name] for name in names[start:start + remaining])
+
+        return entries
+
+    def subtree_directory_ids(self, directory_id: int) -> List[int]:
+        subtree = [directory_id]
+        frontier = [self.directories[directory_id]] if directory_id in self.directories else []
+        while frontier:
+            children = [child for directory in frontier for child in directory.directories.values()]
+            subtree.extend(child.id for child in children)
+            frontier = children
+        return subtree
+
+    def count_subtree_files(self, directory_ids: List[int]) -> int:
+        return sum(
+            len(self.directories[directory_id].files)
+            for directory_id in directory_ids
+            if directory_id in self.directories
+        )
+
+    # Mutaciones (se aplican en memoria y esperan a que el edit log sea durable)
+    async def get_root(self, owner_id: int) -> DirectoryNode:
+        """Obtiene (o crea) el directorio raíz de un usuario"""
+        root = self.roots.get(owner_id)
+        if root is None:
+            pending = self._log(self._mkdir_record(None, "", owner_id))
+            root = self.roots[owner_id]
+            await pending
+        return root
+
+    async def resolve_directory(self, names: List[str], owner_id: int) -> Optional[DirectoryNode]:
+        directory = await self.get_root(owner_id)
+        for name in names:
+            directory = directory.directories.get(name)
+            if directory is None:
+                return None
+        return directory
+
+    async def make_directories(
+        self, names: List[str], owner_id: int, deleting: Collection[int] = ()
+    ) -> DirectoryNode:
+        directory = await self.get_root(owner_id)
+        pending = None
+        for name in names:
+            # Un directorio marcado solo puede aparecer antes de crear alguno
+            if directory.id in deleting:
+                raise PathConflictError("Directory is being deleted")
+            child = directory.directories.get(name)
+            if child is None:
+                if name in directory.files:
+                    raise PathConflictError(f"A file already exists with name: {name}")
+                pending = self._log(self._mkdir_record(directory.id, name, owner_id))
+                child = directory.directories[name]
+            directory = child
+        if directory.id in deleting:
+            raise PathConflictError("Directory is being deleted")
+        if pending is not None:
+            await pending
+        return directory
+
+    async def rename(
+        self,
+        src_parent: List[str],
+        src_name: str,
+        dst_parent: List[str],
+        dst_name: str,
+        owner_id: int,
+        deleting: Collection[int] = ()
+    ):
+        src_directory = await self.resolve_directory(src_parent, owner_id)
+        dst_directory = await self.resolve_directory(dst_parent, owner_id)
+        src = "/" + "/".join(src_parent + [src_name])
+        dst = "/" + "/".join(dst_parent + [dst_name])
+        if src_directory is None:
+            raise PathNotFoundError(f"Path not found: {src}")
+        if dst_directory is None:
+            raise PathNotFoundError(f"Directory not found: /{'/'.join(dst_parent)}")
+        if dst_name in dst_directory.directories or dst_name in dst_directory.files:
+            raise PathConflictError(f"Path already exists: {dst}")
+        if dst_directory.id in deleting:
+            raise PathConflictError("Directory is being deleted")
+
+        if src_name in src_directory.files:
+            node_id, op = src_directory.files[src_name].id, "rename_file"
+        elif src_name in src_directory.directories:
+            node_id, op = src_directory.directories[src_name].id, "rename_dir"
+        else:
+            raise PathNotFoundError(f"Path not found: {src}")
+
+        await self._log({
+            "op": op, "id": node_id, "parent_id": dst_directory.id, "name": dst_name,
+        })
+
+    async def create_file(
+        self,
+        filename: str,
+        size: int,
+        block_size: int,
+        num_blocks: int,
+        owner_id: int,
+        parent_id: int,
+        name: str,
+        pending: bool = False
+    ) -> FileNode:
+        parent = self.directories.get(parent_id)
+        if parent is None:
+            raise PathNotFoundError("Directory not found")
+        if name in parent.files or name in parent.directories:
+            raise PathConflictError(f"Path already exists: {name}")
+
+        file_id = self.next_file_id
+        pending = self._log({
+            "op": "create", "id": file_id, "parent_id": parent_id, "name": name,
+            "filename": filename, "size": size, "block_size": block_size,
+            "num_blocks": num_blocks, "owner_id": owner_id, "pending": pending,
+            "created_at": _timestamp(datetime.utcnow()),
+        })
+        file = self.files[file_id]
+        with span("commit", engine="memory"):
+            await pending
+        return file
+
+    async def add_block(
+        self,
+        file_id: int,
+        block_id: str,
+        block_index: int,
+        size: int,
+        datanode_url: str,
+        checksum: str
+    ) -> BlockNode:
+        if file_id not in self.files:
+            raise PathNotFoundError("File not found")
+
+        pending = self._log({
+            "op": "add_block", "block_id": block_id, "file_id": file_id,
+            "block_index": block_index, "size": size, "datanode_url": datanode_url,
+            "checksum": checksum, "created_at": _timestamp(datetime.utcnow()),
+        })
+        block = self.blocks[block_id]
+        with span("commit", engine="memory"):
+            await pending
+        return block
+
+    async def add_blocks(self, file_id: int, blocks: List[Dict]) -> List[BlockNode]:
+        """Registra un lote de bloques; sus registros comparten el group commit"""
+        if file_id not in self.files:
+            raise PathNotFoundError("File not found")
+
+        created_at = _timestamp(datetime.utcnow())
+        pending = [
+            self._log({"op": "add_block", "file_id": file_id, "created_at": created_at, **block})
+            for block in blocks
+        ]
+        with span("commit", engine="memory"):
+            await asyncio.gather(*pending)
+        return [self.blocks[block["block_id"]] for block in blocks]
+
+    async def commit_file(self, file_id: int, owner_id: int):
+        file = self.get_file(file_id, owner_id)
+        if file is None:
+            raise PathNotFoundError("File not found")
+        if len(file.blocks) < file.num_blocks:
+            raise PathConflictError("File has missing blocks")
+        if file.pending:
+            await self._log({"op": "commit", "id": file_id})
+
+    async def delete_file(self, file_id: int, owner_id: int) -> bool:
+        if self.get_file(file_id, owner_id) is None:
+            return False
+        await self._log({"op": "delete_files", "ids": [file_id]})
+        return True
+
+    async def remove_subtree_files_chunk(self, directory_ids: List[int], chunk_size: int) -> int:
+        file_ids = []
+        for directory_id in directory_ids:
+            directory = self.directories.get(directory_id)
+            if directory is None:
+                continue
+            for file in directory.files.values():
+                file_ids.append(file.id)
+                if len(file_ids) >= chunk_size:
+                    break
+            if len(file_ids) >= chunk_size:
+                break
+
+        if file_ids:
+            await self._log({"op": "delete_files", "ids": file_ids})
+        return len(file_ids)
+
+    async def remove_directories(self, directory_ids: List[int]):
+        if directory_ids:
+            await self._log({"op": "delete_dirs", "ids": directory_ids})
+
+    async def purge_abandoned_uploads(self, cutoff: datetime) -> int:
+        """Elimina los archivos sin confirmar o incompletos creados antes de `cutoff`"""
+        file_ids = [
+            file_id for file_id in self.incomplete
+            if self.files[file_id].created_at < cutoff
+        ]
+        if file_ids:
+            await self._log({"op": "delete_files", "ids": file_ids})
+        return len(file_ids)
+
+    def _mkdir_record(self, parent_id: Optional[int], name: str, owner_id: int) -> Dict:
+        return {
+            "op": "mkdir", "id": self.next_directory_id, "parent_id": parent_id,
+            "name": name, "owner_id": owner_id,
+            "created_at": _timestamp(datetime.utcnow()),
+        }
+
+    def _log(self, record: Dict) -> asyncio.Future:
+        """Aplica una operación en memoria y la agrega al edit log.
+
+        Aplicar y agregar ocurren sin ceder el event loop, así que el orden
+        del registro es el orden en que se aplicaron las operaciones.
+        """
+        self.edit_log.check_writable()
+        self._apply(record)
+        return self.edit_log.append(record)
+
+    # Aplicación de operaciones (peticiones en vivo y recuperación)
+    def _apply(self, record: Dict):
+        getattr(self, f"_apply_{record['op']}")(record)
+
+    def _apply_mkdir(self, record: Dict):
+        directory = DirectoryNode(
+            record["id"], record["name"], record["owner_id"],
+            _parse_timestamp(record["created_at"])
+        )
+        self.directories[directory.id] = directory
+        if record["parent_id"] is None:
+            self.roots[directory.owner_id] = directory
+        else:
+            self.directories[record["parent_id"]].add_directory(directory)
+        self.next_directory_id = max(self.next_directory_id, directory.id + 1)
+
+    def _apply_create(self, record: Dict):
+        file = FileNode(
+            record["id"], record["filename"], record["name"], record["size"],
+            record["block_size"], record["num_blocks"], record["owner_id"],
+            _parse_timestamp(record["created_at"]), pending=record.get("pending", False)
+        )
+        self.directories[record["parent_id"]].add_file(file)
+        self.files[file.id] = file
+        if file.pending or file.num_blocks > 0:
+            self.incomplete.add(file.id)
+        self.next_file_id = max(self.next_file_id, file.id + 1)
+
+    def _apply_add_block(self, record: Dict):
+        file = self.files[record["file_id"]]
+        block = BlockNode(
+            record["block_id"], file.id, record["block_index"], record["size"],
+            record["datanode_url"], record["checksum"],
+            _parse_timestamp(record["created_at"])
+        )
+        insort(file.blocks, block, key=_block_index)
+        self.blocks[block.block_id] = block
+        if len(file.blocks) >= file.num_blocks and not file.pending:
+            self.incomplete.discard(file.id)
+
+    def _apply_commit(self, record: Dict):
+        file = self.files.get(record["id"])
+        if file is None:
+            return
+        file.pending = False
+        if len(file.blocks) >= file.num_blocks:
+            self.incomplete.discard(file.id)
+
+    def _apply_delete_files(self, record: Dict):
+        for file_id in record["ids"]:
+            file = self.files.pop(file_id, None)
+            if file is None:
+                continue
+            file.parent.remove_file(file.name)
+            for block in file.blocks:
+                self.blocks.pop(block.block_id, None)
+            self.incomplete.discard(file_id)
+
+    def _apply_delete_dirs(self, record: Dict):
+        for directory_id in record["ids"]:
+            directory = self.directories.pop(directory_id, None)
+            if directory is None:
+                continue
+            if directory.files:
+                self._apply_delete_files({"ids": [file.id for file in directory.files.values()]})
+            parent = directory.parent
+            if parent is not None and parent.directories.get(directory.name) is directory:
+                parent.remove_directory(directory.name)
+            elif parent is None and self.roots.get(directory.owner_id) is directory:
+                del self.roots[directory.owner_id]
+
+    def _apply_rename_file(self, record: Dict):
+        file = self.files[record["id"]]
+        file.parent.remove_file(file.name)
+        file.name = record["name"]
+        self.directories[record["parent_id"]].add_file(file)
+
+    def _apply_rename_dir(self, record: Dict):
+        directory = self.directories[record["id"]]
+        directory.parent.remove_directory(directory.name)
+        directory.name = record["name"]
+        self.directories[record["parent_id"]].add_directory(directory)
+
+    # Imagen y recuperación
+    async def load(self, session_factory):
+        """Carga la última imagen y aplica el edit log posterior.
+
+        Sin imagen ni edit log (primer arranque con este motor) se importa el
+        espacio de nombres de la base de datos y se guarda como imagen inicial.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        started = time.time()
+        image_path = os.path.join(self.path, self.IMAGE_NAME)
+
+        if not os.path.exists(image_path) and not self.edit_log.segments():
+            await self._import_database(session_factory)
+            self.edit_log.open(0)
+            # Nada más corre durante el arranque: la imagen inicial sale del árbol importado
+            await asyncio.to_thread(self._save_image, 0)
+            self._finish_checkpoint(0)
+        else:
+            last_txid, replayed = await asyncio.to_thread(self._recover, image_path)
+            self.edit_log.open(last_txid)
+            if replayed:
+                print(f"Espacio de nombres: {replayed} operaciones aplicadas desde el edit log")
+
+        print(
+            f"Espacio de nombres en memoria: {len(self.directories)} directorios, "
+            f"{len(self.files)} archivos, {len(self.blocks)} bloques "
+            f"(cargado en {time.time() - started:.2f}s)"
+        )
+
+    async def checkpoint(self):
+        """Guarda una imagen del árbol y descarta el edit log que cubre.
+
+        La imagen no se copia del árbol vivo: un hilo reconstruye el estado
+        a partir de la imagen anterior y los segmentos cerrados (como el
+        NameNode secundario de HDFS), así que recorrer y serializar el árbol
+        no detiene el event loop.
+        """
+        async with self._checkpoint_lock:
+            txid = self.edit_log.last_txid
+            # Cerrar el segmento actual: la imagen solo refleja operaciones durables
+            await self.edit_log.roll()
+            await asyncio.to_thread(self._rebuild_image, txid)
+            self._finish_checkpoint(txid)
+
+    def _finish_checkpoint(self, txid: int):
+        self.checkpoint_txid = txid
+        self.last_checkpoint = time.time()
+        removed = self.edit_log.purge_segments(txid)
+        print(f"Checkpoint del espacio de nombres en txid {txid} ({removed} segmentos descartados)")
+
+    async def run_checkpointer(self):
+        """Genera checkpoints por número de operaciones o por tiempo"""
+        while True:
+            await asyncio.sleep(min(self.CHECKPOINT_CHECK_INTERVAL, self.CHECKPOINT_INTERVAL))
+            pending = self.edit_log.last_txid - self.checkpoint_txid
+            elapsed = time.time() - self.last_checkpoint
+            if pending >= self.CHECKPOINT_TXNS or (pending and elapsed >= self.CHECKPOINT_INTERVAL):
+                try:
+                    await self.checkpoint()
+                except Exception as e:
+                    print(f"Error generando checkpoint: {e}")
+
+    async def close(self):
+        """Guarda un checkpoint final para que el siguiente arranque no repita el edit log"""
+        if self.edit_log.last_txid > self.checkpoint_txid:
+            await self.checkpoint()
+        await self.edit_log.close()
+
+    def _recover(self, image_path: str, upto_txid: Optional[int] = None) -> Tuple[int, int]:
+        txid = 0
+        if os.path.exists(image_path):
+            with open(image_path, "r", encoding="utf-8") as f:
+                image = json.load(f)
+            self._load_rows(image["directories"], image["files"], image["blocks"])
+            self.next_directory_id = max(self.next_directory_id, image["next_directory_id"])
+            self.next_file_id = max(self.next_file_id, image["next_file_id"])
+            txid = image["txid"]
+        self.checkpoint_txid = txid
+
+        replayed = 0
+        for record in self.edit_log.replay(txid, upto_txid):
+            self._apply(record)
+            txid = record["txid"]
+            replayed += 1
+        return txid, replayed
+
+    async def _import_database(self, session_factory):
+        async with session_factory() as db:
+            directories = (await db.execute(select(
+                Directory.id, Directory.parent_id, Directory.name,
+                Directory.owner_id, Directory.created_at
+            ))).all()
+            files = (await db.execute(select(
+                File.id, File.parent_id, File.name, File.filename, File.size,
+                File.block_size, File.num_blocks, File.owner_id,
+                File.created_at, File.updated_at, File.pending
+            ).where(File.parent_id.is_not(None)))).all()
+            blocks = (await db.execute(select(
+                Block.block_id, Block.file_id, Block.block_index, Block.size,
+                Block.datanode_url, Block.checksum, Block.created_at
+            ))).all()
+
+        self._load_rows(
+            [(*row[:4], _timestamp(row[4])) for row in directories],
+            [(*row[:8], _timestamp(row[8]), _timestamp(row[9]), bool(row[10])) for row in files],
+            [(*row[:6], _timestamp(row[6])) for row in blocks],
+        )
+        if self.files:
+            print(f"Espacio de nombres: {len(self.files)} archivos importados de la base de datos")
+
+    def _load_rows(self, directories, files, blocks):
+        # Los padres pueden tener IDs mayores que sus hijos (tras un rename):
+        # primero se crean todos los nodos y luego se enlazan
+        parents = []
+        for directory_id, parent_id, name, owner_id, created_at in directories:
+            directory = DirectoryNode(directory_id, name, owner_id, _parse_timestamp(created_at))
+            self.directories[directory_id] = directory
+            parents.append((directory, parent_id))
+            self.next_directory_id = max(self.next_directory_id, directory_id + 1)
+        for directory, parent_id in parents:
+            if parent_id is None:
+                self.roots[directory.owner_id] = directory
+            else:
+                self.directories[parent_id].add_directory(directory)
+
+        for row in files:
+            (file_id, parent_id, name, filename, size, block_size, num_blocks,
+             owner_id, created_at, updated_at) = row[:10]
+            # Las imágenes de la versión 1 no tienen la columna pending
+            file = FileNode(
+                file_id, filename, name, size, block_size, num_blocks, owner_id,
+                _parse_timestamp(created_at), _parse_timestamp(updated_at),
+                pending=len(row) > 10 and row[10]
+            )
+            self.directories[parent_id].add_file(file)
+            self.files[file_id] = file
+            self.next_file_id = max(self.next_file_id, file_id + 1)
+
+        for block_id, file_id, block_index, size, datanode_url, checksum, created_at in blocks:
+            file = self.files.get(file_id)
+            if file is None:
+                continue
+            block = BlockNode(
+                block_id, file_id, block_index, size, datanode_url, checksum,
+                _parse_timestamp(created_at)
+            )
+            file.blocks.append(block)
+            self.blocks[block_id] = block
+
+        for file in self.files.values():
+            file.blocks.sort(key=_block_index)
+
+        self.incomplete = {
+            file.id for file in self.files.values()
+            if file.pending or len(file.blocks) < file.num_blocks
+        }
+
+    def _rebuild_image(self, txid: int):
+        """Escribe la imagen en `txid` desde el disco, sin tocar el árbol vivo (en un hilo)"""
+        shadow = MemoryNamespace(self.path, enabled=False)
+        shadow._recover(os.path.join(self.path, self.IMAGE_NAME), upto_txid=txid)
+        shadow._save_image(txid)
+
+    def _save_image(self, txid: int):
+        self._write_image(self._snapshot(txid))
+
+    def _snapshot(self, txid: int) -> Dict:
+        """Copia el árbol como filas planas"""
+        return {
+            "version": self.IMAGE_VERSION,
+            "txid": txid,
+            "next_directory_id": self.next_directory_id,
+            "next_file_id": self.next_file_id,
+            "directories": [
+                (d.id, d.parent_id, d.name, d.owner_id, _timestamp(d.created_at))
+                for d in self.directories.values()
+            ],
+            "files": [
+                (f.id, f.parent.id, f.name, f.filename, f.size, f.block_size, f.num_blocks,
+                 f.owner_id, _timestamp(f.created_at), _timestamp(f.updated_at), f.pending)
+                for f in self.files.values()
+            ],
+            "blocks": [
+                (b.block_id, b.file_id, b.block_index, b.size, b.datanode_url, b.checksum,
+                 _timestamp(b.created_at))
+                for b in self.blocks.values()
+            ],
+        }
+
+    def _write_image(self, image: Dict):
+        """Escribe la imagen de forma atómica (archivo temporal + rename)"""
+        image_path = os.path.join(self.path, self.IMAGE_NAME)
+        temp_path = image_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(image, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, image_path)
+        directory_fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+
+NAMESPACE_ENGINE = os.getenv("NAMESPACE_ENGINE", "sql")
+NAMESPACE_DIR = os.getenv("NAMESPACE_DIR", "./data/namespace")
+
+memory_namespace = MemoryNamespace(NAMESPACE_DIR, enabled=NAMESPACE_ENGINE == "memory")
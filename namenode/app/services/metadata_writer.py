@@ -0,0 +1,101 @@
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from common.tracing import span
+import asyncio
+import os
+
+Operation = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class MetadataWriter:
+    """Cola de escritura de metadatos con group commit.
+
+    Las mutaciones de muchas peticiones concurrentes se agrupan en una sola
+    transacción: un único commit (y un único fsync de SQLite) por lote en
+    lugar de uno por operación. Cada llamador recibe su resultado solo
+    cuando el lote que contiene su operación quedó confirmado.
+
+    Una operación es una función `async (db) -> resultado` que modifica la
+    sesión sin hacer commit. Si el lote falla se divide en mitades que se
+    reintentan por separado, hasta aislar la operación que falla: el error
+    llega solo a su llamador.
+    """
+
+    # Máximo de operaciones por transacción
+    MAX_BATCH_SIZE = int(os.getenv("METADATA_BATCH_SIZE", 500))
+    # Espera opcional para acumular operaciones antes de escribir un lote
+    BATCH_WAIT = float(os.getenv("METADATA_BATCH_WAIT", 0))  # segundos
+
+    def __init__(self):
+        self._session_factory = None
+        self._pending: List[Tuple[Operation, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self, session_factory):
+        self._session_factory = session_factory
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Escribe las operaciones pendientes y detiene el escritor"""
+        while self._pending:
+            await self._write_batch(self._take_batch())
+        if self._writer:
+            self._writer.cancel()
+            self._writer = None
+
+    async def submit(self, operation: Operation) -> Any:
+        """Encola una operación y espera a que su lote sea durable"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operation, future))
+        self._wakeup.set()
+        with span("commit", engine="sql"):
+            return await future
+
+    def _take_batch(self) -> List[Tuple[Operation, asyncio.Future]]:
+        batch = self._pending[:self.MAX_BATCH_SIZE]
+        self._pending = self._pending[self.MAX_BATCH_SIZE:]
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if self.BATCH_WAIT:
+                await asyncio.sleep(self.BATCH_WAIT)
+            self._wakeup.clear()
+            while self._pending:
+                await self._write_batch(self._take_batch())
+
+    async def _write_batch(self, batch: List[Tuple[Operation, asyncio.Future]]):
+        try:
+            async with self._session_factory() as db:
+                results = [await operation(db) for operation, _ in batch]
+                await db.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                self._resolve(batch[0][1], error=e)
+                return
+            print(
+                f"Metadatos: lote de {len(batch)} operaciones falló "
+                f"({type(e).__name__}); reintentando en mitades"
+            )
+            middle = len(batch) // 2
+            await self._write_batch(batch[:middle])
+            await self._write_batch(batch[middle:])
+            return
+
+        for (_, future), result in zip(batch, results):
+            self._resolve(future, result=result)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any = None, error: Optional[Exception] = None):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+metadata_writer = MetadataWriter()
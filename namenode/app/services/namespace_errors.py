@@ -0,0 +1,10 @@
+class NamespaceError(Exception):
+    """Error en una operación sobre el espacio de nombres"""
+
+
+class PathNotFoundError(NamespaceError):
+    """La ruta no existe"""
+
+
+class PathConflictError(NamespaceError):
+    """La ruta ya existe o es incompatible con la operación"""
@@ -0,0 +1,390 @@
+from typing import Dict, List, Optional, Set, Tuple, Union
+from sqlalchemy import delete, func, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.directory import Directory
+from ..models.file import File
+from ..models.block import Block
+from .memory_namespace import memory_namespace
+from .namespace_errors import NamespaceError, PathConflictError, PathNotFoundError
+
+
+class NamespaceService:
+    """Árbol de directorios de cada usuario.
+
+    Cada directorio y archivo guarda el ID de su padre, de modo que resolver
+    una ruta cuesta una búsqueda indexada por componente y listar un nivel
+    cuesta lo mismo que el número de entradas retornadas.
+    """
+
+    # Tamaño de los lotes de IDs usados en cláusulas IN
+    QUERY_CHUNK_SIZE = 500
+
+    # Directorios con un borrado recursivo en curso: no admiten entradas nuevas
+    deleting: Set[int] = set()
+
+    @staticmethod
+    def check_not_deleting(directory_id: int):
+        """Rechaza crear entradas en un directorio que se está eliminando"""
+        if directory_id in NamespaceService.deleting:
+            raise PathConflictError("Directory is being deleted")
+
+    @staticmethod
+    def normalize_path(path: str) -> str:
+        """Normaliza una ruta absoluta ("/a//b/" -> "/a/b")"""
+        parts = [part for part in path.split("/") if part and part != "."]
+        if ".." in parts:
+            raise NamespaceError(f"Invalid path: {path}")
+        return "/" + "/".join(parts)
+
+    @staticmethod
+    def split_path(path: str) -> Tuple[str, str]:
+        """Separa una ruta en (directorio padre, nombre)"""
+        normalized = NamespaceService.normalize_path(path)
+        parent, _, name = normalized.rpartition("/")
+        return parent or "/", name
+
+    @staticmethod
+    def join_path(parent: str, name: str) -> str:
+        """Une un directorio y un nombre"""
+        return f"{parent.rstrip('/')}/{name}"
+
+    @staticmethod
+    def path_components(path: str) -> List[str]:
+        """Separa una ruta en los nombres de sus componentes ("/a/b" -> ["a", "b"])"""
+        return [name for name in NamespaceService.normalize_path(path).split("/") if name]
+
+    @staticmethod
+    async def get_root(db: AsyncSession, owner_id: int) -> Directory:
+        """Obtiene (o crea) el directorio raíz de un usuario"""
+        if memory_namespace.enabled:
+            return await memory_namespace.get_root(owner_id)
+        return await NamespaceService._sql_get_root(db, owner_id)
+
+    @staticmethod
+    async def _sql_get_root(db: AsyncSession, owner_id: int) -> Directory:
+        result = await db.execute(
+            select(Directory).where(
+                Directory.owner_id == owner_id,
+                Directory.parent_id.is_(None)
+            )
+        )
+        root = result.scalars().first()
+        if root:
+            return root
+
+        root = Directory(name="", parent_id=None, owner_id=owner_id)
+        db.add(root)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Otra petición creó la raíz al mismo tiempo
+            await db.rollback()
+            return await NamespaceService._sql_get_root(db, owner_id)
+        await db.refresh(root)
+        return root
+
+    @staticmethod
+    async def get_child_directory(db: AsyncSession, parent_id: int, name: str) -> Optional[Directory]:
+        """Obtiene un subdirectorio por nombre"""
+        if memory_namespace.enabled:
+            return memory_namespace.get_child_directory(parent_id, name)
+        return await NamespaceService._sql_get_child_directory(db, parent_id, name)
+
+    @staticmethod
+    async def _sql_get_child_directory(db: AsyncSession, parent_id: int, name: str) -> Optional[Directory]:
+        result = await db.execute(
+            select(Directory).where(
+                Directory.parent_id == parent_id,
+                Directory.name == name
+            )
+        )
+        return result.scalars().first()
+
+    @staticmethod
+    async def get_child_file(db: AsyncSession, parent_id: int, name: str) -> Optional[File]:
+        """Obtiene un archivo de un directorio por nombre"""
+        if memory_namespace.enabled:
+            return memory_namespace.get_child_file(parent_id, name)
+        return await NamespaceService._sql_get_child_file(db, parent_id, name)
+
+    @staticmethod
+    async def _sql_get_child_file(db: AsyncSession, parent_id: int, name: str) -> Optional[File]:
+        result = await db.execute(
+            select(File).where(
+                File.parent_id == parent_id,
+                File.name == name
+            )
+        )
+        return result.scalars().first()
+
+    @staticmethod
+    async def resolve_directory(db: AsyncSession, path: str, owner_id: int) -> Optional[Directory]:
+        """Resuelve la ruta de un directorio recorriendo sus componentes"""
+        if memory_namespace.enabled:
+            return await memory_namespace.resolve_directory(
+                NamespaceService.path_components(path), owner_id
+            )
+
+        directory = await NamespaceService.get_root(db, owner_id)
+        for name in NamespaceService.path_components(path):
+            directory = await NamespaceService.get_child_directory(db, directory.id, name)
+            if directory is None:
+                return None
+        return directory
+
+    @staticmethod
+    async def get_directory_path(db: AsyncSession, directory: Directory) -> str:
+        """Reconstruye la ruta de un directorio subiendo por sus padres"""
+        if memory_namespace.enabled:
+            return directory.path
+
+        names = []
+        while directory.parent_id is not None:
+            names.append(directory.name)
+            directory = await db.get(Directory, directory.parent_id)
+        return "/" + "/".join(reversed(names))
+
+    @staticmethod
+    async def make_directories(db: AsyncSession, path: str, owner_id: int) -> Directory:
+        """Crea un directorio y los padres que falten (como mkdir -p)"""
+        if memory_namespace.enabled:
+            return await memory_namespace.make_directories(
+                NamespaceService.path_components(path), owner_id, NamespaceService.deleting
+            )
+        return await NamespaceService._sql_make_directories(db, path, owner_id)
+
+    @staticmethod
+    async def _sql_make_directories(db: AsyncSession, path: str, owner_id: int) -> Directory:
+        directory = await NamespaceService._sql_get_root(db, owner_id)
+        for name in NamespaceService.path_components(path):
+            NamespaceService.check_not_deleting(directory.id)
+            child = await NamespaceService._sql_get_child_directory(db, directory.id, name)
+            if child is None:
+                if await NamespaceService._sql_get_child_file(db, directory.id, name):
+                    raise PathConflictError(f"A file already exists with name: {name}")
+
+                child = Directory(name=name, parent_id=directory.id, owner_id=owner_id)
+                db.add(child)
+                try:
+                    await db.commit()
+                    await db.refresh(child)
+                except IntegrityError:
+                    await db.rollback()
+                    child = await NamespaceService._sql_get_child_directory(db, directory.id, name)
+            directory = child
+        NamespaceService.check_not_deleting(directory.id)
+        return directory
+
+    @staticmethod
+    async def list_directory_page(
+        db: AsyncSession,
+        directory: Directory,
+        limit: int,
+        after: Optional[Tuple[str, str]] = None
+    ) -> List[Union[Directory, File]]:
+        """Lista una página de un nivel de un directorio (paginación por keyset).
+
+        Las entradas se ordenan por (tipo, nombre): primero los subdirectorios
+        y luego los archivos. `after` es la clave (tipo, nombre) de la última
+        entrada de la página anterior; cada página cuesta una búsqueda en el
+        índice (parent_id, name) más las filas retornadas.
+        """
+        if memory_namespace.enabled:
+            return memory_namespace.list_directory_page(directory, limit, after)
+
+        after_type, after_name = after or ("directory", None)
+        entries: List[Union[Directory, File]] = []
+
+        if after_type == "directory":
+            query = select(Directory).where(Directory.parent_id == directory.id)
+            if after_name is not None:
+                query = query.where(Directory.name > after_name)
+            result = await db.execute(query.order_by(Directory.name).limit(limit))
+            entries.extend(result.scalars().all())
+            after_name = None
+
+        if len(entries) < limit:
+            query = select(File).where(File.parent_id == directory.id)
+            if after_name is not None:
+                query = query.where(File.name > after_name)
+            result = await db.execute(query.order_by(File.name).limit(limit - len(entries)))
+            entries.extend(result.scalars().all())
+
+        return entries
+
+    @staticmethod
+    async def subtree_directory_ids(db: AsyncSession, directory_id: int) -> List[int]:
+        """Obtiene los IDs de un directorio y todos sus descendientes"""
+        if memory_namespace.enabled:
+            return memory_namespace.subtree_directory_ids(directory_id)
+
+        subtree = [directory_id]
+        frontier = [directory_id]
+        while frontier:
+            children = []
+            for start in range(0, len(frontier), NamespaceService.QUERY_CHUNK_SIZE):
+                chunk = frontier[start:start + NamespaceService.QUERY_CHUNK_SIZE]
+                result = await db.execute(
+                    select(Directory.id).where(Directory.parent_id.in_(chunk))
+                )
+                children.extend(result.scalars().all())
+            subtree.extend(children)
+            frontier = children
+        return subtree
+
+    @staticmethod
+    async def rename(db: AsyncSession, src: str, dst: str, owner_id: int):
+        """Renombra o mueve un archivo o directorio"""
+        src = NamespaceService.normalize_path(src)
+        dst = NamespaceService.normalize_path(dst)
+        if src == "/" or dst == "/":
+            raise NamespaceError("Cannot rename the root directory")
+        if dst == src or dst.startswith(src + "/"):
+            raise NamespaceError("Cannot move a directory inside itself")
+
+        src_parent_path, src_name = NamespaceService.split_path(src)
+        dst_parent_path, dst_name = NamespaceService.split_path(dst)
+        if memory_namespace.enabled:
+            return await memory_namespace.rename(
+                NamespaceService.path_components(src_parent_path), src_name,
+                NamespaceService.path_components(dst_parent_path), dst_name,
+                owner_id, NamespaceService.deleting
+            )
+
+        src_parent = await NamespaceService.resolve_directory(db, src_parent_path, owner_id)
+        dst_parent = await NamespaceService.resolve_directory(db, dst_parent_path, owner_id)
+        if src_parent is None:
+            raise PathNotFoundError(f"Path not found: {src}")
+        if dst_parent is None:
+            raise PathNotFoundError(f"Directory not found: {dst_parent_path}")
+        if (await NamespaceService.get_child_directory(db, dst_parent.id, dst_name)
+                or await NamespaceService.get_child_file(db, dst_parent.id, dst_name)):
+            raise PathConflictError(f"Path already exists: {dst}")
+        NamespaceService.check_not_deleting(dst_parent.id)
+
+        file = await NamespaceService.get_child_file(db, src_parent.id, src_name)
+        if file is not None:
+            file.parent_id = dst_parent.id
+            file.name = dst_name
+            file.filepath = dst
+            await NamespaceService._commit_rename(db, dst)
+            return
+
+        directory = await NamespaceService.get_child_directory(db, src_parent.id, src_name)
+        if directory is None:
+            raise PathNotFoundError(f"Path not found: {src}")
+
+        directory.parent_id = dst_parent.id
+        directory.name = dst_name
+
+        # La ruta completa se guarda en cada archivo: actualizar solo los del subárbol
+        subtree = await NamespaceService.subtree_directory_ids(db, directory.id)
+        for start in range(0, len(subtree), NamespaceService.QUERY_CHUNK_SIZE):
+            chunk = subtree[start:start + NamespaceService.QUERY_CHUNK_SIZE]
+            await db.execute(
+                update(File).where(File.parent_id.in_(chunk)).values(
+                    filepath=literal(dst) + func.substr(File.filepath, len(src) + 1)
+                ).execution_options(synchronize_session=False)
+            )
+        await NamespaceService._commit_rename(db, dst)
+
+    @staticmethod
+    async def _commit_rename(db: AsyncSession, dst: str):
+        # Otra petición pudo ocupar el destino después de la verificación
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            raise PathConflictError(f"Path already exists: {dst}")
+
+    @staticmethod
+    async def count_subtree_files(db: AsyncSession, directory_ids: List[int]) -> int:
+        """Cuenta los archivos contenidos en un conjunto de directorios"""
+        if memory_namespace.enabled:
+            return memory_namespace.count_subtree_files(directory_ids)
+
+        total = 0
+        for start in range(0, len(directory_ids), NamespaceService.QUERY_CHUNK_SIZE):
+            chunk = directory_ids[start:start + NamespaceService.QUERY_CHUNK_SIZE]
+            result = await db.execute(
+                select(func.count(File.id)).where(File.parent_id.in_(chunk))
+            )
+            total += result.scalar()
+        return total
+
+    @staticmethod
+    async def remove_subtree_files_chunk(db: AsyncSession, directory_ids: List[int], chunk_size: int) -> int:
+        """Elimina un lote de archivos de un conjunto de directorios con borrados por conjuntos.
+
+        Retorna el número de archivos eliminados; 0 cuando ya no quedan archivos.
+        """
+        if memory_namespace.enabled:
+            return await memory_namespace.remove_subtree_files_chunk(directory_ids, chunk_size)
+
+        for start in range(0, len(directory_ids), NamespaceService.QUERY_CHUNK_SIZE):
+            chunk = directory_ids[start:start + NamespaceService.QUERY_CHUNK_SIZE]
+            result = await db.execute(
+                select(File.id).where(File.parent_id.in_(chunk)).limit(chunk_size)
+            )
+            file_ids = result.scalars().all()
+            if file_ids:
+                await db.execute(delete(Block).where(Block.file_id.in_(file_ids)))
+                await db.execute(delete(File).where(File.id.in_(file_ids)))
+                await db.commit()
+                return len(file_ids)
+        return 0
+
+    @staticmethod
+    async def remove_directories(db: AsyncSession, directory_ids: List[int]):
+        """Elimina las entradas de un conjunto de directorios (ya vacíos)"""
+        if memory_namespace.enabled:
+            return await memory_namespace.remove_directories(directory_ids)
+
+        for start in range(0, len(directory_ids), NamespaceService.QUERY_CHUNK_SIZE):
+            chunk = directory_ids[start:start + NamespaceService.QUERY_CHUNK_SIZE]
+            await db.execute(delete(Directory).where(Directory.id.in_(chunk)))
+        await db.commit()
+
+    @staticmethod
+    async def backfill_legacy_files(db: AsyncSession) -> int:
+        """Ubica en el árbol de directorios los archivos creados antes de su existencia.
+
+        Trabaja siempre sobre la base de datos, también con el motor en
+        memoria: corre antes de cargarlo, y la importación inicial toma los
+        archivos ya ubicados.
+        """
+        migrated = 0
+        parents: Dict[Tuple[int, str], int] = {}
+        while True:
+            result = await db.execute(
+                select(File).where(
+                    File.parent_id.is_(None)
+                ).limit(NamespaceService.QUERY_CHUNK_SIZE)
+            )
+            files = result.scalars().all()
+            if not files:
+                break
+
+            for file in files:
+                try:
+                    parent_path, name = NamespaceService.split_path(file.filepath)
+                except NamespaceError:
+                    parent_path, name = "/", file.filepath.replace("/", "_")
+                key = (file.owner_id, parent_path)
+                if key not in parents:
+                    parents[key] = (await NamespaceService._sql_make_directories(
+                        db, parent_path, file.owner_id
+                    )).id
+                if await NamespaceService._sql_get_child_file(db, parents[key], name):
+                    name = f"{name}~{file.id}"
+                file.parent_id = parents[key]
+                file.name = name
+                file.filepath = NamespaceService.join_path(parent_path, name)
+                await db.flush()
+            await db.commit()
+            migrated += len(files)
+
+        if migrated:
+            print(f"Espacio de nombres: {migrated} archivos migrados al árbol de directorios")
+        return migrated
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# Los tests se ejecutan desde el directorio del servicio (`python -m pytest tests`):
+# `app` es el paquete del servicio y `common` está en la raíz del repositorio
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]
+
+# Base de datos y espacio de nombres propios de la ejecución (se leen al importar app)
+DATA_DIR = tempfile.mkdtemp(prefix="griddfs-namenode-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DATA_DIR}/namenode.db")
+os.environ.setdefault("NAMESPACE_DIR", os.path.join(DATA_DIR, "namespace"))
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Cliente HTTP del NameNode (arranca la aplicación una vez por ejecución)"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_user(client):
+    """Registra un usuario nuevo y retorna sus cabeceras de autenticación"""
+    def make_user():
+        username = f"user-{uuid.uuid4().hex[:12]}"
+        client.post(
+            "/auth/register",
+            json={"username": username, "email": f"{username}@example.com", "password": "secret"},
+        )
+        token = client.post("/auth/login", data={"username": username, "password": "secret"}).json()
+        return {"Authorization": f"Bearer {token['access_token']}"}
+
+    return make_user
+
+
+@pytest.fixture
+def auth_headers(make_user):
+    """Cabeceras de un usuario nuevo: cada test trabaja en su propio espacio de nombres"""
+    return make_user()
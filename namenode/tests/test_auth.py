@@ -0,0 +1,48 @@
+import uuid
+
+from app.services import auth_service
+
+
+def _register(client):
+    username = f"user-{uuid.uuid4().hex[:12]}"
+    client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": "secret"},
+    )
+    return username
+
+
+def _login(client, username: str):
+    return client.post("/auth/login", data={"username": username, "password": "secret"})
+
+
+def test_refresh_issues_a_working_access_token(client):
+    tokens = _login(client, _register(client)).json()
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+
+def test_access_token_is_rejected_at_refresh(client):
+    tokens = _login(client, _register(client)).json()
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["access_token"]})
+    assert response.status_code == 401
+
+
+def test_refresh_token_is_rejected_as_bearer(client):
+    tokens = _login(client, _register(client)).json()
+    headers = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+    assert client.get("/auth/me", headers=headers).status_code == 401
+
+
+def test_login_returns_503_when_bcrypt_pool_is_saturated(client, monkeypatch):
+    """Con la cola de bcrypt llena el login se rechaza con 503 y Retry-After"""
+    username = _register(client)
+    monkeypatch.setattr(auth_service, "BCRYPT_MAX_PENDING", 0)
+    response = _login(client, username)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    monkeypatch.undo()
+    assert _login(client, username).status_code == 200
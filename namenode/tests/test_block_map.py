@@ -0,0 +1,106 @@
+import os
+import uuid
+
+from app.services.block_map_service import BlockMapService
+from app.services.file_service import FileService
+# El decodificador es el del cliente (la raíz del repositorio está en sys.path)
+from client.utils.block_map import BlockMap
+
+NODES = ["http://datanode1:8000", "http://datanode2:8000", "http://datanode3:8000"]
+BLOCK_SIZE = 1024
+
+
+def _rows(count: int, first_index: int = 0):
+    return [
+        (
+            str(uuid.uuid4()),
+            first_index + i,
+            BLOCK_SIZE if i < count - 1 else 100,
+            NODES[(first_index + i) % len(NODES)],
+            os.urandom(32).hex(),
+        )
+        for i in range(count)
+    ]
+
+
+def test_encode_decode_round_trip():
+    rows = _rows(10) + _rows(3, first_index=2**32 - 3)
+    content = BlockMapService.encode({"id": 1, "filename": "a"}, rows)
+
+    block_map = BlockMap(content)
+    assert block_map.file == {"id": 1, "filename": "a"}
+    assert len(block_map) == len(rows)
+    assert [tuple(block.values()) for block in block_map] == rows
+
+
+def test_round_robin_placement_is_a_single_run():
+    """El reparto round-robin de un archivo completo ocupa una sola racha de ubicaciones"""
+    block_map = BlockMap(BlockMapService.encode({}, _rows(30)))
+    assert len(block_map._placement_runs) == 1
+    assert len(block_map._index_runs) == 1
+
+
+def test_non_uuid_ids_fall_back_to_json():
+    rows = [("block-1", 0, BLOCK_SIZE, NODES[0], os.urandom(32).hex())]
+    assert BlockMapService.encode({}, rows) is None
+
+
+def _register(client, headers, file_id: int, block_index: int):
+    return client.post(
+        f"/files/register-block/{file_id}",
+        json={
+            "block_index": block_index,
+            "block_size": BLOCK_SIZE,
+            "datanode_url": NODES[0],
+            "checksum": "0" * 64,
+        },
+        headers=headers,
+    )
+
+
+def test_register_block_rejects_indexes_outside_u32(client, auth_headers):
+    response = client.post(
+        "/files/upload", json={"filename": "big", "filepath": "/big", "size": BLOCK_SIZE},
+        headers=auth_headers,
+    )
+    file_id = response.json()["file_id"]
+
+    assert _register(client, auth_headers, file_id, 2**32).status_code == 422
+    assert _register(client, auth_headers, file_id, -1).status_code == 422
+    assert _register(client, auth_headers, file_id, 2**32 - 1).status_code == 200
+
+
+def test_block_range_covers_touched_blocks():
+    assert FileService.block_range(5000, 1024, 0, None) == (0, 4)
+    assert FileService.block_range(5000, 1024, 1023, 2) == (0, 1)
+    assert FileService.block_range(5000, 1024, 2048, 1024) == (2, 2)
+    assert FileService.block_range(5000, 1024, 4096, 10**9) == (4, 4)
+    assert FileService.block_range(5000, 1024, 5000, None) is None
+
+
+def test_block_range_endpoint_returns_only_requested_blocks(client, auth_headers):
+    block_size = FileService.BLOCK_SIZE
+
+    size = 4 * block_size + 100
+    response = client.post(
+        "/files/upload", json={"filename": "ranged", "filepath": "/ranged", "size": size},
+        headers=auth_headers,
+    )
+    file_id = response.json()["file_id"]
+    for index in range(5):
+        assert _register(client, auth_headers, file_id, index).status_code == 200
+    assert client.post(f"/files/{file_id}/commit", headers=auth_headers).status_code == 200
+
+    params = {"offset": block_size + 1, "length": block_size}
+    listing = client.get(f"/files/{file_id}/blocks", params=params, headers=auth_headers).json()
+    assert [block["block_index"] for block in listing["blocks"]] == [1, 2]
+
+    compact = client.get(
+        f"/files/{file_id}/blocks", params=params,
+        headers={**auth_headers, "Accept": BlockMapService.MEDIA_TYPE},
+    )
+    assert compact.headers["content-type"] == BlockMapService.MEDIA_TYPE
+    assert [block["block_index"] for block in BlockMap(compact.content)] == [1, 2]
+
+    beyond = client.get(f"/files/{file_id}/blocks", params={"offset": size}, headers=auth_headers).json()
+    assert beyond["blocks"] == []
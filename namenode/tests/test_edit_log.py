@@ -0,0 +1,65 @@
+import asyncio
+import json
+import os
+
+from app.services.edit_log import EditLog
+from app.services.memory_namespace import MemoryNamespace
+
+
+def _line(txid: int) -> bytes:
+    return (json.dumps({"op": "mkdir", "txid": txid}) + "\n").encode()
+
+
+def _segment(directory, start_txid: int) -> str:
+    return os.path.join(directory, f"edits_{start_txid:020d}.log")
+
+
+def test_replay_truncates_torn_tail_and_continues(tmp_path):
+    """Una línea incompleta al final de un segmento se trunca y se siguen leyendo los siguientes"""
+    first = _segment(tmp_path, 1)
+    with open(first, "wb") as f:
+        f.write(_line(1) + _line(2) + b'{"op": "mkdir", "tx')
+    # Segmento que abrió el arranque posterior a la caída
+    with open(_segment(tmp_path, 3), "wb") as f:
+        f.write(_line(3) + _line(4))
+
+    edit_log = EditLog(str(tmp_path))
+    assert [record["txid"] for record in edit_log.replay(0)] == [1, 2, 3, 4]
+    assert os.path.getsize(first) == len(_line(1) + _line(2))
+
+    # Ya truncado, un segundo recorrido lee lo mismo
+    assert [record["txid"] for record in edit_log.replay(1, upto_txid=3)] == [2, 3]
+
+
+def test_replay_discards_corrupt_line_without_newline(tmp_path):
+    """Una línea JSON válida sin salto de línea tampoco se confirmó: se descarta"""
+    path = _segment(tmp_path, 1)
+    with open(path, "wb") as f:
+        f.write(_line(1) + _line(2)[:-1])
+
+    assert [record["txid"] for record in EditLog(str(tmp_path)).replay(0)] == [1]
+    assert os.path.getsize(path) == len(_line(1))
+
+
+def test_namespace_recovers_operations_after_torn_write(tmp_path):
+    """Las operaciones posteriores a una caída a mitad de una escritura sobreviven al siguiente arranque"""
+    async def scenario():
+        namespace = MemoryNamespace(str(tmp_path), enabled=True)
+        namespace.edit_log.open(0)
+        await namespace.make_directories(["a"], owner_id=1)
+        await namespace.edit_log.close()
+        with open(namespace.edit_log.segments()[-1][1], "ab") as f:
+            f.write(b'{"op": "mkdir", "id": 9')
+
+        namespace = MemoryNamespace(str(tmp_path), enabled=True)
+        await namespace.load(None)
+        await namespace.make_directories(["b"], owner_id=1)
+        await namespace.edit_log.close()
+
+        namespace = MemoryNamespace(str(tmp_path), enabled=True)
+        await namespace.load(None)
+        names = sorted(namespace.roots[1].directories)
+        await namespace.edit_log.close()
+        return names
+
+    assert asyncio.run(scenario()) == ["a", "b"]
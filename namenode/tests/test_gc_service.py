@@ -0,0 +1,151 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models import Block, File, User
+from app.services import gc_service
+from app.services.gc_service import GCService
+from app.services.memory_namespace import MemoryNamespace
+
+OLD_REPORT = "1.0"  # created_at de un bloque reportado fuera del período de gracia
+
+
+def _file(name: str, num_blocks: int, pending, created_at: datetime) -> File:
+    return File(
+        filename=name, filepath=f"/{name}", name=name, size=num_blocks, block_size=1,
+        num_blocks=num_blocks, owner_id=1, pending=pending, created_at=created_at,
+    )
+
+
+def _block(file: File, index: int, datanode_url: str = "http://datanode") -> Block:
+    return Block(
+        block_id=f"{file.name}-{index}", file_id=file.id, block_index=index, size=1,
+        datanode_url=datanode_url, checksum="c",
+    )
+
+
+async def _session_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/namenode.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+
+def _report(*block_ids: str):
+    return [{"block_id": block_id, "size": 1, "created_at": OLD_REPORT} for block_id in block_ids]
+
+
+def test_orphans_only_count_blocks_registered_on_the_reporting_node(tmp_path):
+    """Un bloque registrado en otro DataNode es huérfano para el que lo reporta"""
+    async def scenario():
+        engine, session_factory = await _session_factory(tmp_path)
+        async with session_factory() as db:
+            db.add(User(id=1, username="u", email="u@example.com", hashed_password="x"))
+            file = _file("f", 2, None, datetime.utcnow())
+            db.add(file)
+            await db.flush()
+            db.add_all([_block(file, 0, "http://datanode1:8000"), _block(file, 1, "http://datanode2:8000")])
+            await db.commit()
+
+        async with session_factory() as db:
+            report = _report("f-0", "f-1", "unknown")
+            orphans = await GCService.find_orphan_blocks(db, "http://datanode1:8000", report)
+            # Un nodo sin bloques registrados (o con otro DATANODE_URL) no recibe borrados
+            unregistered = await GCService.find_orphan_blocks(db, "http://datanode3:8000", report)
+            recent = await GCService.find_orphan_blocks(
+                db, "http://datanode1:8000", [{"block_id": "new", "size": 1, "created_at": None}]
+            )
+        await engine.dispose()
+        return orphans, unregistered, recent
+
+    orphans, unregistered, recent = asyncio.run(scenario())
+    assert orphans == ["f-1", "unknown"]
+    assert unregistered == []
+    assert recent == []
+
+
+def test_orphans_memory_engine(tmp_path, monkeypatch):
+    """El motor en memoria aplica las mismas reglas"""
+    async def scenario():
+        namespace = MemoryNamespace(str(tmp_path), enabled=True)
+        namespace.edit_log.open(0)
+        monkeypatch.setattr(gc_service, "memory_namespace", namespace)
+        root = await namespace.get_root(1)
+        file = await namespace.create_file("f", 2, 1, 2, 1, root.id, "f")
+        await namespace.add_block(file.id, "f-0", 0, 1, "http://datanode1:8000", "c")
+        await namespace.add_block(file.id, "f-1", 1, 1, "http://datanode2:8000", "c")
+
+        report = _report("f-0", "f-1", "unknown")
+        orphans = await GCService.find_orphan_blocks(None, "http://datanode1:8000", report)
+        unregistered = await GCService.find_orphan_blocks(None, "http://datanode3:8000", report)
+        await namespace.edit_log.close()
+        return orphans, unregistered
+
+    orphans, unregistered = asyncio.run(scenario())
+    assert orphans == ["f-1", "unknown"]
+    assert unregistered == []
+
+
+def test_purge_abandoned_uploads_sql(tmp_path):
+    """Se eliminan los uploads viejos sin confirmar o incompletos, con sus bloques"""
+    async def scenario():
+        engine, session_factory = await _session_factory(tmp_path)
+
+        old = datetime.utcnow() - timedelta(seconds=GCService.UPLOAD_TIMEOUT + 60)
+        async with session_factory() as db:
+            db.add(User(id=1, username="u", email="u@example.com", hashed_password="x"))
+            files = [
+                _file("pending", 1, True, old),
+                _file("incomplete", 2, None, old),
+                _file("complete", 1, None, old),
+                _file("recent", 1, True, datetime.utcnow()),
+            ]
+            db.add_all(files)
+            await db.flush()
+            db.add_all([_block(files[0], 0), _block(files[1], 0), _block(files[2], 0)])
+            await db.commit()
+
+        async with session_factory() as db:
+            purged = await GCService.purge_abandoned_uploads(db)
+            names = (await db.execute(select(File.name).order_by(File.name))).scalars().all()
+            blocks = (await db.execute(select(Block.block_id))).scalars().all()
+        await engine.dispose()
+        return purged, names, blocks
+
+    purged, names, blocks = asyncio.run(scenario())
+    assert purged == 2
+    assert names == ["complete", "recent"]
+    assert blocks == ["complete-0"]
+
+
+def test_purge_abandoned_uploads_memory(tmp_path):
+    """El motor en memoria purga lo mismo, también tras recuperar el edit log"""
+    async def scenario():
+        namespace = MemoryNamespace(str(tmp_path), enabled=True)
+        namespace.edit_log.open(0)
+        root = await namespace.get_root(1)
+        pending = await namespace.create_file("pending", 1, 1, 1, 1, root.id, "pending", pending=True)
+        await namespace.add_block(pending.id, "pending-0", 0, 1, "http://datanode", "c")
+        await namespace.create_file("incomplete", 2, 1, 2, 1, root.id, "incomplete")
+        committed = await namespace.create_file("committed", 1, 1, 1, 1, root.id, "committed", pending=True)
+        await namespace.add_block(committed.id, "committed-0", 0, 1, "http://datanode", "c")
+        await namespace.commit_file(committed.id, 1)
+        await namespace.edit_log.close()
+
+        namespace = MemoryNamespace(str(tmp_path), enabled=True)
+        await namespace.load(None)
+        before_creation = await namespace.purge_abandoned_uploads(datetime.utcnow() - timedelta(hours=1))
+        purged = await namespace.purge_abandoned_uploads(datetime.utcnow() + timedelta(seconds=1))
+        names = sorted(namespace.roots[1].files)
+        blocks = sorted(namespace.blocks)
+        await namespace.edit_log.close()
+        return before_creation, purged, names, blocks
+
+    before_creation, purged, names, blocks = asyncio.run(scenario())
+    assert before_creation == 0
+    assert purged == 2
+    assert names == ["committed"]
+    assert blocks == ["committed-0"]
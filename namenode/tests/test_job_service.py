@@ -0,0 +1,49 @@
+import time
+
+
+def _upload(client, headers, path: str):
+    response = client.post(
+        "/files/upload", json={"filename": path.rsplit("/", 1)[-1], "filepath": path, "size": 10},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["file_id"]
+
+
+def _wait(client, headers, job_id: str):
+    for _ in range(100):
+        job = client.get(f"/files/jobs/{job_id}", headers=headers).json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"El trabajo {job_id} no terminó")
+
+
+def test_rmdir_missing_directory_returns_404(client, auth_headers):
+    """Un directorio inexistente se rechaza antes de crear el trabajo"""
+    response = client.delete("/files/rmdir", params={"dirpath": "/missing"}, headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_rmdir_of_another_users_directory_returns_404(client, auth_headers, make_user):
+    """El directorio se resuelve en el espacio del usuario que pide el borrado"""
+    _upload(client, auth_headers, "/private/a")
+    response = client.delete("/files/rmdir", params={"dirpath": "/private"}, headers=make_user())
+    assert response.status_code == 404
+    listing = client.get("/files/list", params={"directory": "/private"}, headers=auth_headers).json()
+    assert [entry["path"] for entry in listing["entries"]] == ["/private/a"]
+
+
+def test_rmdir_removes_subtree(client, auth_headers):
+    """El trabajo elimina los archivos y directorios del subárbol"""
+    for path in ("/tree/a", "/tree/sub/b", "/tree/sub/deeper/c", "/kept/d"):
+        _upload(client, auth_headers, path)
+
+    response = client.delete("/files/rmdir", params={"dirpath": "/tree"}, headers=auth_headers)
+    assert response.status_code == 202
+    job = _wait(client, auth_headers, response.json()["job_id"])
+    assert job["status"] == "completed"
+    assert job["processed"] == 3
+
+    listing = client.get("/files/list", headers=auth_headers).json()
+    assert [entry["path"] for entry in listing["entries"]] == ["/kept"]
@@ -0,0 +1,62 @@
+import json
+
+from app.api import files
+
+DIRECTORIES = ["d1", "d2", "d3"]
+FILES = ["a.txt", "b.txt", "c.txt", "e.txt"]
+
+
+def _populate(client, headers):
+    for name in DIRECTORIES:
+        assert client.post("/files/mkdir", params={"dirpath": f"/docs/{name}"}, headers=headers).status_code == 200
+    for name in FILES:
+        response = client.post(
+            "/files/upload", json={"filename": name, "filepath": f"/docs/{name}", "size": 10},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+
+
+def test_cursor_pagination_walks_directories_then_files(client, auth_headers):
+    """Las páginas siguen el cursor: primero los subdirectorios y luego los archivos, por nombre"""
+    _populate(client, auth_headers)
+
+    names, cursor, pages = [], None, 0
+    while True:
+        params = {"directory": "/docs", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        listing = client.get("/files/list", params=params, headers=auth_headers).json()
+        names += [(entry["type"], entry["name"]) for entry in listing["entries"]]
+        pages += 1
+        cursor = listing["next_cursor"]
+        if not cursor:
+            break
+
+    assert names == [("directory", name) for name in DIRECTORIES] + [("file", name) for name in FILES]
+    # 7 entradas de a 2: la cuarta página es parcial y no trae cursor
+    assert pages == 4
+
+
+def test_invalid_cursor_returns_400(client, auth_headers):
+    response = client.get("/files/list", params={"cursor": "not-a-cursor"}, headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_missing_directory_returns_404(client, auth_headers):
+    response = client.get("/files/list", params={"directory": "/missing"}, headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_ndjson_stream_lists_every_entry(client, auth_headers, monkeypatch):
+    """El listado NDJSON recorre todas las páginas internas, una entrada por línea"""
+    monkeypatch.setattr(files, "LIST_MAX_PAGE_SIZE", 2)
+    _populate(client, auth_headers)
+
+    response = client.get("/files/list/stream", params={"directory": "/docs"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    entries = [json.loads(line) for line in response.text.splitlines()]
+    assert [entry["path"] for entry in entries] == (
+        [f"/docs/{name}" for name in DIRECTORIES] + [f"/docs/{name}" for name in FILES]
+    )
@@ -0,0 +1,58 @@
+from app.services.namespace_service import NamespaceService
+
+
+def _upload(client, headers, path: str):
+    return client.post(
+        "/files/upload", json={"filename": path.rsplit("/", 1)[-1], "filepath": path, "size": 10},
+        headers=headers,
+    )
+
+
+def _paths(client, headers, directory: str):
+    listing = client.get("/files/list", params={"directory": directory}, headers=headers).json()
+    return [entry["path"] for entry in listing["entries"]]
+
+
+def test_upload_over_existing_path_returns_409(client, auth_headers):
+    assert _upload(client, auth_headers, "/dup/a").status_code == 200
+    assert _upload(client, auth_headers, "/dup/a").status_code == 409
+
+
+def test_mkdir_over_file_returns_409(client, auth_headers):
+    assert _upload(client, auth_headers, "/m/a").status_code == 200
+    response = client.post("/files/mkdir", params={"dirpath": "/m/a/b"}, headers=auth_headers)
+    assert response.status_code == 409
+
+
+def test_rename_onto_existing_path_returns_409(client, auth_headers):
+    _upload(client, auth_headers, "/r/a")
+    _upload(client, auth_headers, "/r/b")
+    response = client.post("/files/rename", params={"src": "/r/a", "dst": "/r/b"}, headers=auth_headers)
+    assert response.status_code == 409
+
+
+def test_rename_racing_onto_existing_name_returns_409(client, auth_headers, monkeypatch):
+    """Si el destino se ocupa entre la verificación y el commit, la restricción única responde 409"""
+    _upload(client, auth_headers, "/race/a")
+    _upload(client, auth_headers, "/race/b")
+
+    get_child_file = NamespaceService.get_child_file
+
+    async def stale_check(db, parent_id, name):
+        # La verificación del destino no ve el archivo que ya existe
+        if name == "b":
+            return None
+        return await get_child_file(db, parent_id, name)
+
+    monkeypatch.setattr(NamespaceService, "get_child_file", staticmethod(stale_check))
+    response = client.post("/files/rename", params={"src": "/race/a", "dst": "/race/b"}, headers=auth_headers)
+    monkeypatch.undo()
+
+    assert response.status_code == 409
+    assert _paths(client, auth_headers, "/race") == ["/race/a", "/race/b"]
+
+
+def test_rename_missing_source_returns_404(client, auth_headers):
+    client.post("/files/mkdir", params={"dirpath": "/n"}, headers=auth_headers)
+    response = client.post("/files/rename", params={"src": "/n/x", "dst": "/n/y"}, headers=auth_headers)
+    assert response.status_code == 404
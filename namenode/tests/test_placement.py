@@ -0,0 +1,89 @@
+import asyncio
+
+from app.services.file_service import FileService
+from app.services.memory_namespace import MemoryNamespace
+
+NODES = ["http://datanode1:8000", "http://datanode2:8000", "http://datanode3:8000"]
+
+
+def test_expand_placement_round_robin_with_short_last_block(monkeypatch):
+    monkeypatch.setattr(FileService, "BLOCK_SIZE", 100)
+    plan = FileService.plan_placement(450, NODES)
+
+    blocks = list(FileService.expand_placement(plan))
+    assert [block["block_index"] for block in blocks] == [0, 1, 2, 3, 4]
+    assert [block["datanode_url"] for block in blocks] == NODES + NODES[:2]
+    assert [block["block_size"] for block in blocks] == [100, 100, 100, 100, 50]
+
+
+def test_expand_placement_honours_start_and_stride():
+    plan = {
+        "datanodes": NODES, "start": 2, "stride": 2, "num_blocks": 4,
+        "block_size": 10, "last_block_size": 10,
+    }
+    assert [block["datanode_url"] for block in FileService.expand_placement(plan)] == [
+        NODES[2], NODES[1], NODES[0], NODES[2],
+    ]
+
+
+def test_empty_file_has_no_blocks():
+    assert list(FileService.expand_placement(FileService.plan_placement(0, NODES))) == []
+
+
+def test_register_blocks_registers_batch_in_order(client, auth_headers):
+    size = 3 * FileService.BLOCK_SIZE
+    response = client.post(
+        "/files/upload",
+        json={"filename": "batch", "filepath": "/batch", "size": size, "commit": True},
+        headers=auth_headers,
+    )
+    upload = response.json()
+    batch = [
+        {
+            "block_index": block["block_index"],
+            "block_size": block["block_size"],
+            "datanode_url": block["datanode_url"],
+            "checksum": f"{block['block_index']:064x}",
+        }
+        for block in upload["block_distribution"]
+    ]
+
+    response = client.post(f"/files/register-blocks/{upload['file_id']}", json={"blocks": batch}, headers=auth_headers)
+    assert response.status_code == 200
+    block_ids = response.json()["block_ids"]
+    assert len(block_ids) == 3
+    assert client.post(f"/files/{upload['file_id']}/commit", headers=auth_headers).status_code == 200
+
+    info = client.get(f"/files/{upload['file_id']}", headers=auth_headers).json()
+    assert [block["block_id"] for block in info["blocks"]] == block_ids
+    assert [block["checksum"] for block in info["blocks"]] == [item["checksum"] for item in batch]
+
+
+def test_register_blocks_rejects_empty_batch_and_unknown_file(client, auth_headers):
+    assert client.post("/files/register-blocks/999999", json={"blocks": []}, headers=auth_headers).status_code == 422
+    block = {"block_index": 0, "block_size": 1, "datanode_url": NODES[0], "checksum": "0" * 64}
+    response = client.post("/files/register-blocks/999999", json={"blocks": [block]}, headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_memory_namespace_batch_survives_restart(tmp_path):
+    """Los bloques de un lote se registran en el edit log y se recuperan al reiniciar"""
+    async def scenario():
+        namespace = MemoryNamespace(str(tmp_path), enabled=True)
+        namespace.edit_log.open(0)
+        directory = await namespace.make_directories(["d"], owner_id=1)
+        file = await namespace.create_file("f", 20, 10, 2, owner_id=1, parent_id=directory.id, name="f")
+        records = [
+            {"block_id": f"b{i}", "block_index": i, "size": 10, "datanode_url": NODES[i], "checksum": "0" * 64}
+            for i in range(2)
+        ]
+        blocks = await namespace.add_blocks(file.id, records)
+        assert [block.block_id for block in blocks] == ["b0", "b1"]
+        await namespace.edit_log.close()
+
+        namespace = MemoryNamespace(str(tmp_path), enabled=True)
+        await namespace.load(None)
+        await namespace.edit_log.close()
+        return [(block.block_id, block.datanode_url) for block in namespace.files[file.id].blocks]
+
+    assert asyncio.run(scenario()) == [("b0", NODES[0]), ("b1", NODES[1])]
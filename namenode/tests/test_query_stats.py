@@ -0,0 +1,23 @@
+from app import query_stats
+
+
+def test_slow_query_log_omits_parameter_values(monkeypatch, capsys):
+    """El log de consultas lentas informa cantidad y tipos, nunca los valores"""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine("sqlite://")
+    query_stats.instrument_engine(engine)
+    monkeypatch.setattr(query_stats, "SLOW_QUERY_THRESHOLD", 0.0)
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT :secret, :count"), {"secret": "hunter2", "count": 3})
+
+    output = capsys.readouterr().out
+    assert "Consulta lenta" in output
+    assert "2 parámetros (str, int)" in output
+    assert "hunter2" not in output
+
+
+def test_executemany_reports_row_count():
+    description = query_stats._describe_parameters([("a", 1), ("b", 2)], executemany=True)
+    assert description == "2 filas, 2 parámetros (str, int)"